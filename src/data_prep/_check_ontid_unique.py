@@ -10,7 +10,8 @@
 
 # [0] Setup -------------------------------------------------------------------------------------------
 import pandas as pd
-import os
+
+import manifest # catalog of saved ontology files
 
 output_dir = 'dataout/' # path within Atom notebook
 
@@ -21,17 +22,8 @@ ont_ids = { 'GENE':['go'],
     }
 
 # [1] Read in files -------------------------------------------------------------------------------------------
-files = sorted(os.listdir(output_dir))
-
-# little helper to see if file has already been generated.
-def check_exists(files, ont_id, file_type):
-    file_name = [file_name for idx, file_name in enumerate(files) if ont_id + '_' + file_type in file_name]
-    if(len(file_name) == 1):
-        return file_name[0]
-    elif (len(file_name) > 1):
-        return file_name[-1]
-    else:
-        return False
+# register any files saved before the manifest existed
+manifest.backfill(output_dir)
 
 ont_dicts = pd.DataFrame()
 for ont_type, ont_ids in ont_ids.items():
@@ -40,11 +32,11 @@ for ont_type, ont_ids in ont_ids.items():
         print('\n*' + ont_id + '*')
 
         # -- terms --
-        term_file = check_exists(files, ont_id, 'terms')
-        if(term_file):
+        term_entry = manifest.lookup(output_dir, ont_id, 'terms')
+        if(term_entry is not None):
             # file already exists; read it in
             print('reading in term file')
-            ont_dict = pd.read_csv(output_dir + term_file, sep = '\t')
+            ont_dict = pd.read_csv(output_dir + term_entry['file'], sep = '\t')
             ont_dict['ont_id'] = ont_id
             ont_dict['node_type'] = ont_type
             ont_dicts = pd.concat([ont_dict, ont_dicts], ignore_index=True)
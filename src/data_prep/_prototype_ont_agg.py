@@ -2,7 +2,7 @@
 # @summary:     test out visualizations and aggregations for real prototype NGLY1 pathways
 # @description:
 # @sources:
-# @depends:     ont_dict.py, query_ngly1.py
+# @depends:     pipeline.py (cached `paths` + `metapaths` stages)
 # @author:      Laura Hughes
 # @email:       lhughes@scripps.edu
 # @license:     MIT
@@ -11,14 +11,17 @@
 # [0: setup]  ----------------------------------------------------------------------------------------------------
 import pandas as pd
 import random
-import src.data_prep.query_ngly1 as ngly1
+import src.data_prep.pipeline as pipeline
+
+stage_dir = 'dataout/stages/' # path within Atom notebook
 
 
 # [1: Pull out all pathways]  -------------------------------------------------------------------------------
-all_paths = ngly1.data
-all_metapaths = ngly1.metapaths
+# run `python pipeline.py paths metapaths` (w/i data_prep/) first; this just reads the cached stages back in
+all_paths = pipeline.load_stage('paths', stage_dir)['data']
+all_metapaths = pipeline.load_stage('metapaths', stage_dir)
 
-queries = ngly1.queries.keys()
+queries = list(all_paths.keys())
 query = random.sample(queries, 1)[0] # randomly pick a single one
 
 
@@ -8,8 +8,9 @@
 # [0] Setup -----------------------------------------------------------------------------------------------------------------------------
 import pandas as pd
 import warnings
-import requests
 import progressbar
+import http_cache # on-disk cache of API responses
+import id_norm # gene id prefixes --> mygene.info queries
 # import src.data_prep.clean_neo4j as neo4j
 import clean_neo4j as neo4j
 
@@ -32,16 +33,20 @@ output_dir = 'dataout/'
 #                       Note that this does *not* catch genes without annotation info, since that's biologically reasonable.
 
 def get_geneterms(gene_ids, transl_url = 'http://mygene.info/v3/query?q=', transl_params = {'entrezonly':'true'}):
-    missing = pd.DataFrame()
     annots = pd.DataFrame()
 
+    # work out how to translate every id up front (`id_norm.gene_queries`); the unknown ones are reported together, w/o a query
+    routes = id_norm.gene_queries(gene_ids['node_id'], transl_url = transl_url, transl_params = transl_params)
+    unknown = routes.route.isnull()
+    id_norm.warn_rows(routes.gene_id, unknown, 'have an unknown gene id syntax; not translated')
+    missing = [missing_frame([(gene_id, 'unknown syntax') for gene_id in routes.gene_id[unknown]])]
+
     with progressbar.ProgressBar(max_value = max(gene_ids.index)) as bar:
-        for idx, gene in gene_ids.iterrows():
+        for idx, route in routes[~unknown].iterrows():
 
-            gene_id = gene['node_id']
-            trans_result = query_translator(gene_id, transl_url = 'http://mygene.info/v3/query?q=', transl_params = {'entrezonly':'true'})
+            trans_result = translate(route)
             if(len(trans_result['missing']) > 0):
-                missing = pd.concat([missing, trans_result['missing']], ignore_index=True)
+                missing.append(trans_result['missing'])
             else:
                 gene_dict = trans_result['entrez_dict']
                 annot = query_geneterms(gene_dict)
@@ -50,14 +55,23 @@ def get_geneterms(gene_ids, transl_url = 'http://mygene.info/v3/query?q=', trans
                 bar.update(idx)
 
     # Sort the missing values
+    missing = pd.concat(missing, ignore_index=True)
     missing = missing.sort_values(['reason', 'id_type', 'gene_id'])
 
     return({'annots': annots, 'missing': missing})
 
 
+# <<< missing_frame(missing) >>>
+# list of (gene_id, reason) --> DataFrame w/ columns: gene_id, reason, id_type (1st 3 letters of the gene id)
+def missing_frame(missing):
+    missing = pd.DataFrame(missing, columns = ['gene_id', 'reason'])
+    missing['id_type'] = missing.gene_id.str[0:3] # pulls out first three letters of the gene_id
+    return missing
+
 
 # <<< query_translator(gene_id, transl_url = 'http://mygene.info/v3/query?q=', transl_params = {'entrezonly':'true'}, verbose = False) >>>
 # @description: single call to mygene.info to translate gene_id into an Entrez Gene ID
+#               The query for each type of id comes from the lookup table `id_norm.gene_routes`; for many ids at once, see `get_geneterms`.
 # @example:     query_translator('RGD:628763')
 # @input:       *gene_id*: string containing a single gene id.
 #               *transl_url*: base of the mygene.info url query
@@ -69,49 +83,28 @@ def get_geneterms(gene_ids, transl_url = 'http://mygene.info/v3/query?q=', trans
 #                       columns: gene_id (input), reason (why query failed), id_type (1st 3 letters of inputted gene id)
 #                       Note that this does *not* catch genes without annotation info, since that's biologically reasonable.
 def query_translator(gene_id, transl_url = 'http://mygene.info/v3/query?q=', transl_params = {'entrezonly':'true'}, verbose = False):
+    route = id_norm.gene_queries(pd.Series([gene_id]), transl_url = transl_url, transl_params = transl_params).iloc[0]
+    return translate(route, verbose)
+
+# <<< translate(route, verbose = False) >>>
+# translates a single gene id, given its row of `id_norm.gene_queries`; same output as `query_translator`
+def translate(route, verbose = False):
     missing = []
     entrez_dict = {}
+    gene_id = route['gene_id']
 
-    curr_params = transl_params.copy()
-
-    if(gene_id.find('NCBIGene') >= 0):
-        # NCBIGene already set up to do the annotation query, just needs to remove excess in string
-        entrez_dict.update({gene_id: gene_id.replace('NCBIGene:', '')})
-        return({'missing': missing, 'entrez_dict': entrez_dict})
-    elif ((gene_id.find('UniProt') >= 0 )| (gene_id.find('InterPro') >= 0) | (gene_id.find('RGD') >= 0)):
-        # formatting is fine, just needs to be combined
-        gene_query = transl_url + gene_id
-    elif (gene_id.find('FlyBase') >= 0):
-        # formatting is fine, just needs to be combined
-        gene_query = transl_url + gene_id
-        # update species id
-        curr_params.update({'species': 'fruitfly'})
-    elif (gene_id.find('Xenbase') >= 0):
-        # formatting is fine, just needs to be combined
-        gene_query = transl_url + gene_id
-        # update species id
-        curr_params.update({'species': 'frog'})
-    elif (gene_id.find('ZFIN') >= 0):
-        # formatting is fine, just needs to be combined
-        gene_query = transl_url + gene_id
-        # update species id
-        curr_params.update({'species': 'zebrafish'})
-    elif (gene_id.find('WormBase') >= 0):
-        # formatting is fine, just needs to be combined
-        gene_query = transl_url + gene_id
-        # update species id
-        # params.update({'species': 6239}) C. elegans
-        # params.update({'species': 31234}) C. remanei
-    elif (gene_id.find('MGI') >= 0):
-        gene_query = transl_url + 'mgi:' + gene_id.replace('MGI:', 'MGI\\\\:')
-    else:
+    if(pd.isnull(route['route'])):
         if(verbose):
             print('unknown gene ' + gene_id)
         missing.append((gene_id, 'unknown syntax'))
-        return({'missing': missing, 'entrez_dict': entrez_dict})
+        return({'missing': missing_frame(missing), 'entrez_dict': entrez_dict})
+    elif(route['route'] == 'NCBIGene'):
+        # NCBIGene already set up to do the annotation query
+        entrez_dict.update({gene_id: route['entrez_id']})
+        return({'missing': missing_frame(missing), 'entrez_dict': entrez_dict})
 
     # run the request to translate the gene id to an Entrez Gene id
-    transl = requests.get(gene_query, params = curr_params).json()
+    transl = http_cache.get_json(route['query'], params = route['params'])
 
     try:
         (transl['total'])
@@ -127,7 +120,6 @@ def query_translator(gene_id, transl_url = 'http://mygene.info/v3/query?q=', tra
         elif(transl['total'] == 0):
             if(verbose):
                 print('request ok but could not find ' + gene_id)
-            # print(requests.get(gene_query, params = curr_params).url)
             missing.append((gene_id, 'not found'))
         else:
             try:
@@ -136,10 +128,7 @@ def query_translator(gene_id, transl_url = 'http://mygene.info/v3/query?q=', tra
                 missing.append((gene_id, '??? no entrez?'))
 
     # convert missing to DataFrame
-    missing = pd.DataFrame(missing, columns = ['gene_id', 'reason'])
-    missing['id_type'] = missing.gene_id.apply(lambda x: x[0:3]) # pulls out first three letters of the gene_id
-
-    return({'missing': missing, 'entrez_dict': entrez_dict})
+    return({'missing': missing_frame(missing), 'entrez_dict': entrez_dict})
 
 
 # <<< query_geneterms(gene_dict, gene_url = 'https://mygene.info/v3/gene/', gene_params = {'fields':'symbol,name,go'}) >>>
@@ -155,7 +144,7 @@ def query_geneterms(gene_dict, gene_url = 'https://mygene.info/v3/gene/', gene_p
     GOs = pd.DataFrame()
 
     for gene_key, entrez_id in gene_dict.items():
-        result = requests.get(gene_url + str(entrez_id), params = gene_params).json()
+        result = http_cache.get_json(gene_url + str(entrez_id), params = gene_params)
 
         # If GO terms exist, pull them out
         try:
@@ -178,23 +167,33 @@ def query_geneterms(gene_dict, gene_url = 'https://mygene.info/v3/gene/', gene_p
 
         return(GOs)
 
-# [2] Find the relevant gene IDs -----------------------------------------------
-# Pull unique nodes from Nuria's graph
-nodes = neo4j.get_nodes()
-
-gene_ids = nodes[nodes.node_type == 'GENE']
+# [2] Put it together -----------------------------------------------
+# <<< annotate_genes(nodes, output_dir = output_dir) >>>
+# @description: pulls GO terms for every GENE node (output of `clean_neo4j.get_nodes`) and saves the ids that couldn't be converted to Entrez Gene IDs
+# @output:      output of `get_geneterms`: dict containing *annots* and *missing*
+# @example:     go = annotate_genes(neo4j.get_nodes())
+def annotate_genes(nodes, output_dir = output_dir):
+    # Find the relevant gene IDs
+    gene_ids = nodes[nodes.node_type == 'GENE']
 
+    # Run the query
+    go = get_geneterms(gene_ids)
 
-# [3] Run the query ------------------------------------------------------------
-go = get_geneterms(gene_ids)
+    # Check for missing terms
+    missing = go['missing']
+    if (len(missing)):
+        print(str(len(missing)) + " ids not converted to Entrez Gene IDs")
+        print(missing.groupby('reason').id_type.value_counts())
+    missing.to_csv(output_dir + str(pd.Timestamp.today().strftime('%F')) + "_NGLY1noentrezid.txt")
 
-# [4] Check for missing terms --------------------------------------------------
-missing = go['missing']
-if (len(missing)):
-    print(str(len(missing)) + " ids not converted to Entrez Gene IDs")
-    print(missing.groupby('reason').id_type.value_counts())
-missing.to_csv(output_dir + str(pd.Timestamp.today().strftime('%F')) + "_NGLY1noentrezid.txt")
+    return go
 
 
+# [3] Run ------------------------------------------------------------
+# Only when called as a script; importing this file doesn't touch the network. See `pipeline.py` to run everything.
+if __name__ == '__main__':
+    # Pull unique nodes from Nuria's graph
+    nodes = neo4j.get_nodes()
+    go = annotate_genes(nodes)
 
-# [5] merge to ontology term names and classify into hierarchial levels (not implemented for now) ------------------------------------------------
+# [4] merge to ontology term names and classify into hierarchial levels: see `ont_dict.merge_nodes`
@@ -17,9 +17,18 @@
 
 
 # setup
+import numpy as np
 import pandas as pd
 import json
 import os
+import hashlib
+import time
+import atexit
+import queue
+import threading
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+import path_cache # on-disk cache of parsed path queries
 from neo4j.v1 import GraphDatabase, basic_auth
 
 dataout_dir = 'src/data/'
@@ -56,31 +65,119 @@ dataout_dir = 'src/data/'
 #   ... each with various params/structures, which are all nested objects.
 
 
-# <<< query_neo4j(query, url = '52.87.232.110', port = '7688', username = "neo4j", pw = "sulabngly1testing") >>>
+# Shared drivers ---------------------------------------------------------------------------------
+# Opening a driver means a new Bolt handshake (+ auth) w/ the server; instead, keep one driver (w/ its own pool of connections) per endpoint,
+# and reuse it for every query to that endpoint. Closed automatically on exit.
+default_fetch_size = 1000 # records pulled from the server at a time, for drivers that support it
+
+# <<< DriverPool() >>>
+# @name:        DriverPool
+# @title:       one neo4j driver per (uri, username, password), created on first use and reused after that
+# @description: drivers are thread-safe, so the same one can serve queries from several threads; each query still gets its own session.
+#               The password is part of the key (as a hash), so a call w/ a different/corrected password gets a driver that logs in w/ it,
+#               rather than one opened w/ the old credentials.
+#               Keeps counts per endpoint (uri, username) of the drivers opened, queries run, queries that reused an open driver, and records streamed.
+# @example:     pool = DriverPool()
+#               driver = pool.get('bolt://52.87.232.110:7688', 'neo4j', pw)
+#               pool.stats()
+class DriverPool:
+    def __init__(self):
+        self.drivers = {}
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def get(self, uri, username, pw):
+        key = (uri, username, hashlib.sha256(str(pw).encode('utf-8')).hexdigest())
+        endpoint = (uri, username)
+        with self.lock:
+            counts = self.counts.setdefault(endpoint, {'drivers_opened': 0, 'queries': 0, 'reused': 0, 'records': 0})
+            if(key not in self.drivers):
+                self.drivers[key] = GraphDatabase.driver(uri = uri, auth = (username, pw))
+                counts['drivers_opened'] += 1
+            else:
+                counts['reused'] += 1
+            counts['queries'] += 1
+            return self.drivers[key]
+
+    def add_records(self, uri, username, n_records):
+        with self.lock:
+            self.counts[(uri, username)]['records'] += n_records
+
+    # <<< stats() >>>
+    # dataframe of the counts, one row per endpoint
+    def stats(self):
+        with self.lock:
+            open_endpoints = set(key[:2] for key in self.drivers)
+            rows = [dict(uri = uri, username = username, open = (uri, username) in open_endpoints, **counts) for (uri, username), counts in self.counts.items()]
+        return pd.DataFrame(rows, columns = ['uri', 'username', 'open', 'drivers_opened', 'queries', 'reused', 'records'])
+
+    def close(self):
+        with self.lock:
+            for key, driver in self.drivers.items():
+                driver.close()
+            self.drivers = {}
+
+_pool = DriverPool()
+atexit.register(_pool.close)
+
+def bolt_uri(url, port):
+    return "bolt://" + url + ":" + str(port)
+
+# <<< get_driver(url = '52.87.232.110', port = '7688', username = "neo4j", pw = "sulabngly1testing") >>>
+# shared driver for an endpoint
+def get_driver(url = '52.87.232.110', port = '7688', username = "neo4j", pw = "sulabngly1testing"):
+    return _pool.get(bolt_uri(url, port), username, pw)
+
+# <<< pool_stats() >>>
+# connection reuse for every endpoint queried so far: drivers opened vs. queries run
+def pool_stats():
+    return _pool.stats()
+
+# <<< close_drivers() >>>
+# closes every shared driver (they're reopened on the next query)
+def close_drivers():
+    _pool.close()
+
+def _session(driver, fetch_size):
+    # fetch_size is only a session option in newer drivers; older ones stream the whole result through as it's read
+    try:
+        return driver.session(fetch_size = fetch_size)
+    except TypeError:
+        return driver.session()
+
+
+# Queries ---------------------------------------------------------------------------------
+# <<< query_neo4j(query, url = '52.87.232.110', port = '7688', username = "neo4j", pw = "sulabngly1testing", fetch_size = default_fetch_size, params = None) >>>
 # @name:        query_neo4j
 # @summary:     function to access the neo4j api to query network and return results
-# @description: does not provide parsed results; merely provides enumerator to go through results (which will be in a nested json format)
-#               also doesn't actually execute the query untill needed; happens lazily, so until the BoltResult object is used, it's just sitting there.
+# @description: does not provide parsed results; merely provides a generator to go through results (which will be in a nested json format)
+#               Records are streamed one at a time from w/i the session, which stays open until the generator is used up (or closed).
+#               Nothing is sent to the server until the first record is asked for.
+#               Uses the shared driver for the endpoint (see `DriverPool`), so repeated queries don't reconnect.
 # @inputs:      *query* string (Cypher query arguments)
 #               *url* to local or AWS instance of network
 #               *port*: location of port to access data; must also be opened on AWS
 #               *username*/*pw*: access rights to the network
-# @output:      neo4j result enumerator
+#               *fetch_size*: number of records pulled from the server at a time
+#               *params*: dict of query parameters ($name in the query)
+# @output:      generator of neo4j records
 # @example:     result = query_neo4j("MATCH (source { id: 'NCBIGene:55768', preflabel: 'NGLY1'}), (target { id: 'NCBIGene:358', preflabel: 'AQP1'}), path=(source)-[*..3]-(target) WITH source, target, path, [r IN relationships(path) | type(r)] AS types RETURN path")
-#               result.peek()
-def query_neo4j(query, url = '52.87.232.110', port = '7688', username = "neo4j", pw = "sulabngly1testing"):
-    # initialize neo4j
+#               next(result)
+def query_neo4j(query, url = '52.87.232.110', port = '7688', username = "neo4j", pw = "sulabngly1testing", fetch_size = default_fetch_size, params = None):
     # requires bolt connection to the URI
     # port must be 7687: first instance of NGLY1 graph
     # or 7688: second instance of NGLY1 graph (and ports must be open in AWS)
-    driver = GraphDatabase.driver(uri = "bolt://" + url + ":" + port, auth = (username, pw))
+    driver = get_driver(url, port, username, pw)
 
     # ask the driver object for a new session & run query
-    # returns an enumerator
-    with driver.session() as session:
-        result = session.run(query)
-
-    return result
+    n_records = 0
+    try:
+        with _session(driver, fetch_size) as session:
+            for record in session.run(query, params or {}):
+                n_records += 1
+                yield record
+    finally:
+        _pool.add_records(bolt_uri(url, port), username, n_records)
 
 # <<< get_paths(query, url = '52.87.232.110', port = '7688', username = "neo4j", pw = "sulabngly1testing") >>>
 # @name:        get_paths
@@ -89,136 +186,399 @@ def query_neo4j(query, url = '52.87.232.110', port = '7688', username = "neo4j",
 #               *url* to local or AWS instance of network
 #               *port*: location of port to access data; must also be opened on AWS
 #               *username*/*pw*: access rights to the network
+#               *fetch_size*: number of records pulled from the server at a time
+#               *use_cache*: reuse the parsed result of the same query against the same graph, if it's been run before (see `path_cache.py`)
 # @output:      list containing flat dataframe of nodes and edges
 # @examples:    get_paths("MATCH path=(source:GENE)-[:`RO:HOM0000020`]-(:GENE)--(ds:DISO)--(:GENE)-[:`RO:HOM0000020`]-(g1:GENE)--(pw:PHYS)--(target:GENE) WHERE source.id = 'NCBIGene:55768' AND target.id = 'NCBIGene:64772' AND ALL(x IN nodes(path) WHERE single(y IN nodes(path) WHERE y = x)) WITH g1, ds, pw, path, size( (source)-[:`RO:HOM0000020`]-() ) AS source_ortho, size( (g1)-[:`RO:HOM0000020`]-() ) AS other_ortho, max(size( (pw)-[]-() )) AS pwDegree, max(size( (ds)-[]-() )) AS dsDegree, [n IN nodes(path) WHERE n.preflabel IN ['cytoplasm','cytosol','nucleus','metabolism','membrane','protein binding','visible','viable','phenotype']] AS nodes_marked, [r IN relationships(path) WHERE r.property_label IN ['interacts with','in paralogy relationship with','in orthology relationship with','colocalizes with']] AS edges_marked WHERE size(nodes_marked) = 0 AND size(edges_marked) = 0 AND pwDegree < 51 AND dsDegree < 21 RETURN path")
-def get_paths(query, url = '52.87.232.110', port = '7688', username = "neo4j", pw = "sulabngly1testing"):
+def get_paths(query, url = '52.87.232.110', port = '7688', username = "neo4j", pw = "sulabngly1testing", fetch_size = default_fetch_size, use_cache = True):
+    return timed_paths(query, url = url, port = port, username = username, pw = pw, fetch_size = fetch_size, use_cache = use_cache)['data']
+
+# <<< graph_fingerprint(url = '52.87.232.110', port = '7688', username = "neo4j", pw = "sulabngly1testing", max_age = 0) >>>
+# @name:        graph_fingerprint
+# @summary:     short string that changes whenever the graph does: the endpoint + its node and relationship counts
+# @description: both counts come straight from neo4j's count store, so they're cheap enough to ask for every time (*max_age* = 0, the default),
+#               so a cached path query is never served once the graph has changed. A *max_age* > 0 reuses the answer for that many seconds.
+# @example:     graph_fingerprint() --> 'bolt://52.87.232.110:7688|nodes=9358|edges=234854'
+_fingerprints = {}
+def graph_fingerprint(url = '52.87.232.110', port = '7688', username = "neo4j", pw = "sulabngly1testing", max_age = 0):
+    uri = bolt_uri(url, port)
+    if((uri in _fingerprints) and (time.time() - _fingerprints[uri][1] < max_age)):
+        return _fingerprints[uri][0]
+
+    n_nodes = next(query_neo4j('MATCH (n) RETURN count(n) AS n', url = url, port = port, username = username, pw = pw))['n']
+    n_edges = next(query_neo4j('MATCH ()-[r]->() RETURN count(r) AS n', url = url, port = port, username = username, pw = pw))['n']
+    fingerprint = uri + '|nodes=' + str(n_nodes) + '|edges=' + str(n_edges)
+    _fingerprints[uri] = (fingerprint, time.time())
+    return fingerprint
+
+# <<< timed_paths(query, url = '52.87.232.110', port = '7688', username = "neo4j", pw = "sulabngly1testing", fetch_size = default_fetch_size, use_cache = True) >>>
+# same as `get_paths`, but also splits out how long was spent waiting on the server (*fetch*) vs. parsing the records (*parse*), in seconds
+# *use_cache*: look for (and store) the parsed result in the shared `path_cache`, keyed by the query + `graph_fingerprint`
+# @output:      dict containing *data* (output of `get_paths`), *n_paths*, *fetch*, *parse*, *cached* (True if read from the cache)
+def timed_paths(query, url = '52.87.232.110', port = '7688', username = "neo4j", pw = "sulabngly1testing", fetch_size = default_fetch_size, use_cache = True):
+    cache = path_cache.get_cache() if use_cache else None
+    if(cache is not None):
+        t0 = time.time()
+        fingerprint = graph_fingerprint(url, port, username, pw)
+        data = cache.get(query, fingerprint)
+        if(data is not None):
+            n_paths = data['nodes'].path_num.nunique() if len(data['nodes']) > 0 else 0
+            return {'data': data, 'n_paths': n_paths, 'fetch': 0.0, 'parse': time.time() - t0, 'cached': True}
+
     # run query
-    result = query_neo4j(query, url = '52.87.232.110', port = '7688', username = "neo4j", pw = "sulabngly1testing")
-
-    # parse query results
-    # output = list()
-    nodes = []
-    edges = []
-    path_num = 0
-
-    for record in result:
-        path_dct = parsePath(record, path_num)
-        if (len(nodes) == 0): # first iteration of loop
-            nodes = path_dct['nodes']
-            edges = path_dct['edges']
-        else:
-            nodes = nodes.append(path_dct['nodes'], ignore_index=True)
-            edges = edges.append(path_dct['edges'], ignore_index=True)
-        path_num += 1
-
-    return {'nodes': nodes, 'edges': edges}
-        # if (path_num % 10 == 0):
-            # print("Processed " + str(path_num) + "\n")
-
-# <<< get_nodes(query = 'MATCH (n) RETURN *', url = '52.87.232.110', port = '7688', username = "neo4j", pw = "sulabngly1testing") >>>
+    result = query_neo4j(query, url = url, port = port, username = username, pw = pw, fetch_size = fetch_size)
+
+    # parse query results: each path's fields go straight into column buffers; the dataframes are only built once, at the end
+    columns = PathColumns()
+    fetch = 0
+    parse = 0
+    while True:
+        t0 = time.time()
+        record = next(result, None)
+        t1 = time.time()
+        fetch += t1 - t0
+        if(record is None):
+            break
+        columns.add(record)
+        parse += time.time() - t1
+        # if (columns.n_paths % 10 == 0):
+            # print("Processed " + str(columns.n_paths) + "\n")
+
+    t0 = time.time()
+    data = columns.frames()
+    parse += time.time() - t0
+
+    if(cache is not None):
+        # the query already worked; a cache that can't be written to (disk full, permissions) shouldn't lose its result
+        try:
+            cache.put(query, fingerprint, data, endpoint = bolt_uri(url, port))
+        except Exception as err:
+            warnings.warn('could not cache the paths for this query: ' + repr(err))
+
+    return {'data': data, 'n_paths': columns.n_paths, 'fetch': fetch, 'parse': parse, 'cached': False}
+
+# <<< run_queries(queries, n_workers = 4, metapaths = True, url = '52.87.232.110', port = '7688', username = "neo4j", pw = "sulabngly1testing", fetch_size = default_fetch_size, use_cache = True) >>>
+# @name:        run_queries
+# @summary:     runs a batch of path queries at the same time
+# @description: up to *n_workers* queries run at once, all sharing the endpoint's driver (see `DriverPool`).
+#               Each query's records are parsed as they stream in, and its metapaths counted as soon as it's done (if *metapaths*).
+#               A query that fails is recorded in the timing report, rather than stopping the rest.
+# @inputs:      *queries*: dict of {name: Cypher query}
+#               *n_workers*: max number of queries running at once
+#               *metapaths*: if True, also runs `count_metapaths` on each result
+# @output:      dict containing:
+#               *data*: {name: output of `get_paths`}
+#               *metapaths*: {name: output of `count_metapaths`} (if *metapaths*)
+#               *timing*: dataframe, one row per query: n_paths, fetch, parse, metapath, total (sec.), cached, error
+#               *wall_time*: seconds for the whole batch
+# @examples:    out = run_queries(query_ngly1.queries, n_workers = 6)
+#               out['timing']
+def run_queries(queries, n_workers = 4, metapaths = True, url = '52.87.232.110', port = '7688', username = "neo4j", pw = "sulabngly1testing", fetch_size = default_fetch_size, use_cache = True):
+    def run_one(query):
+        t0 = time.time()
+        result = timed_paths(query, url = url, port = port, username = username, pw = pw, fetch_size = fetch_size, use_cache = use_cache)
+        result['metapath'] = 0.0
+        if(metapaths):
+            t1 = time.time()
+            result['metapaths'] = count_metapaths(result['data'])
+            result['metapath'] = time.time() - t1
+        result['total'] = time.time() - t0
+        return result
+
+    t0 = time.time()
+    out = {'data': {}, 'metapaths': {}}
+    timing = []
+    with ThreadPoolExecutor(max_workers = n_workers) as executor:
+        futures = {name: executor.submit(run_one, query) for name, query in queries.items()}
+        for name, future in futures.items():
+            try:
+                result = future.result()
+            except Exception as err:
+                timing.append({'query': name, 'error': repr(err)})
+                continue
+            out['data'][name] = result['data']
+            if(metapaths):
+                out['metapaths'][name] = result['metapaths']
+            timing.append({'query': name, 'n_paths': result['n_paths'], 'fetch': result['fetch'], 'parse': result['parse'],
+                'metapath': result['metapath'], 'total': result['total'], 'cached': result['cached'], 'error': None})
+
+    out['timing'] = pd.DataFrame(timing, columns = ['query', 'n_paths', 'fetch', 'parse', 'metapath', 'total', 'cached', 'error'])
+    out['wall_time'] = time.time() - t0
+    return out
+
+# <<< get_nodes(query = None, url = '52.87.232.110', port = '7688', username = "neo4j", pw = "sulabngly1testing", ...) >>>
 # main function to access the neo4j api to query network and return results
-# inputs:   query string (Cypher query arguments)
+# inputs:   query string (Cypher query arguments); None (default) exports every node w/ `export_nodes`, a partition at a time
 #           url to local or AWS instance of network
 #           port: location of port to access data; must also be opened on AWS
 #           username/pw: access rights to the network
-# output:   flat dataframe of nodes
-def get_nodes(query = 'MATCH (n) RETURN *', url = '52.87.232.110', port = '7688', username = "neo4j", pw = "sulabngly1testing", verbose = False):
-    # run query
-    result = query_neo4j(query, url = '52.87.232.110', port = '7688', username = "neo4j", pw = "sulabngly1testing")
-
-    # parse query results
-    nodes = parseNode(result, verbose)
-    return nodes
+#           fetch_size: number of records pulled from the server at a time
+#           chunk_size, n_workers, report: passed on to `export_nodes`
+# output:   flat dataframe of nodes, sorted by id
+def get_nodes(query = None, url = '52.87.232.110', port = '7688', username = "neo4j", pw = "sulabngly1testing", verbose = False, fetch_size = default_fetch_size,
+    chunk_size = 10000, n_workers = 4, report = None):
+    if(query is not None):
+        # run query
+        result = query_neo4j(query, url = url, port = port, username = username, pw = pw, fetch_size = fetch_size)
+
+        # parse query results
+        nodes = parseNode(result, verbose)
+        return nodes
+
+    chunks = list(export_nodes(chunk_size = chunk_size, n_workers = n_workers, report = report, url = url, port = port, username = username, pw = pw,
+        verbose = verbose, fetch_size = fetch_size))
+    if(len(chunks) == 0):
+        return NodeColumns().frame()
+    return pd.concat(chunks, ignore_index = True).sort_values('id').reset_index(drop = True)
+
+# <<< node_partitions(n_partitions, url = '52.87.232.110', port = '7688', username = "neo4j", pw = "sulabngly1testing") >>>
+# splits the range of internal node ids into *n_partitions* [lo, hi) ranges of the same width
+# @example:     node_partitions(16) --> [(0, 585), (585, 1170), ...]
+def node_partitions(n_partitions, url = '52.87.232.110', port = '7688', username = "neo4j", pw = "sulabngly1testing"):
+    bounds = next(query_neo4j('MATCH (n) RETURN min(id(n)) AS lo, max(id(n)) AS hi', url = url, port = port, username = username, pw = pw))
+    if(bounds['lo'] is None):
+        return []
+    edges = np.unique(np.linspace(bounds['lo'], bounds['hi'] + 1, n_partitions + 1).astype(np.int64))
+    return list(zip(edges[:-1].tolist(), edges[1:].tolist()))
+
+# <<< NodeColumns() >>>
+# @name:        NodeColumns
+# @title:       column buffers for the nodes of one chunk, like `PathColumns`
+# @description: `add` returns False (and keeps nothing) for malformed nodes: no label, or no *id*/*preflabel* property
+#               (e.g. nodes whose whole import line ended up in *id*; see `NGLY1malformed_nodes.txt`)
+class NodeColumns:
+    fields = ['id', 'node_type', 'node_id', 'node_name', 'description']
+
+    def __init__(self):
+        self.columns = {field: [] for field in self.fields}
+        self.n_nodes = 0
+
+    def add(self, node):
+        # node objects contain: id, labels, properties(preflabel, description, id)
+        props = node.properties
+        if((len(node.labels) == 0) or ('id' not in props) or ('preflabel' not in props)):
+            return False
+        self.columns['id'].append(node.id) # unique id generated by neo4j, used to link to relationships
+        self.columns['node_type'].append(list(node.labels)[0])
+        self.columns['node_id'].append(props['id']) # unique id for node, used to link to ontologies
+        self.columns['node_name'].append(props['preflabel'])
+        self.columns['description'].append(props.get('description'))
+        self.n_nodes += 1
+        return True
+
+    def frame(self):
+        nodes = pd.DataFrame(self.columns, columns = self.fields)
+        nodes['id'] = nodes['id'].astype(np.int64)
+        return nodes
+
+# <<< export_nodes(chunk_size = 10000, n_workers = 4, n_partitions = None, report = None, url = '52.87.232.110', port = '7688', ...) >>>
+# @name:        export_nodes
+# @summary:     every node in the graph, as a generator of dataframes of up to *chunk_size* nodes
+# @description: rather than pulling the whole graph through one result stream, the internal ids are split into *n_partitions* ranges
+#               (`node_partitions`; default 4 per worker), and up to *n_workers* of them are fetched at once, each w/ its own session on the shared driver.
+#               Each range is looked up id by id (`UNWIND range(...)` --> NodeByIdSeek), so a partition only touches its own nodes, not the whole graph.
+#               Each worker parses its records into a `NodeColumns` buffer and hands over a dataframe every *chunk_size* nodes,
+#               through a queue that only holds *n_workers* chunks; when it's full, the workers wait for the chunks to be used.
+#               So at most ~2 x *n_workers* chunks are held at once, however big the graph is. Chunks come out in whatever order they're ready.
+#               Malformed nodes (see `NodeColumns`) are skipped, and written one per line to the *report* file, if given, as each chunk is handed over.
+# @inputs:      *chunk_size*: max nodes per dataframe
+#               *n_workers*: partitions fetched at once
+#               *report*: file name for the malformed nodes (e.g. output_dir + '2018-02-06_NGLY1malformed_nodes.txt'); None to skip
+#               *verbose*: print the id of every malformed node
+# @output:      generator of dataframes w/ columns id (int64), node_type, node_id, node_name, description
+# @examples:    for chunk in export_nodes(chunk_size = 5000):
+#                   ...
+def export_nodes(chunk_size = 10000, n_workers = 4, n_partitions = None, report = None, url = '52.87.232.110', port = '7688', username = "neo4j", pw = "sulabngly1testing",
+    verbose = False, fetch_size = default_fetch_size):
+    if(n_partitions is None):
+        n_partitions = 4 * n_workers
+    partitions = node_partitions(n_partitions, url = url, port = port, username = username, pw = pw)
+
+    chunks = queue.Queue(maxsize = n_workers)
+    stop = threading.Event()
+    report_lock = threading.Lock()
+    report_file = open(report, 'w') if report is not None else None
+    done = object() # marks the end of a partition
+
+    def hand_over(item):
+        # wait for room in the queue, unless the generator's been closed
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout = 0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def write_malformed(malformed):
+        # flushed w/ each chunk, so they're never held for a whole partition
+        if((report_file is not None) and malformed):
+            with report_lock:
+                report_file.write(''.join(line + '\n' for line in malformed))
+
+    def fetch_partition(lo, hi):
+        if(stop.is_set()):
+            return
+        try:
+            result = query_neo4j('UNWIND range($lo, $hi - 1) AS i MATCH (n) WHERE id(n) = i RETURN n', url = url, port = port, username = username, pw = pw,
+                fetch_size = fetch_size, params = {'lo': lo, 'hi': hi})
+            columns = NodeColumns()
+            malformed = []
+            for record in result:
+                if(stop.is_set()):
+                    result.close()
+                    return
+                if(not columns.add(record['n'])):
+                    malformed.append(str(record['n']))
+                    if verbose:
+                        print('ignoring id ' + str(record['n'].id))
+                if((columns.n_nodes >= chunk_size) or (len(malformed) >= chunk_size)):
+                    write_malformed(malformed)
+                    malformed = []
+                if(columns.n_nodes >= chunk_size):
+                    hand_over(columns.frame())
+                    columns = NodeColumns()
+            write_malformed(malformed)
+            if(columns.n_nodes > 0):
+                hand_over(columns.frame())
+            hand_over(done)
+        except Exception as err:
+            hand_over(err)
+
+    executor = ThreadPoolExecutor(max_workers = n_workers)
+    try:
+        for lo, hi in partitions:
+            executor.submit(fetch_partition, lo, hi)
+        remaining = len(partitions)
+        while remaining > 0:
+            item = chunks.get()
+            if(item is done):
+                remaining -= 1
+            elif(isinstance(item, Exception)):
+                raise item
+            else:
+                yield item
+    finally:
+        stop.set()
+        executor.shutdown(wait = True)
+        if(report_file is not None):
+            report_file.close()
 
 
 # <<< parseNode(nodes) >>>
 # Core function to parse neo4j results for an individual node
 # Pulling out the terms needed to interface with ontology annotations
 def parseNode(result, verbose = True):
-    # initialize vars
-    nodes = []
-
     # extract nodes
     # node objects contain: id, labels, properties(preflabel, description, id)
+    columns = NodeColumns()
     for node in result:
-        n = {}
+        # malformed nodes are skipped (rather than adding an empty row)
+        if((not columns.add(node['n'])) and verbose):
+            print('ignoring id ' + str(node['n'].id))
 
-        try:
-            node['n'].properties['preflabel'] # unique id generated by neo4j, used to link to relationships
-        except:
-            if verbose:
-                print('ignoring id ' + str(node['n'].id ))
-        else:
-            n['id'] = node['n'].id # unique id generated by neo4j, used to link to relationships
-            n['node_type'] = list(node['n'].labels)[0]
-            n['node_id'] = node['n'].properties['id'] # unique id for node, used to link to ontologies
-            n['node_name'] = node['n'].properties['preflabel']
-            n['description'] = node['n'].properties['description']
-
-        nodes.append(n)
-
-    nodes = pd.DataFrame(nodes).dropna(how='all')
-    return nodes
+    return columns.frame()
 
 def add_paths(nodes, path_col = 'path_num'):
-    # NOTE: this would maybe be faster using `zip`
-    def collapse_paths(x):
-        x['path_types'] = '-'.join(x.node_type)
-        x['path_names'] = '-'.join(x.node_name)
-        return x
-
-    # compress each list of nodes per path down to a metapath: a single string of node_types per path_num
-    # group by path_num and paste/concatenate together the node_types, separated by a hyphen
-    paths = nodes.groupby(path_col).apply(collapse_paths)
-
+    order = np.argsort(nodes[path_col].to_numpy(), kind = 'stable')
+    path_nums = nodes[path_col].to_numpy()[order]
+
+    paths = nodes.copy()
+    for col, values in [('path_types', nodes.node_type), ('path_names', nodes.node_name)]:
+        joined = np.empty(len(nodes), dtype = object)
+        joined[order] = path_strings(values.to_numpy()[order], path_nums)
+        paths[col] = joined
     return paths
 
+# <<< path_strings(values, path_nums, sep = '-') >>>
+# @name:        path_strings
+# @title:       joins *values* into one string per path, for every row, in a single pass
+# @description: rows of each path have to be contiguous and in node order (as they come out of `PathColumns`).
+#               Appends *sep* to every value but the last in each path, then concatenates each path's block at once w/ `np.add.reduceat`.
+# @output:      array of the joined strings, one per row (repeated across the rows of each path)
+# @example:     path_strings(nodes.node_type, nodes.path_num) --> ['GENE-DISO-GENE', 'GENE-DISO-GENE', 'GENE-DISO-GENE', ...]
+def path_strings(values, path_nums, sep = '-'):
+    values = np.asarray(values, dtype = object)
+    path_nums = np.asarray(path_nums)
+    if(len(values) == 0):
+        return values
+
+    starts = np.flatnonzero(np.r_[True, path_nums[1:] != path_nums[:-1]])
+    lengths = np.diff(np.r_[starts, len(values)])
+
+    seps = np.full(len(values), sep, dtype = object)
+    seps[starts[1:] - 1] = ''
+    seps[-1] = ''
+
+    joined = np.add.reduceat(values.astype(str).astype(object) + seps, starts)
+    return np.repeat(joined, lengths)
+
+# <<< PathColumns() >>>
+# @name:        PathColumns
+# @title:       column buffers for parsing neo4j paths as they stream in
+# @description: `add` appends each node/edge's fields onto one list per column (amortized constant time), rather than making 2 dataframes per path
+#               and appending them onto the running totals (which copies everything every time, so quadratic in the number of paths).
+#               `frames` builds *nodes* (w/ *path_types*/*path_names*, see `path_strings`) and *edges* once.
+# @example:     columns = PathColumns()
+#               for record in query_neo4j(query):
+#                   columns.add(record)
+#               columns.frames()
+class PathColumns:
+    node_fields = ['path_num', 'node_order', 'id', 'node_type', 'node_id', 'node_name']
+    edge_fields = ['edge_order', 'path_num', 'source_id', 'target_id', 'edge_type', 'edge_url']
+
+    def __init__(self):
+        self.nodes = {field: [] for field in self.node_fields}
+        self.edges = {field: [] for field in self.edge_fields}
+        self.n_paths = 0
+
+    # <<< add(path, path_num = None) >>>
+    # appends a single record (w/ a `path`); *path_num* defaults to the number of paths added so far
+    def add(self, path, path_num = None):
+        if(path_num is None):
+            path_num = self.n_paths
+        nodes = self.nodes
+        edges = self.edges
+
+        # extract nodes
+        # node objects contain: id, labels, properties(preflabel, description, id)
+        for node_order, node in enumerate(path['path'].nodes):
+            nodes['path_num'].append(path_num)
+            nodes['node_order'].append(node_order)
+            nodes['id'].append(node.id) # unique id generated by neo4j, used to link to relationships
+            nodes['node_type'].append(list(node.labels)[0])
+            nodes['node_id'].append(node.properties['id']) # unique id for node, used to link to ontologies
+            nodes['node_name'].append(node.properties['preflabel'])
+
+        # extract edges
+        # edge objects contain: id, start, end, type, properties(property_description, property_label, reference_uri, reference_date, reference_supporting_text, property_uri)
+        for edge_order, edge in enumerate(path['path'].relationships):
+            edges['edge_order'].append(edge_order)
+            edges['path_num'].append(path_num)
+            edges['source_id'].append(edge.start)
+            edges['target_id'].append(edge.end)
+            edges['edge_type'].append(edge.properties['property_label'])
+            edges['edge_url'].append(edge.properties['reference_uri'])
+
+        self.n_paths += 1
+
+    def frames(self):
+        nodes = pd.DataFrame(self.nodes, columns = self.node_fields)
+        nodes['path_types'] = path_strings(nodes.node_type, nodes.path_num)
+        nodes['path_names'] = path_strings(nodes.node_name, nodes.path_num)
+        edges = pd.DataFrame(self.edges, columns = self.edge_fields)
+
+        return {'nodes': nodes, 'edges': edges}
+
 # <<< parsePath(path, path_num) >>>
 # Core function to parse neo4j results for an individual path
 # Pulling out the terms needed to interface with d3-based visualizations
 # returns an object containing a dataframe of nodes and a dataframe of edges
+# (to parse many paths, add them all to a single `PathColumns` instead)
 def parsePath(path, path_num):
-    # initialize vars
-    # out = {}
-    nodes = []
-    edges = []
-    n_counter = 0
-    e_counter = 0
-
-    # extract nodes
-    # node objects contain: id, labels, properties(preflabel, description, id)
-    for node in path['path'].nodes:
-        n = {}
-
-        n['path_num'] = path_num
-        n['node_order'] = n_counter
-        n['id'] = node.id # unique id generated by neo4j, used to link to relationships
-        n['node_type'] = list(node.labels)[0]
-        n['node_id'] = node.properties['id'] # unique id for node, used to link to ontologies
-        n['node_name'] = node.properties['preflabel']
-
-        nodes.append(n)
-        n_counter += 1
-    # extract edges
-    # edge objects contain: id, start, end, type, properties(property_description, property_label, reference_uri, reference_date, reference_supporting_text, property_uri)
-    for edge in path['path'].relationships:
-        e = {}
-
-        e['edge_order'] = e_counter
-        e['path_num'] = path_num
-        e['source_id'] = edge.start
-        e['target_id'] = edge.end
-        e['edge_type'] = edge.properties['property_label']
-        e['edge_url'] = edge.properties['reference_uri']
-
-        edges.append(e)
-        e_counter += 1
-
-    nodes = pd.DataFrame(nodes)
-    nodes = add_paths(nodes)
-    edges = pd.DataFrame(edges)
-
-    return {'nodes': nodes, 'edges': edges}
+    columns = PathColumns()
+    columns.add(path, path_num)
+    return columns.frames()
 
 def save_paths(data, filename, direc = dataout_dir):
     class JSONEncoder(json.JSONEncoder):
@@ -230,25 +590,74 @@ def save_paths(data, filename, direc = dataout_dir):
     with open(direc + '/' + filename, 'w') as outfile:
         json.dump(data, outfile, cls = JSONEncoder)
 
+# <<< path_keys(node_types, path_nums) >>>
+# @name:        path_keys
+# @title:       one integer per path that's the same for every path w/ the same sequence of node types
+# @description: rows of each path have to be contiguous. Node types are coded as integers (1 + their sorted order; 0 is never used, so
+#               paths of different lengths can't collide), and each path's sequence is read as the digits of a single number,
+#               summed at once w/ `np.add.reduceat`. Paths too long to fit in an int64 fall back on factorizing the joined strings.
+# @output:      *keys*, + the *starts* (first row) and *lengths* of each path
+def path_keys(node_types, path_nums):
+    path_nums = np.asarray(path_nums)
+    starts = np.flatnonzero(np.r_[True, path_nums[1:] != path_nums[:-1]]) if len(path_nums) > 0 else np.zeros(0, dtype = np.int64)
+    lengths = np.diff(np.r_[starts, len(path_nums)])
+
+    codes, types = pd.factorize(np.asarray(node_types, dtype = object), sort = True)
+    base = len(types) + 2 # missing types are coded -1
+    if(len(starts) == 0):
+        return np.zeros(0, dtype = np.int64), starts, lengths
+    if(lengths.max() * np.log2(base) < 62):
+        position = np.arange(len(codes)) - np.repeat(starts, lengths)
+        keys = np.add.reduceat((codes + 2) * np.power(base, position, dtype = np.int64), starts)
+    else:
+        keys = pd.factorize(path_strings(node_types, path_nums)[starts])[0]
+    return keys, starts, lengths
+
 # <<< count_metapaths(data) >>>
 # @name:        count_metapaths
 # @summary:     compress down nodes into a count of metapaths
 # @description: takes a list of nodes and edges and returns a count of node types
 #               NOTE: ignores any variation in the verb connecting the terms, e.g. an "is a" relationship versus a "part of" relationship
-# @inputs:
-# @outputs:
-# @examples:
+#               Each path is reduced to an integer key for its sequence of node types (`path_keys`), so the metapaths are grouped on integers;
+#               the example path for each metapath comes from a single random draw across all of them.
+#               *count* is the number of node rows of that metapath (paths x nodes per path), as it's always been.
+# @inputs:      *data*: output of `get_paths`
+# @outputs:     dataframe w/ one row per metapath: *path_types*, *count*, *sample_path* (node names of one of its paths), *path_type* (list of node types)
+# @examples:    count_metapaths(get_paths(query))
 def count_metapaths(data):
-
-    def sample_path(path):
-        return(path.sample(1))
-
-    paths = add_paths(data['nodes'])
-    # group by the metapaths
-    # reset index so there's an additional column containing the path numbers; needed to count the number of paths of each type.
-    meta = pd.DataFrame(paths).groupby('path_types').path_names.agg(['count', sample_path]).reset_index()
+    nodes = data['nodes']
+    # rows of each path together, in their existing order
+    if(not nodes.path_num.is_monotonic_increasing):
+        nodes = nodes.iloc[np.argsort(nodes.path_num.to_numpy(), kind = 'stable')]
+
+    node_types = nodes.node_type.to_numpy()
+    node_names = nodes.node_name.to_numpy()
+    keys, starts, lengths = path_keys(node_types, nodes.path_num.to_numpy())
+
+    # group the paths by metapath
+    metapath, unique_keys = pd.factorize(keys)
+    n_paths = np.bincount(metapath, minlength = len(unique_keys))
+    by_metapath = np.argsort(metapath, kind = 'stable')
+    first = np.cumsum(n_paths) - n_paths
+
+    # example path for each: a random one of its paths (all the same length, so same as picking a random row)
+    sample = by_metapath[first + (np.random.random(len(unique_keys)) * n_paths).astype(np.int64)]
+
+    meta = pd.DataFrame({'path_types': join_paths(node_types, starts, lengths, by_metapath[first]),
+        'count': np.bincount(metapath, weights = lengths, minlength = len(unique_keys)).astype(np.int64),
+        'sample_path': join_paths(node_names, starts, lengths, sample)})
+    meta = meta.sort_values('path_types').reset_index(drop = True)
 # TODO: needs to be IDs, not just names?
     meta['path_type'] = meta.path_types.apply(lambda x: list(x.split(sep = '-')))
     meta['sample_path'] = meta.sample_path.apply(lambda x: list(x.split(sep = '-')))
 
     return meta.reset_index()
+
+# <<< join_paths(values, starts, lengths, paths, sep = '-') >>>
+# joined *values* of just the chosen *paths* (given the *starts*/*lengths* of every path), one string per path
+def join_paths(values, starts, lengths, paths, sep = '-'):
+    sel_lengths = lengths[paths]
+    offsets = np.cumsum(sel_lengths) - sel_lengths
+    rows = np.repeat(starts[paths], sel_lengths) + np.arange(sel_lengths.sum()) - np.repeat(offsets, sel_lengths)
+    joined = path_strings(np.asarray(values)[rows], np.repeat(np.arange(len(paths)), sel_lengths), sep)
+    return joined[offsets] if len(paths) > 0 else np.zeros(0, dtype = object)
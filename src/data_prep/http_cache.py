@@ -0,0 +1,245 @@
+# @name:        http_cache.py
+# @title:       Persistent on-disk cache for the JSON APIs (OLS, mygene.info)
+# @description: Every rebuild of the ontology dictionary and gene annotations asks OLS and mygene.info for the same JSON again.
+#               This stores each response in a local SQLite file, keyed by a hash of the normalized url + params, so reruns skip the network.
+#               Supports:
+#                   - TTL eviction: entries older than *ttl* seconds are refetched (or revalidated, see below)
+#                   - size eviction: once the cache is bigger than *max_bytes*, least-recently-used entries are dropped
+#                   - conditional revalidation: stale entries are re-requested w/ If-None-Match / If-Modified-Since; a 304 just refreshes the entry
+#                   - offline mode: only ever answers from the cache, regardless of age
+#                   - hit/miss counters, via `stats()`
+# @depends:     requests
+# @author:      Laura Hughes
+# @email:       lhughes@scripps.edu
+# @date:        18 October 2026
+
+# [0] Setup ---------------------------------------------------------------------------------
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import requests
+from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
+
+# default location; override w/ the NTWK_HTTP_CACHE environment variable or `configure(path = ...)`
+default_path = os.environ.get('NTWK_HTTP_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'ntwk-explr', 'http_cache.sqlite'))
+
+# <<< normalize_url(url, params = None) >>>
+# @name:        normalize_url
+# @title:       standardize a url + params into a single string
+# @description: lowercases the scheme and host, merges *params* into the query string, and sorts the query params,
+#               so that the same request always maps to the same cache key.
+# @example:     normalize_url('http://MyGene.info/v3/query?q=RGD:628763', {'entrezonly': 'true'})
+#               --> 'http://mygene.info/v3/query?entrezonly=true&q=RGD%3A628763'
+def normalize_url(url, params = None):
+    parsed = urlparse(url)
+    query = parse_qsl(parsed.query, keep_blank_values = True)
+    if(params):
+        query = query + [(str(key), str(value)) for key, value in params.items()]
+    query = sorted(query)
+
+    return urlunparse(parsed._replace(scheme = parsed.scheme.lower(), netloc = parsed.netloc.lower(), query = urlencode(query)))
+
+# <<< cache_key(url, params = None) >>>
+# content address for a request: sha256 of the normalized url
+def cache_key(url, params = None):
+    return hashlib.sha256(normalize_url(url, params).encode('utf-8')).hexdigest()
+
+
+# <<< ResponseCache(path, ttl, max_bytes, revalidate, offline) >>>
+# @name:        ResponseCache
+# @title:       SQLite-backed store of JSON responses
+# @input:       *path*: location of the SQLite file (created if it doesn't exist)
+#               *ttl*: seconds before an entry is considered stale; None to never expire
+#               *max_bytes*: upper limit on the total size of the stored responses; None for no limit
+#               *revalidate*: if True, stale entries are checked w/ a conditional request rather than refetched outright
+#               *offline*: if True, never touches the network; stale entries are served as-is and misses return None
+# @example:     cache = ResponseCache('dataout/http_cache.sqlite', ttl = 7 * 24 * 3600)
+#               cache.get_json('http://www.ebi.ac.uk/ols/api/ontologies/go/terms?size=500')
+#               cache.stats()
+class ResponseCache:
+    def __init__(self, path = default_path, ttl = 30 * 24 * 3600, max_bytes = 2 * 1024 ** 3, revalidate = False, offline = False):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.revalidate = revalidate
+        self.offline = offline
+        self.counts = {'hits': 0, 'misses': 0, 'stale': 0, 'revalidated': 0, 'offline_misses': 0, 'errors': 0, 'evicted': 0}
+
+        if(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path), exist_ok = True)
+
+        # calls come in from the thread pools in `ont_struct`; share one connection behind a lock
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread = False)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, url TEXT, body TEXT, etag TEXT, last_modified TEXT, fetched_at REAL, accessed_at REAL, size INTEGER)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)')
+        self.conn.commit()
+        # running total of the stored bytes, so a store doesn't have to add up the whole table to know whether to evict
+        self.total_bytes = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def _count(self, counter):
+        with self.lock:
+            self.counts[counter] += 1
+
+    def _lookup(self, key):
+        with self.lock:
+            return self.conn.execute('SELECT body, etag, last_modified, fetched_at FROM responses WHERE key = ?', (key,)).fetchone()
+
+    def _touch(self, key, fetched = False):
+        now = time.time()
+        with self.lock:
+            if(fetched):
+                self.conn.execute('UPDATE responses SET accessed_at = ?, fetched_at = ? WHERE key = ?', (now, now, key))
+            else:
+                self.conn.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, key))
+            self.conn.commit()
+
+    def _store(self, key, url, resp):
+        body = resp.text
+        now = time.time()
+        with self.lock:
+            old = self.conn.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            self.conn.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, url, body, resp.headers.get('ETag'), resp.headers.get('Last-Modified'), now, now, len(body)))
+            self.conn.commit()
+            self.total_bytes += len(body) - (old[0] if old is not None else 0)
+            over = (self.max_bytes is not None) and (self.total_bytes > self.max_bytes)
+        if(over):
+            self.evict()
+
+    # <<< get_json(url, params = None) >>>
+    # drop-in for `requests.get(url, params = params).json()`; returns None if the request wasn't successful
+    # (w/ *revalidate*, a stale entry that can't be revalidated is served as-is instead)
+    def get_json(self, url, params = None):
+        norm_url = normalize_url(url, params)
+        key = cache_key(url, params)
+        cached = self._lookup(key)
+
+        if(cached is not None):
+            body, etag, last_modified, fetched_at = cached
+            fresh = (self.ttl is None) | (time.time() - fetched_at < self.ttl)
+            if(fresh | self.offline):
+                self._count('hits')
+                self._touch(key)
+                return json.loads(body)
+            self._count('stale')
+        elif(self.offline):
+            self._count('offline_misses')
+            return None
+        else:
+            self._count('misses')
+
+        headers = {}
+        if((cached is not None) & self.revalidate):
+            if(etag):
+                headers['If-None-Match'] = etag
+            if(last_modified):
+                headers['If-Modified-Since'] = last_modified
+
+        try:
+            resp = requests.get(url, params = params, headers = headers)
+        except requests.exceptions.RequestException:
+            if((cached is not None) & self.revalidate):
+                # couldn't check the stale entry; it's still better than nothing
+                self._count('errors')
+                return json.loads(cached[0])
+            raise
+
+        if((resp.status_code == 304) & (cached is not None)):
+            self._count('revalidated')
+            self._touch(key, fetched = True)
+            return json.loads(cached[0])
+
+        if(not resp.ok):
+            self._count('errors')
+            if((cached is not None) & self.revalidate):
+                return json.loads(cached[0])
+            return None
+
+        data = resp.json()
+        self._store(key, norm_url, resp)
+        return data
+
+    # <<< evict() >>>
+    # drops expired entries, then least-recently-used entries until the cache is under *max_bytes*. Run by a store once the cache goes over *max_bytes*.
+    # Skipped when offline, since stale entries are all there is.
+    def evict(self):
+        with self.lock:
+            removed = 0
+            if((self.ttl is not None) & (not self.offline) & (not self.revalidate)):
+                expired = time.time() - self.ttl
+                self.total_bytes -= self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses WHERE fetched_at < ?', (expired,)).fetchone()[0]
+                removed += self.conn.execute('DELETE FROM responses WHERE fetched_at < ?', (expired,)).rowcount
+
+            if(self.max_bytes is not None):
+                total = self.total_bytes
+                if(total > self.max_bytes):
+                    drop = []
+                    for key, size in self.conn.execute('SELECT key, size FROM responses ORDER BY accessed_at'):
+                        if(total <= self.max_bytes):
+                            break
+                        drop.append((key,))
+                        total -= size
+                    self.conn.executemany('DELETE FROM responses WHERE key = ?', drop)
+                    removed += len(drop)
+                    self.total_bytes = total
+
+            self.conn.commit()
+            self.counts['evicted'] += removed
+        return removed
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute('DELETE FROM responses')
+            self.conn.commit()
+            self.total_bytes = 0
+
+    # <<< stats() >>>
+    # counters for this session, plus the number of entries and total size on disk
+    def stats(self):
+        with self.lock:
+            entries, size = self.conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+            counts = dict(self.counts)
+        lookups = counts['hits'] + counts['misses'] + counts['stale'] + counts['offline_misses']
+        counts.update({'entries': entries, 'bytes': size, 'hit_rate': counts['hits'] / lookups if lookups else 0.0})
+        return counts
+
+
+# [1] Module-level cache, shared by `ont_struct` and `annot_GENE` ---------------------------------------------
+_cache = None
+_enabled = True
+
+# <<< configure(enabled = True, **kwargs) >>>
+# @description: (re)sets the shared cache. kwargs are passed to `ResponseCache`.
+# @example:     configure(offline = True)  # rebuild entirely from cached responses
+#               configure(enabled = False) # go straight to the network
+def configure(enabled = True, **kwargs):
+    global _cache, _enabled
+    _enabled = enabled
+    _cache = ResponseCache(**kwargs) if enabled else None
+    return _cache
+
+def get_cache():
+    global _cache
+    if(_enabled & (_cache is None)):
+        _cache = ResponseCache()
+    return _cache
+
+# <<< get_json(url, params = None) >>>
+# json from the shared cache if it's enabled; otherwise a plain request. None if the request wasn't successful.
+def get_json(url, params = None):
+    cache = get_cache()
+    if(cache is not None):
+        return cache.get_json(url, params)
+
+    resp = requests.get(url, params = params)
+    if(resp.ok):
+        return resp.json()
+    return None
+
+def stats():
+    cache = get_cache()
+    return cache.stats() if cache is not None else {}
@@ -0,0 +1,142 @@
+# @name:        id_norm.py
+# @title:       Vectorized parsing of node ids (CURIEs) into their source prefix + local id
+# @description: Replaces the per-row `split` in `ont_dict.pull_ontsource` and the chain of `str.find` calls in `annot_GENE.query_translator`:
+#               whole columns of ids are split at once w/ pandas string methods, and everything that depends on the prefix is a lookup table:
+#                   *prefix2ontid*: graph id prefix --> OLS ontology id (used to merge nodes to the ontology dictionary)
+#                   *gene_routes*:  gene id prefix --> how to ask mygene.info for its Entrez Gene id (query template + species)
+#               Ids that can't be parsed/routed are counted and reported in a single warning, rather than one per row.
+# @author:      Laura Hughes
+# @email:       lhughes@scripps.edu
+# @date:        18 October 2026
+
+# [0] Setup ---------------------------------------------------------------------------------
+import re
+import warnings
+import numpy as np
+import pandas as pd
+
+# ont_source (neo4j graph): ont_id (OLS ID); see `ont_dict.get_ontid` for what's left out and why
+prefix2ontid = {
+    # ANAT
+    'UBERON':   'UBERON',
+    # CHEM
+    'CHEBI':    'CHEBI',
+    # DISO
+    'MP': 'mp',
+    'FBbt': 'FBbt',
+    'HP': 'hp',
+    'WBPhenotype': 'wbphenotype',
+    'FBcv': 'FBcv'
+}
+
+# gene id prefix: how to translate it into an Entrez Gene id w/ mygene.info
+#   *template*: query appended to the mygene.info url; {id} is the full id, {local_id} the part after the prefix. None = already an Entrez id
+#   *species*:  extra `species` param, if needed
+# Checked in this order, and a prefix only has to contain the key (e.g. 'UniProtKB' uses the 'UniProt' route), same as the old `str.find` chain.
+gene_routes = {
+    'NCBIGene': {'template': None, 'species': None},
+    'UniProt':  {'template': '{id}', 'species': None},
+    'InterPro': {'template': '{id}', 'species': None},
+    'RGD':      {'template': '{id}', 'species': None},
+    'FlyBase':  {'template': '{id}', 'species': 'fruitfly'},
+    'Xenbase':  {'template': '{id}', 'species': 'frog'},
+    'ZFIN':     {'template': '{id}', 'species': 'zebrafish'},
+    # species could be narrowed down, but WormBase covers more than one: 6239 (C. elegans), 31234 (C. remanei)
+    'WormBase': {'template': '{id}', 'species': None},
+    'MGI':      {'template': 'mgi:MGI\\\\:{local_id}', 'species': None},
+}
+
+# <<< warn_rows(ids, mask, message, n_examples = 5) >>>
+# one warning for all the rows in *mask*, w/ a count and a few examples
+def warn_rows(ids, mask, message, n_examples = 5):
+    n_rows = int(mask.sum())
+    if(n_rows > 0):
+        examples = ', '.join([str(x) for x in ids[mask].unique()[:n_examples]])
+        warnings.warn(str(n_rows) + ' ids ' + message + ' (e.g. ' + examples + ')')
+    return n_rows
+
+
+# [1] Split ids ---------------------------------------------------------------------------------
+# <<< split_curie(ids, sep = ':', warn = True, local = True) >>>
+# @name:        split_curie
+# @title:       split a column of ids into their source prefix + local id
+# @description: splits on the first *sep* only, so e.g. 'ZFIN:ZDB-GENE-051023-7' --> 'ZFIN', 'ZDB-GENE-051023-7' and 'MGI:MGI:95574' keeps 'MGI:95574'.
+#               The prefix comes back as a categorical (there are only a handful), so anything mapped off of it only touches the categories.
+#               Ids w/o a *sep* (or missing) get NaN for both, and are reported in a single warning.
+#               (a regex replace over the whole column is several times faster than `str.partition` or `str.split(expand = True)`)
+# @input:       *ids*: Series (or list) of ids; *local*: if False, skips pulling out the local ids
+# @output:      dataframe w/ columns *prefix* (and *local_id*), on the same index as *ids*
+# @example:     split_curie(pd.Series(['ZFIN:ZDB-GENE-051023-7', 'HP:0000522', 'ngly1']))
+def split_curie(ids, sep = ':', warn = True, local = True):
+    ids = pd.Series(ids)
+    has_sep = ids.str.contains(sep, regex = False).fillna(False).astype(bool)
+    esc = re.escape(sep)
+
+    split = pd.DataFrame({'prefix': ids.str.replace('(?s)' + esc + '.*$', '', n = 1, regex = True).where(has_sep).astype('category')}, index = ids.index)
+    if(local):
+        split['local_id'] = ids.str.replace('(?s)^.*?' + esc, '', n = 1, regex = True).where(has_sep)
+
+    if(warn):
+        warn_rows(ids, ~has_sep, "have no source prefix. Need to change `sep`?")
+    return split
+
+# <<< ont_source(ids, sep = ':') >>>
+# source prefix for each id (categorical); vectorized version of `ont_dict.pull_ontsource`
+def ont_source(ids, sep = ':'):
+    return split_curie(ids, sep, local = False)['prefix']
+
+# <<< ontid(ids, sep = ':') >>>
+# OLS ontology id for each id, from *prefix2ontid*; NaN if the ontology isn't used
+# @example:     ontid(nodes.node_id)
+def ontid(ids, sep = ':'):
+    return ont_source(ids, sep).map(prefix2ontid)
+
+
+# [2] Gene id routes ---------------------------------------------------------------------------------
+# <<< gene_route(prefixes) >>>
+# name of the *gene_routes* entry for each prefix (NaN if none); each unique prefix is only checked once
+def gene_route(prefixes):
+    prefixes = pd.Series(prefixes)
+    route_of = {}
+    for prefix in prefixes.dropna().unique():
+        for route in gene_routes:
+            if(route in prefix):
+                route_of[prefix] = route
+                break
+    return prefixes.map(route_of)
+
+# <<< gene_queries(gene_ids, transl_url = 'http://mygene.info/v3/query?q=', transl_params = {'entrezonly': 'true'}) >>>
+# @name:        gene_queries
+# @title:       how to translate each gene id into an Entrez Gene id, for a whole column of ids at once
+# @input:       *gene_ids*: Series of gene ids; *transl_url*: base of the mygene.info url query; *transl_params*: params for every query
+# @output:      dataframe on the same index as *gene_ids* w/ columns:
+#               *gene_id*, *prefix*, *route*: the *gene_routes* entry (NaN = unknown syntax)
+#               *entrez_id*: filled in already for NCBIGene ids, which don't need a query
+#               *query*: mygene.info url to translate the rest; *params*: dict of params for that query
+# @example:     gene_queries(pd.Series(['MGI:1857807', 'RGD:628763', 'NCBIGene:698835', 'ZFIN:ZDB-GENE-080418-1', 'foo']))
+def gene_queries(gene_ids, transl_url = 'http://mygene.info/v3/query?q=', transl_params = {'entrezonly': 'true'}):
+    gene_ids = pd.Series(gene_ids)
+    split = split_curie(gene_ids, warn = False)
+
+    routes = pd.DataFrame({'gene_id': gene_ids, 'prefix': split.prefix, 'route': gene_route(split.prefix)})
+    routes['entrez_id'] = split.local_id.where(routes.route == 'NCBIGene')
+
+    templates = routes.route.map({route: value['template'] for route, value in gene_routes.items()})
+    species = routes.route.map({route: value['species'] for route, value in gene_routes.items()})
+
+    query = pd.Series(np.nan, index = gene_ids.index, dtype = object)
+    for template in templates.dropna().unique():
+        rows = templates == template
+        if(template == '{id}'):
+            query[rows] = transl_url + gene_ids[rows]
+        else:
+            prefix, suffix = template.split('{local_id}')
+            query[rows] = transl_url + prefix + split.local_id[rows] + suffix
+    routes['query'] = query
+
+    params = {}
+    for sp in [None] + list(species.dropna().unique()):
+        params[sp] = dict(transl_params, species = sp) if sp is not None else dict(transl_params)
+    routes['params'] = [params[sp] if isinstance(sp, str) else params[None] for sp in species]
+
+    return routes
@@ -0,0 +1,479 @@
+# @name:        local_graph.py
+# @title:       In-process version of the NGLY1 graph, for running the path queries w/o the neo4j server
+# @description: Loads the same concept (node) and statement (edge) .tsv files that are imported into Nuria's neo4j instance,
+#               and answers the path queries in `query_ngly1.queries` directly, w/ no round-trips to the Bolt endpoint.
+#               The graph is held as arrays:
+#                   nodes: label code, degree, and properties (id, preflabel, ...) per node; a node's internal id is its row in the concept file
+#                   edges: start, end, type code, and properties (property_label, reference_uri, ...) per statement
+#                   adjacency: undirected CSR (*indptr*, *nbr*, *adj_edge*), sorted by node and then edge type
+#               A query is matched one hop at a time for every partial path at once: first the nodes that can still reach the end of the
+#               pattern are marked (working backwards from the target), then each hop only follows the adjacency entries w/ the right edge type
+#               that lead to a marked node, so partial paths that can't finish are never made.
+#               Returns the same *nodes*/*edges* dataframes as `clean_neo4j.get_paths` (path_num order can differ).
+#
+#               Understands the parts of Cypher used in `query_ngly1.queries`:
+#                   MATCH path = (var:LABEL {prop: 'value'})-[:`TYPE`]-(...)--(...)-[*..N]-(...)   (undirected; fixed-length or bounded hops)
+#                   other (var {prop: 'value'}) patterns in the MATCH, and `var.prop = 'value'` conditions
+#                   node uniqueness: ALL(x IN nodes(path) WHERE single(y IN nodes(path) WHERE y = x))
+#                   [n IN nodes(path) WHERE n.preflabel IN [...]] / [r IN relationships(path) WHERE r.property_label IN [...]] (must be empty)
+#                   max(size( (var)-[]-() )) AS alias ... alias < N (degree limits)
+#               Anything else in the WITH/RETURN is ignored; patterns it can't follow (directed, unbounded hops) raise a ValueError.
+#               As in neo4j, a path never uses the same edge twice.
+# @depends:     numpy, pandas (no neo4j driver needed); scipy, for `count_metapaths`
+# @author:      Laura Hughes
+# @email:       lhughes@scripps.edu
+# @date:        18 October 2026
+
+# [0] Setup ---------------------------------------------------------------------------------
+import re
+import time
+import warnings
+import itertools
+import numpy as np
+import pandas as pd
+
+# import files for Nuria's neo4j instance
+concept_file = 'https://raw.githubusercontent.com/NuriaQueralt/ngly1/master/neo4j-community-3.0.3/import/ngly1/ngly1_concepts.tsv'
+statement_file = 'https://raw.githubusercontent.com/NuriaQueralt/ngly1/master/neo4j-community-3.0.3/import/ngly1/ngly1_statements.tsv'
+
+node_fields = ['path_num', 'node_order', 'id', 'node_type', 'node_id', 'node_name', 'path_types', 'path_names']
+edge_fields = ['edge_order', 'path_num', 'source_id', 'target_id', 'edge_type', 'edge_url']
+
+# <<< import_columns(columns) >>>
+# strips the neo4j-import type annotations off of column names: 'id:ID' --> 'id', ':LABEL' --> 'label', ':START_ID' --> 'start_id'
+def import_columns(columns):
+    return [col[1:].lower() if col.startswith(':') else col.split(':')[0] for col in columns]
+
+# <<< read_import(file_name) >>>
+# reads a neo4j-import .tsv (local file or url), w/ plain column names
+def read_import(file_name):
+    df = pd.read_csv(file_name, sep = '\t', dtype = str)
+    df.columns = import_columns(df.columns)
+    return df
+
+
+# [1] Graph ---------------------------------------------------------------------------------
+# <<< LocalGraph(concepts, statements) >>>
+# @name:        LocalGraph
+# @title:       the graph, as arrays + an undirected CSR adjacency
+# @input:       *concepts*: dataframe of nodes w/ (at least) *id*, *label*, *preflabel*
+#               *statements*: dataframe of edges w/ *start_id*, *type*, *end_id* (+ *property_label*, *reference_uri*)
+#               (column names as they come out of `read_import`)
+# @example:     graph = load()
+#               graph.get_paths(query_ngly1.queries['NGLY1-AQP1_structured'])
+class LocalGraph:
+    def __init__(self, concepts, statements):
+        concepts = concepts.reset_index(drop = True)
+        self.concepts = concepts
+        n_nodes = len(concepts)
+
+        # nodes: a node w/ several labels gets the first one, same as `PathColumns`
+        labels = concepts['label'].astype(str).str.split(';').str[0]
+        self.label_codes, self.labels = pd.factorize(labels)
+        self.node_id = concepts['id'].to_numpy(dtype = object)
+        self.node_name = concepts['preflabel'].to_numpy(dtype = object)
+
+        # edges: statements whose ends aren't in the concepts can't be matched
+        start = pd.Index(concepts['id']).get_indexer(statements['start_id'])
+        end = pd.Index(concepts['id']).get_indexer(statements['end_id'])
+        known = (start >= 0) & (end >= 0)
+        if(not known.all()):
+            warnings.warn(str(int((~known).sum())) + ' statements refer to concepts that are missing; dropping them')
+        statements = statements[known].reset_index(drop = True)
+        self.statements = statements
+        self.start = start[known]
+        self.end = end[known]
+        self.type_codes, self.types = pd.factorize(statements['type'])
+        self.edge_label = self._edge_property('property_label')
+        self.edge_url = self._edge_property('reference_uri')
+
+        # size( (n)-[]-() )
+        self.degree = np.bincount(self.start, minlength = n_nodes) + np.bincount(self.end, minlength = n_nodes)
+
+        # undirected CSR: each edge shows up once from each end (self-loops just once)
+        loop = self.start == self.end
+        src = np.concatenate([self.start, self.end[~loop]])
+        nbr = np.concatenate([self.end, self.start[~loop]])
+        edge = np.concatenate([np.arange(len(self.start)), np.flatnonzero(~loop)])
+        order = np.lexsort((self.type_codes[edge], src))
+        self.adj_src = src[order]
+        self.nbr = nbr[order]
+        self.adj_edge = edge[order]
+        self.indptr = np.r_[0, np.cumsum(np.bincount(src, minlength = n_nodes))]
+
+    def _edge_property(self, field):
+        if(field in self.statements):
+            return self.statements[field].to_numpy(dtype = object)
+        return np.full(len(self.statements), np.nan, dtype = object)
+
+    def __repr__(self):
+        return 'LocalGraph(' + str(len(self.node_id)) + ' nodes, ' + str(len(self.start)) + ' edges)'
+
+    # <<< node_mask(label = None, props = {}, max_degree = None, exclude_names = []) >>>
+    # nodes w/ that *label*, property values, degree < *max_degree*, and a preflabel not in *exclude_names*
+    def node_mask(self, label = None, props = {}, max_degree = None, exclude_names = []):
+        mask = np.ones(len(self.node_id), dtype = bool)
+        if(label is not None):
+            mask &= self.label_codes == (self.labels.get_loc(label) if label in self.labels else -2)
+        for prop, value in props.items():
+            if(prop not in self.concepts):
+                return np.zeros(len(self.node_id), dtype = bool)
+            mask &= (self.concepts[prop] == value).to_numpy(dtype = bool, na_value = False)
+        if(max_degree is not None):
+            mask &= self.degree < max_degree
+        if(len(exclude_names) > 0):
+            mask &= ~pd.Series(self.node_name).isin(exclude_names).to_numpy()
+        return mask
+
+    # <<< edge_mask(edge_type = None, exclude_edges = []) >>>
+    # edges of that *edge_type* whose property_label isn't in *exclude_edges*
+    def edge_mask(self, edge_type = None, exclude_edges = []):
+        mask = np.ones(len(self.start), dtype = bool)
+        if(edge_type is not None):
+            mask &= self.type_codes == (self.types.get_loc(edge_type) if edge_type in self.types else -2)
+        if(len(exclude_edges) > 0):
+            mask &= ~pd.Series(self.edge_label).isin(exclude_edges).to_numpy()
+        return mask
+
+    # <<< match_chain(node_masks, edge_masks, unique = False) >>>
+    # @name:        match_chain
+    # @title:       every path whose i-th node is in *node_masks[i]* and i-th edge is in *edge_masks[i]*
+    # @description: fixed length (len(edge_masks) hops). No edge is used twice; if *unique*, no node is either.
+    # @output:      *nodes* (n_paths x n_hops + 1) and *edges* (n_paths x n_hops) arrays of node/edge numbers
+    def match_chain(self, node_masks, edge_masks, unique = False):
+        n_hops = len(edge_masks)
+
+        # work backwards: nodes that can get to the end of the pattern from position i, + the adjacency entries that lead there
+        reach = [None] * (n_hops + 1)
+        steps = [None] * n_hops
+        reach[n_hops] = node_masks[n_hops]
+        for i in reversed(range(n_hops)):
+            steps[i] = edge_masks[i][self.adj_edge] & reach[i + 1][self.nbr]
+            reach[i] = np.zeros(len(self.node_id), dtype = bool)
+            reach[i][self.adj_src[steps[i]]] = True
+            reach[i] &= node_masks[i]
+
+        paths = np.flatnonzero(reach[0])[:, None]
+        edges = np.zeros((len(paths), 0), dtype = np.int64)
+        for i in range(n_hops):
+            # CSR of only the entries usable for this hop
+            entries = np.flatnonzero(steps[i])
+            indptr = np.r_[0, np.cumsum(np.bincount(self.adj_src[entries], minlength = len(self.node_id)))]
+
+            last = paths[:, -1]
+            counts = indptr[last + 1] - indptr[last]
+            rows = np.repeat(np.arange(len(paths)), counts)
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            taken = entries[np.repeat(indptr[last], counts) + offsets]
+            nbr = self.nbr[taken]
+            edge = self.adj_edge[taken]
+
+            keep = np.ones(len(rows), dtype = bool)
+            for j in range(edges.shape[1]):
+                keep &= edges[rows, j] != edge
+            if(unique):
+                for j in range(paths.shape[1]):
+                    keep &= paths[rows, j] != nbr
+
+            paths = np.column_stack([paths[rows[keep]], nbr[keep]])
+            edges = np.column_stack([edges[rows[keep]], edge[keep]])
+        return paths, edges
+
+    # <<< chains(pattern) >>>
+    # node + edge masks for each position of a parsed query (see `parse_query`);
+    # bounded hops ([*..N]) give one fixed-length chain per combination of lengths, in order of length
+    def chains(self, pattern):
+        any_node = self.node_mask(exclude_names = pattern['exclude_names'])
+        any_edge = self.edge_mask(exclude_edges = pattern['exclude_edges'])
+        node_masks = [self.node_mask(node['label'], node['props'], node['max_degree']) & any_node for node in pattern['nodes']]
+        edge_masks = [self.edge_mask(rel['type']) & any_edge for rel in pattern['rels']]
+
+        chains = []
+        for hops in itertools.product(*[range(rel['min'], rel['max'] + 1) for rel in pattern['rels']]):
+            nodes = [node_masks[0]]
+            edges = []
+            for n_hops, edge, node in zip(hops, edge_masks, node_masks[1:]):
+                edges += [edge] * n_hops
+                nodes += [any_node] * (n_hops - 1) + [node]
+            chains.append((nodes, edges))
+        return chains
+
+    # <<< match(pattern) >>>
+    # @name:        match
+    # @title:       every path matching a parsed query (see `parse_query`)
+    # @output:      list of (nodes, edges) arrays, one per chain (see `chains`, `match_chain`)
+    def match(self, pattern):
+        return [self.match_chain(nodes, edges, pattern['unique']) for nodes, edges in self.chains(pattern)]
+
+    # <<< frames(chains) >>>
+    # the *nodes*/*edges* dataframes for matched paths, w/ the same columns as `clean_neo4j.PathColumns.frames`
+    def frames(self, chains):
+        nodes = []
+        edges = []
+        n_paths = 0
+        for paths, path_edges in chains:
+            n, width = paths.shape
+            path_num = np.arange(n_paths, n_paths + n)
+            n_paths += n
+
+            node_type = np.asarray(self.labels, dtype = object)[self.label_codes[paths]]
+            node_name = self.node_name[paths]
+            nodes.append(pd.DataFrame({
+                'path_num': np.repeat(path_num, width),
+                'node_order': np.tile(np.arange(width), n),
+                'id': paths.ravel(),
+                'node_type': node_type.ravel(),
+                'node_id': self.node_id[paths].ravel(),
+                'node_name': node_name.ravel(),
+                'path_types': np.repeat(join_columns(node_type), width),
+                'path_names': np.repeat(join_columns(node_name), width)}, columns = node_fields))
+
+            n_edges = path_edges.shape[1]
+            flat = path_edges.ravel()
+            edges.append(pd.DataFrame({
+                'edge_order': np.tile(np.arange(n_edges), n),
+                'path_num': np.repeat(path_num, n_edges),
+                'source_id': self.start[flat],
+                'target_id': self.end[flat],
+                'edge_type': self.edge_label[flat],
+                'edge_url': self.edge_url[flat]}, columns = edge_fields))
+
+        if(len(nodes) == 0):
+            return {'nodes': pd.DataFrame(columns = node_fields), 'edges': pd.DataFrame(columns = edge_fields)}
+        return {'nodes': pd.concat(nodes, ignore_index = True), 'edges': pd.concat(edges, ignore_index = True)}
+
+    # <<< get_paths(query) >>>
+    # same as `clean_neo4j.get_paths`, answered locally
+    # @example:     graph.get_paths("MATCH (source { id: 'HP:0000522', preflabel: 'Alacrima'}), path=(source:DISO)-[*..2]-(target:PHYS) RETURN path")
+    def get_paths(self, query):
+        return self.frames(self.match(parse_query(query)))
+
+    # <<< run_queries(queries) >>>
+    # @name:        run_queries
+    # @title:       runs a batch of path queries locally
+    # @input:       *queries*: dict of {name: Cypher query}
+    # @output:      dict of *data* ({name: output of `get_paths`}) and *timing* (dataframe of query, n_paths, total sec.), like `clean_neo4j.run_queries`
+    # @example:     out = graph.run_queries(query_ngly1.queries)
+    def run_queries(self, queries):
+        data = {}
+        timing = []
+        for name, query in queries.items():
+            t0 = time.time()
+            data[name] = self.get_paths(query)
+            timing.append({'query': name, 'n_paths': data[name]['nodes'].path_num.nunique(), 'total': time.time() - t0})
+        return {'data': data, 'timing': pd.DataFrame(timing, columns = ['query', 'n_paths', 'total'])}
+
+    # <<< adjacency(edge_mask) >>>
+    # sparse (scipy CSR) node x node matrix of the number of *edge_mask* edges between each pair of nodes; symmetric, self-loops counted once
+    def adjacency(self, edge_mask):
+        import scipy.sparse as sparse
+        start = self.start[edge_mask]
+        end = self.end[edge_mask]
+        loop = start == end
+        rows = np.concatenate([start, end[~loop]])
+        cols = np.concatenate([end, start[~loop]])
+        n_nodes = len(self.node_id)
+        return sparse.csr_matrix((np.ones(len(rows), dtype = np.int64), (rows, cols)), shape = (n_nodes, n_nodes))
+
+    # <<< count_chain(node_masks, edge_masks, cache = None) >>>
+    # @name:        count_chain
+    # @title:       number of paths of each metapath (sequence of node labels) through a fixed-length chain, w/o making the paths
+    # @description: for each sequence of labels, the walks are counted w/ sparse matrix-vector products, one per hop
+    #               (a vector of the number of walks ending at each node, kept to nodes w/ that position's label);
+    #               label prefixes w/ no walks are dropped as they go.
+    #               Walks that reuse an edge (which a path can't) are then subtracted off exactly, by inclusion-exclusion over which hops share an edge;
+    #               worked out for up to 3 hops, which covers the [*..3] queries.
+    #               *cache*: dict to keep the adjacency matrices in, to share them between chains w/ the same edge masks
+    # @output:      dict of {tuple of label codes: number of paths}
+    def count_chain(self, node_masks, edge_masks, cache = None):
+        n_hops = len(edge_masks)
+        if(n_hops > 3):
+            raise ValueError('metapaths can only be counted for up to 3 hops; use `count_metapaths(get_paths(...))` instead')
+
+        adj = cache if cache is not None else {}
+        def hop(*hops):
+            # adjacency of the edges allowed at all of *hops* (0-based); keyed by the masks themselves, which are usually the same for every hop
+            key = frozenset(id(edge_masks[h]) for h in hops)
+            if(key not in adj):
+                adj[key] = self.adjacency(np.logical_and.reduce([edge_masks[h] for h in hops]))
+            return adj[key]
+
+        labels = [self.label_codes == code for code in range(len(self.labels))]
+        counts = {}
+
+        def extend(codes, walks, positions):
+            i = len(codes)
+            if(i > n_hops):
+                counts[tuple(codes)] = int(walks.sum()) - reused(positions)
+                return
+            for code in range(len(self.labels)):
+                here = (node_masks[i] & labels[code]).astype(np.int64)
+                reach = here if i == 0 else (hop(i - 1) @ walks) * here
+                if(reach.any()):
+                    extend(codes + [code], reach, positions + [here])
+
+        def reused(p):
+            # walks w/ the same edge on more than one hop
+            if(n_hops == 2):
+                # e1 = e2: u-v-u
+                return int((p[0] * p[2]) @ (hop(0, 1) @ p[1]))
+            if(n_hops == 3):
+                # e1 = e2: u-v-u-x
+                b12 = (p[0] * p[2] * (hop(0, 1) @ p[1])) @ (hop(2) @ p[3])
+                # e2 = e3: u-v-w-v
+                b23 = (p[1] * p[3] * (hop(1, 2) @ p[2])) @ (hop(0) @ p[0])
+                # e1 = e3: u-v-u-v (e2 between v and u), or u-v-v-u (e2 a self-loop at v)
+                key = ('b13', frozenset([id(edge_masks[0]), id(edge_masks[2])]), id(edge_masks[1]))
+                if(key not in adj):
+                    adj[key] = (hop(0, 2).multiply(hop(1)).tocsr(), hop(0, 2) - sparse_diagonal(hop(0, 2)), hop(1).diagonal())
+                both, off_diagonal, loops = adj[key]
+                b13 = (p[0] * p[2]) @ (both @ (p[1] * p[3])) + (p[0] * p[3]) @ (off_diagonal @ (p[1] * p[2] * loops))
+                # e1 = e2 = e3 (counted in each of the above)
+                b123 = (p[0] * p[2]) @ (hop(0, 1, 2) @ (p[1] * p[3]))
+                return int(b12 + b23 + b13 - 2 * b123)
+            return 0
+
+        extend([], None, [])
+        return counts
+
+    # <<< count_metapaths(query) >>>
+    # @name:        count_metapaths
+    # @title:       metapath counts for a path query, w/o pulling out any paths
+    # @description: same path_types/count table as `clean_neo4j.count_metapaths(get_paths(query))` (no *sample_path*, since no path is made),
+    #               from `count_chain` on each chain of the query. As there, *count* is the number of node rows (paths x nodes per path).
+    #               Handles up to 3 hops per chain, w/o node uniqueness (e.g. the alacrima:pathway_* queries); anything else raises a ValueError.
+    # @example:     graph.count_metapaths(query_ngly1.queries['alacrima:pathway_3'])
+    def count_metapaths(self, query):
+        pattern = parse_query(query)
+        if(pattern['unique']):
+            raise ValueError('metapaths w/ unique nodes have to be counted from the paths; use `count_metapaths(get_paths(...))` instead')
+
+        counts = {}
+        cache = {}
+        for nodes, edges in self.chains(pattern):
+            for codes, count in self.count_chain(nodes, edges, cache).items():
+                path_types = '-'.join([self.labels[code] for code in codes])
+                # *count* is in node rows, same as `clean_neo4j.count_metapaths`
+                counts[path_types] = counts.get(path_types, 0) + count * len(codes)
+
+        meta = pd.DataFrame({'path_types': list(counts), 'count': list(counts.values())}, columns = ['path_types', 'count'])
+        meta = meta[meta['count'] > 0].sort_values('path_types').reset_index(drop = True)
+        meta['path_type'] = meta.path_types.apply(lambda x: list(x.split(sep = '-')))
+        return meta.reset_index()
+
+# <<< sparse_diagonal(matrix) >>>
+# just the diagonal of a sparse matrix, as a sparse matrix
+def sparse_diagonal(matrix):
+    import scipy.sparse as sparse
+    return sparse.diags(matrix.diagonal(), format = 'csr', dtype = matrix.dtype)
+
+# <<< join_columns(values, sep = '-') >>>
+# joins each row of a 2D array of strings
+def join_columns(values, sep = '-'):
+    joined = values[:, 0].astype(str).astype(object)
+    for j in range(1, values.shape[1]):
+        joined = joined + sep + values[:, j].astype(str).astype(object)
+    return joined
+
+# <<< load(concept_file = concept_file, statement_file = statement_file) >>>
+# @name:        load
+# @title:       reads the concept + statement files into a `LocalGraph`
+# @example:     graph = load('datain/ngly1_concepts.tsv', 'datain/ngly1_statements.tsv')
+def load(concept_file = concept_file, statement_file = statement_file):
+    return LocalGraph(read_import(concept_file), read_import(statement_file))
+
+
+# [2] Queries ---------------------------------------------------------------------------------
+node_pattern = re.compile(r"\(\s*(\w*)\s*(?::\s*(\w+))?\s*(\{[^}]*\})?\s*\)")
+rel_pattern = re.compile(r"(<?)-(?:\[([^\]]*)\])?-(>?)")
+prop_pattern = re.compile(r"(\w+)\s*:\s*'([^']*)'")
+
+def _props(text):
+    return dict(prop_pattern.findall(text or ''))
+
+def _rel(text):
+    text = (text or '').strip()
+    rel = {'type': None, 'min': 1, 'max': 1}
+    hops = re.match(r'^\w*\s*\*\s*(\d*)\s*(\.\.)?\s*(\d*)$', text)
+    if(hops):
+        low, dots, high = hops.groups()
+        if(dots and not high):
+            raise ValueError('unbounded number of hops in [' + text + ']')
+        rel['min'] = int(low) if low else 1
+        rel['max'] = int(high) if dots else rel['min']
+        if(not (low or dots)):
+            raise ValueError('unbounded number of hops in [' + text + ']')
+        return rel
+    rel_type = re.match(r'^\w*\s*(?::\s*(`[^`]+`|\w+))?$', text)
+    if(rel_type is None):
+        raise ValueError("can't follow relationship [" + text + ']')
+    if(rel_type.group(1)):
+        rel['type'] = rel_type.group(1).strip('`')
+    return rel
+
+# <<< parse_query(query) >>>
+# @name:        parse_query
+# @title:       pulls the path pattern + filters out of a Cypher path query
+# @description: see the header for what's understood.
+# @output:      dict w/:
+#               *nodes*: one dict per node in the path: *var*, *label*, *props* ({property: value}), *max_degree*
+#               *rels*: one dict per relationship: *type* (None = any), *min*/*max* hops
+#               *unique*: whether nodes can only show up once per path
+#               *exclude_names*/*exclude_edges*: node preflabels/edge property_labels that rule out a path
+# @example:     parse_query("MATCH path=(source:DISO)-[*..2]-(target:PHYS) WHERE source.id = 'HP:0000522' RETURN path")
+def parse_query(query):
+    match = re.search(r'MATCH\s+(.*?)(?=\s+WHERE\s|\s+WITH\s|\s+RETURN\s|$)', query, re.S)
+    path = re.search(r'\w+\s*=\s*(\(.*)$', match.group(1), re.S) if match else None
+    if(path is None):
+        raise ValueError('no `MATCH path = (...)` in query')
+
+    # the path pattern: alternating nodes + relationships
+    chain = path.group(1)
+    nodes = []
+    rels = []
+    pos = 0
+    while True:
+        node = node_pattern.match(chain, pos)
+        if(node is None):
+            raise ValueError("can't follow path pattern at: " + chain[pos:])
+        nodes.append({'var': node.group(1), 'label': node.group(2), 'props': _props(node.group(3)), 'max_degree': None})
+        pos = node.end()
+        rel = rel_pattern.match(chain, pos)
+        if(rel is None):
+            break
+        if(rel.group(1) or rel.group(3)):
+            raise ValueError('only undirected relationships are supported: ' + rel.group(0))
+        rels.append(_rel(rel.group(2)))
+        pos = rel.end()
+    if(chain[pos:].strip()):
+        raise ValueError("can't follow path pattern at: " + chain[pos:])
+
+    by_var = {}
+    for node in nodes:
+        if(node['var']):
+            by_var[node['var']] = node
+
+    # properties + labels declared elsewhere in the MATCH (e.g. `(source { id: ... }), path=(source)-...`)
+    for var, label, props in node_pattern.findall(match.group(1)[:path.start()]):
+        if(var in by_var):
+            by_var[var]['props'].update(_props(props))
+            if(label and by_var[var]['label'] is None):
+                by_var[var]['label'] = label
+
+    # var.prop = 'value'
+    for var, prop, value in re.findall(r"(\w+)\.(\w+)\s*=\s*'([^']*)'", query):
+        if(var in by_var):
+            by_var[var]['props'][prop] = value
+
+    # max(size( (var)-[]-() )) AS alias ... alias < N
+    for var, alias in re.findall(r'size\(\s*\((\w+)\)-\[\]-\(\)\s*\)\)?\s+AS\s+(\w+)', query):
+        limit = re.search(r'\b' + alias + r'\s*<\s*(\d+)', query)
+        if(limit and (var in by_var)):
+            by_var[var]['max_degree'] = int(limit.group(1))
+
+    def in_list(field):
+        found = re.search(r'\w+\.' + field + r"\s+IN\s+\[([^\]]*)\]", query)
+        return re.findall(r"'([^']*)'", found.group(1)) if found else []
+
+    return {'nodes': nodes, 'rels': rels, 'unique': re.search(r'single\s*\(', query) is not None,
+        'exclude_names': in_list('preflabel'), 'exclude_edges': in_list('property_label')}
@@ -0,0 +1,130 @@
+# @name:        manifest.py
+# @title:       Catalog of the ontology artifacts saved in `dataout/`
+# @description: Replaces finding files by substring-matching `os.listdir` (where e.g. 'bt_terms' also matches 'FBbt_terms',
+#               and "latest" depends on how the date prefixes sort).
+#               Each saved artifact is recorded in a SQLite catalog (`manifest.sqlite` in the output directory) w/ its:
+#                   ontology, stage (terms/parents/ancestors), file name, source version, row count, content hash (sha256),
+#                   and the hashes of the artifacts it was built from
+#               so loading an artifact is a direct lookup, and a stage only needs to be rebuilt if its inputs have changed.
+#               SQLite (rather than a json file) so the worker processes in `ont_dict.create_ont_dict` can all write to it safely.
+# @author:      Laura Hughes
+# @email:       lhughes@scripps.edu
+# @date:        18 October 2026
+
+# [0] Setup ---------------------------------------------------------------------------------
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+
+manifest_name = 'manifest.sqlite'
+
+# dated file names written by `ont_struct`/`ont_dict`: <YYYY-MM-DD>_<ont_id>_<stage>.<ext>, or <YYYY-MM-DD>_<ont_id>_<stage>-<n>.<ext>
+# for the *n*th build of the same artifact on the same day
+artifact_pattern = re.compile(r'^(\d{4}-\d{2}-\d{2})_(.+)_(terms|parents|ancestors)(?:-(\d+))?\.(tsv|parquet)$')
+
+def _connect(output_dir):
+    conn = sqlite3.connect(os.path.join(output_dir, manifest_name), timeout = 60)
+    conn.execute('CREATE TABLE IF NOT EXISTS artifacts (ont_id TEXT, stage TEXT, file TEXT, source_version TEXT, rows INTEGER, hash TEXT, inputs TEXT, created REAL)')
+    return conn
+
+# <<< file_hash(file_name) >>>
+# sha256 of the file contents, read in 1 MB blocks
+def file_hash(file_name):
+    sha = hashlib.sha256()
+    with open(file_name, 'rb') as f:
+        for block in iter(lambda: f.read(1024 ** 2), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+# <<< artifact_name(ont_id, stage, ext = 'tsv', output_dir = None) >>>
+# standard (dated) file name for an artifact. W/ *output_dir*, a name that isn't taken there yet:
+# a second build on the same day gets a `-2` after the stage, then `-3`, ..., so it never overwrites the earlier version
+# @example:     artifact_name('go', 'terms', output_dir = output_dir) --> '2018-02-14_go_terms-2.tsv'
+def artifact_name(ont_id, stage, ext = 'tsv', output_dir = None):
+    base_name = time.strftime('%Y-%m-%d') + '_' + ont_id + '_' + stage
+    file_name = base_name + '.' + ext
+    if(output_dir is None):
+        return file_name
+    build = 1
+    while(os.path.exists(os.path.join(output_dir, file_name))):
+        build += 1
+        file_name = base_name + '-' + str(build) + '.' + ext
+    return file_name
+
+# <<< register(output_dir, ont_id, stage, file_name, rows, source_version = None, inputs = None) >>>
+# @name:        register
+# @title:       record a newly saved artifact
+# @input:       *file_name*: name of the file w/i *output_dir*
+#               *rows*: number of rows
+#               *source_version*: version of the ontology it came from (e.g. OLS' `config.version`), if known
+#               *inputs*: dict of {stage: hash} for the artifacts it was built from; None if unknown
+# @output:      the manifest entry (dict)
+# @example:     register(output_dir, 'go', 'parents', '2018-02-14_go_parents.tsv', len(parents), inputs = {'terms': terms_entry['hash']})
+def register(output_dir, ont_id, stage, file_name, rows, source_version = None, inputs = None):
+    entry = {'ont_id': ont_id, 'stage': stage, 'file': file_name, 'source_version': source_version, 'rows': int(rows),
+        'hash': file_hash(os.path.join(output_dir, file_name)), 'inputs': inputs, 'created': time.time()}
+
+    conn = _connect(output_dir)
+    with conn:
+        conn.execute('DELETE FROM artifacts WHERE file = ?', (file_name,))
+        conn.execute('INSERT INTO artifacts VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (ont_id, stage, file_name, source_version, entry['rows'], entry['hash'], json.dumps(inputs) if inputs is not None else None, entry['created']))
+    conn.close()
+    return entry
+
+# <<< lookup(output_dir, ont_id, stage) >>>
+# @name:        lookup
+# @title:       most recently registered artifact for an ontology + stage
+# @description: exact match on *ont_id*; entries whose file has since been deleted are skipped.
+# @output:      manifest entry (dict), or None if there isn't one
+# @example:     lookup(output_dir, 'FBbt', 'terms')
+def lookup(output_dir, ont_id, stage):
+    conn = _connect(output_dir)
+    rows = conn.execute('SELECT ont_id, stage, file, source_version, rows, hash, inputs, created FROM artifacts WHERE ont_id = ? AND stage = ? ORDER BY created DESC, rowid DESC',
+        (ont_id, stage)).fetchall()
+    conn.close()
+
+    for row in rows:
+        if(os.path.exists(os.path.join(output_dir, row[2]))):
+            return {'ont_id': row[0], 'stage': row[1], 'file': row[2], 'source_version': row[3], 'rows': row[4],
+                'hash': row[5], 'inputs': json.loads(row[6]) if row[6] is not None else None, 'created': row[7]}
+    return None
+
+# <<< is_current(entry, inputs) >>>
+# True if the artifact was built from exactly these *inputs* ({stage: hash}).
+# Artifacts w/ unknown inputs (backfilled from before the manifest existed) can't be checked against their parents, so count as stale;
+# they're rebuilt once, and the rebuilt version records its inputs.
+def is_current(entry, inputs):
+    if((entry is None) or (entry['inputs'] is None)):
+        return False
+    return entry['inputs'] == inputs
+
+# <<< backfill(output_dir) >>>
+# @name:        backfill
+# @title:       register any dated artifacts already in *output_dir* that aren't in the manifest yet
+# @description: parses the <date>_<ont_id>_<stage>[-<n>] file names exactly (so 'FBbt' is never mistaken for 'bt'), oldest first
+#               (by date, then build number), so the newest file ends up as the one `lookup` returns. Row counts are counted from the files' lines.
+# @example:     backfill('dataout/')
+def backfill(output_dir):
+    conn = _connect(output_dir)
+    known = set(row[0] for row in conn.execute('SELECT file FROM artifacts'))
+    conn.close()
+
+    matches = [(file_name, artifact_pattern.match(file_name)) for file_name in os.listdir(output_dir) if file_name not in known]
+    matches = [(file_name, match) for file_name, match in matches if match is not None]
+    matches.sort(key = lambda item: (item[1].group(1), int(item[1].group(4) or 1), item[0]))
+
+    added = []
+    for file_name, match in matches:
+        date, ont_id, stage, build, ext = match.groups()
+        if(ext == 'parquet'):
+            import pyarrow.parquet as pq
+            rows = pq.ParquetFile(os.path.join(output_dir, file_name)).metadata.num_rows
+        else:
+            with open(os.path.join(output_dir, file_name), 'rb') as f:
+                rows = max(sum(1 for line in f) - 1, 0)
+        added.append(register(output_dir, ont_id, stage, file_name, rows))
+    return added
@@ -0,0 +1,144 @@
+# @name:        ont_closure.py
+# @title:       Transitive-closure index of an ontology, for fast "is X under Y?" lookups
+# @description: Precomputes every ancestor of every term from the parents tables (output of `ont_struct.find_parents`),
+#               so that checking whether one term sits under another -- e.g. when grouping DISO nodes from `clean_neo4j.get_paths` --
+#               is an array lookup rather than another walk through `parent_df`.
+#               The closure is stored as a sparse boolean matrix in CSR form (row = term, columns = its ancestors), using plain NumPy arrays:
+#                   - row `i`'s ancestors are `indices[indptr[i]:indptr[i+1]]`, sorted
+#                   - since the rows and the columns w/i each row are sorted, the flattened (row * n + col) keys are globally sorted,
+#                     so any batch of (ancestor, term) pairs can be checked w/ a single `np.searchsorted`
+#               Descendants are the transpose, stored the same way.
+# @depends:     ont_struct.py
+# @author:      Laura Hughes
+# @email:       lhughes@scripps.edu
+# @date:        18 October 2026
+
+# [0] Setup ---------------------------------------------------------------------------------
+import time
+import warnings
+import numpy as np
+import pandas as pd
+
+import ont_struct as ont # parent index + topological sort
+
+# <<< build_closure(parent_df) >>>
+# @name:        build_closure
+# @title:       compute all ancestors for every term in an ontology
+# @description: visits the terms parents-first (`ont_struct.topo_order`); each term's ancestors are the union of its parents and their ancestors.
+#               Follows the same rules as the ancestor levels: roots stop the walk up, and terms in or below a cycle are left out (w/ a warning).
+#               A term is not its own ancestor.
+# @input:       *parent_df*: parents dataframe (id, ancestor_id, is_root) or its `ont_struct.build_parent_index`
+# @output:      dict containing:
+#               *ids*, *codes*: id <--> integer code lookups (same as `build_parent_index`)
+#               *indptr*, *indices*, *keys*: CSR of ancestors per term, plus its sorted (row * n + col) keys
+#               *desc_indptr*, *desc_indices*: CSR of descendants per term
+#               *build_time*: seconds to build; *nbytes*: memory used by the arrays
+# @example:     go_closure = build_closure(pd.read_csv('dataout/2018-02-14_go_parents.tsv', sep='\t', index_col=0))
+def build_closure(parent_df):
+    t0 = time.time()
+
+    if(isinstance(parent_df, pd.DataFrame)):
+        parent_idx = ont.build_parent_index(parent_df)
+    else:
+        parent_idx = parent_df
+
+    ids = parent_idx['ids']
+    indptr = parent_idx['indptr']
+    indices = parent_idx['indices']
+    is_root = parent_idx['is_root']
+    n_nodes = len(ids)
+
+    topo = ont.topo_order(parent_idx)
+    if(len(topo['cycle_ids']) > 0):
+        warnings.warn('cycle found in parents; ' + str(int(topo['blocked'].sum())) + ' terms in or below a cycle left out of the closure')
+
+    empty = np.zeros(0, dtype = np.int64)
+    node_anc = [empty] * n_nodes
+    for node in topo['order']:
+        if(is_root[node]):
+            continue
+        parents = indices[indptr[node]:indptr[node + 1]]
+        if(len(parents) > 0):
+            node_anc[node] = np.unique(np.concatenate([parents] + [node_anc[par] for par in parents]))
+
+    # -- ancestors, as CSR --
+    anc_ptr = np.zeros(n_nodes + 1, dtype = np.int64)
+    np.cumsum([len(anc) for anc in node_anc], out = anc_ptr[1:])
+    anc_idx = np.concatenate(node_anc) if n_nodes > 0 else empty
+    rows = np.repeat(np.arange(n_nodes, dtype = np.int64), np.diff(anc_ptr))
+    keys = rows * n_nodes + anc_idx
+
+    # -- descendants: transpose --
+    order = np.argsort(anc_idx, kind = 'stable')
+    desc_idx = rows[order]
+    desc_ptr = np.zeros(n_nodes + 1, dtype = np.int64)
+    np.cumsum(np.bincount(anc_idx, minlength = n_nodes), out = desc_ptr[1:])
+
+    closure = {'ids': ids, 'codes': parent_idx['codes'],
+        'indptr': anc_ptr, 'indices': anc_idx, 'keys': keys,
+        'desc_indptr': desc_ptr, 'desc_indices': desc_idx}
+    closure['nbytes'] = int(sum(arr.nbytes for arr in [anc_ptr, anc_idx, keys, desc_ptr, desc_idx]))
+    closure['build_time'] = time.time() - t0
+
+    return closure
+
+# <<< build_closures(parents) >>>
+# one closure per ontology, from the `parents` dict returned by `ont_dict.create_ont_dict`
+# prints the build time and size of each.
+# @example:     closures = build_closures(onts['parents'])
+def build_closures(parents):
+    closures = {}
+    for ont_id, parent_df in parents.items():
+        closures[ont_id] = build_closure(parent_df)
+        print(ont_id + ': ' + str(len(closures[ont_id]['indices'])) + ' ancestor pairs; ' +
+            str(round(closures[ont_id]['build_time'], ndigits = 2)) + 'sec; ' +
+            str(round(closures[ont_id]['nbytes'] / 1024 ** 2, ndigits = 1)) + ' MB')
+    return closures
+
+# <<< _to_codes(closure, ids) >>>
+# converts an array of ids to codes; unknown ids get -1
+def _to_codes(closure, ids):
+    codes = closure['codes']
+    return np.array([codes.get(node_id, -1) for node_id in np.atleast_1d(ids)], dtype = np.int64)
+
+# <<< is_ancestor(closure, a_ids, b_ids) >>>
+# @name:        is_ancestor
+# @title:       vectorized check of whether each a is an ancestor of (sits above) the matching b
+# @input:       *a_ids*, *b_ids*: equal-length arrays (or single ids) of term ids
+# @output:      boolean array; False for any unknown ids
+# @example:     is_ancestor(go_closure, ['GO:0008150', 'GO:0005575'], ['GO:0006915', 'GO:0006915'])
+def is_ancestor(closure, a_ids, b_ids):
+    a = _to_codes(closure, a_ids)
+    b = _to_codes(closure, b_ids)
+    a, b = np.broadcast_arrays(a, b)
+
+    query = b * len(closure['ids']) + a
+    pos = np.searchsorted(closure['keys'], query)
+    found = np.zeros(len(query), dtype = bool)
+    in_range = pos < len(closure['keys'])
+    found[in_range] = closure['keys'][pos[in_range]] == query[in_range]
+
+    return found & (a >= 0) & (b >= 0)
+
+# <<< _lookup(closure, ids, indptr, indices) >>>
+# shared by `ancestors` and `descendants`: list of id arrays, one per input id
+def _lookup(closure, ids, indptr, indices):
+    out = []
+    for code in _to_codes(closure, ids):
+        if(code < 0):
+            out.append(np.array([], dtype = object))
+        else:
+            out.append(closure['ids'][indices[indptr[code]:indptr[code + 1]]])
+    return out
+
+# <<< ancestors(closure, ids) >>>
+# all ancestors of each id, as a list of arrays of ids
+# @example:     ancestors(go_closure, ['GO:0006915'])
+def ancestors(closure, ids):
+    return _lookup(closure, ids, closure['indptr'], closure['indices'])
+
+# <<< descendants(closure, ids) >>>
+# all descendants of each id, as a list of arrays of ids
+# @example:     descendants(go_closure, ['GO:0008219'])
+def descendants(closure, ids):
+    return _lookup(closure, ids, closure['desc_indptr'], closure['desc_indices'])
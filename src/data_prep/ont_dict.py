@@ -4,7 +4,7 @@
 #               [Data sources](https://github.com/flaneuse/ntwk-explr/blob/master/datain/DATA_README.md)
 #               [Data pipeline](https://docs.google.com/presentation/d/1dk_1lTGAhB1tJZuUH9yfJoAZwznedHM_DHrCVFBqeW8/edit#slide=id.g3303550b82_0_110)
 # @sources:     Ontology structures via OLS (GO, HP, MP, FBcv, FBbt, WormBase); gene annotations via mygene.info; NGLY1 network primarily Monarch
-# @depends:     clean_neo4j.py, annot_GENE.py, ont_struct.py
+# @depends:     clean_neo4j.py, annot_GENE.py, ont_struct.py, ont_obo.py, manifest.py, id_norm.py
 # @author:      Laura Hughes
 # @email:       lhughes@scripps.edu
 # @date:        31 January 2018
@@ -14,8 +14,9 @@
 import numpy as np
 import pandas as pd
 import requests
-import os
 import warnings
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 # -- Atom notebook path settings --
 # output_dir = 'dataout/'  # path within Atom notebook
@@ -29,11 +30,14 @@ output_dir = '../../dataout/' # path from command line prompt
 import clean_neo4j as neo4j # interface to query network
 # import annot_GENE as gene # interface to get gene annotations
 import ont_struct as ont # functions to pull ontology data
+import ont_obo as obo # offline ontology file loader
+import manifest # catalog of saved ontology files
+import id_norm # node id prefixes --> ontology ids
 
 
 # [1] Pull unique nodes from Nuria's graph -----------------------------------------------------------------
 # node_file = 'https://raw.githubusercontent.com/NuriaQueralt/ngly1/master/neo4j-community-3.0.3/import/ngly1/ngly1_concepts.tsv' # if want to pull directly from the input file to neo4j
-nodes = neo4j.get_nodes()
+# (nodes are pulled when run as a script, at the bottom, or as the `nodes` stage of `pipeline.py`)
 
 # <<< pull_ontsource(id, sep = ':') >>>
 # @name:        pull_ontsource
@@ -42,6 +46,7 @@ nodes = neo4j.get_nodes()
 # @input:       *id* string, *sep*: separator between id source and source-specific id
 # @output:      stub containing the ont source for that particular id
 # @example:     pull_ontsource('ZFIN:ZDB-GENE-051023-7')
+# for a whole column at once, use `id_norm.ont_source`
 def pull_ontsource(id, sep = ':'):
     split_id = id.split(sep)
     if (len(split_id) > 1):
@@ -50,7 +55,7 @@ def pull_ontsource(id, sep = ':'):
         warnings.warn("Cannot find the source for the id. Need to change `sep`?")
 
 # (TEST): make sure I'm pulling all the ID types
-# nodes['ont_source'] = nodes.node_id.apply(pull_ontsource)
+# nodes['ont_source'] = id_norm.ont_source(nodes.node_id)
 # nodes.groupby('node_type').ont_source.value_counts()
 
 # <<< get_ontid(nodes, drop_source = True) >>>
@@ -68,30 +73,16 @@ def pull_ontsource(id, sep = ':'):
 # @output:      *nodes* dataframe
 # @example:     get_ontid(nodes)
 def get_ontid(nodes, drop_source = True):
-    # ont_source (neo4j graph): ont_id (OLS ID)
-    id2ontid = {
-        # ANAT
-        'UBERON':   'UBERON',
-        # CHEM
-        'CHEBI':    'CHEBI',
-        # DISO
-        'MP': 'mp',
-        'FBbt': 'FBbt',
-        'HP': 'hp',
-        'WBPhenotype': 'wbphenotype',
-        'FBcv': 'FBcv'
-    }
-
-    nodes['ont_source'] = nodes.node_id.apply(pull_ontsource)
-    nodes['ont_id'] = nodes['ont_source'].map(id2ontid)
+    # ont_source (neo4j graph): ont_id (OLS ID), from the lookup table `id_norm.prefix2ontid`
+    # whole column at once; ids w/o a source are reported in a single warning
+    nodes['ont_source'] = id_norm.ont_source(nodes.node_id)
+    nodes['ont_id'] = nodes['ont_source'].map(id_norm.prefix2ontid)
 
     if (drop_source):
         return nodes.drop('ont_source', axis = 1)
     else:
         return nodes
 
-nodes = get_ontid(nodes)
-
 # [2] Pull gene annotations -----------------------------------------------------------------
 # 2 purposes:   1) translate node_id (for genes) to standarized NCBI Entrez gene names
 #               2) for each gene, pull associated gene ontology (GO) terms
@@ -107,89 +98,197 @@ ont_ids = {
 }
 
 
-def create_ont_dict(ont_ids, output_dir, merge=False):
-    files = sorted(os.listdir(output_dir))
-
-    # little helper to see if file has already been generated.
-    def check_exists(files, ont_id, file_type):
-        file_name = [file_name for idx, file_name in enumerate(
-            files) if ont_id + '_' + file_type in file_name]
-        if(len(file_name) == 1):
-            return file_name[0]
-        elif (len(file_name) > 1):
-            return file_name[-1]
+# <<< save_stage(data, ont_id, stage, output_dir, inputs = None, source_version = None, index = True) >>>
+# saves a terms/parents table under its standard dated name and records it in the manifest; returns the manifest entry
+def save_stage(data, ont_id, stage, output_dir, inputs = None, source_version = None, index = True):
+    file_name = manifest.artifact_name(ont_id, stage, output_dir = output_dir)
+    data.to_csv(output_dir + file_name, sep='\t', index=index)
+    return manifest.register(output_dir, ont_id, stage, file_name, len(data), source_version = source_version, inputs = inputs)
+
+# <<< save_ancestor_stage(ancestor, ont_id, output_dir, inputs = None) >>>
+# same, for the ancestors (long-format parquet, see `ont.save_ancestors`)
+def save_ancestor_stage(ancestor, ont_id, output_dir, inputs = None):
+    file_name = ont.save_ancestors(ancestor, ont_id, output_dir, file_name = manifest.artifact_name(ont_id, 'ancestors', 'parquet', output_dir))
+    return manifest.register(output_dir, ont_id, 'ancestors', file_name, len(ancestor), inputs = inputs)
+
+# <<< build_ont(ont_type, ont_id, output_dir, backend = 'ols', ont_file = None) >>>
+# @name:        build_ont
+# @title:       terms --> parents --> ancestors chain for a single ontology
+# @description: looks up each stage in the manifest (`manifest.py`) of *output_dir*; reads it in if it exists and was built from the current inputs
+#               (parents from the current terms, ancestors from the current parents); otherwise creates it and records it in the manifest.
+#               Independent of every other ontology, so `create_ont_dict` can run these in separate processes.
+#               *backend*: 'ols' pulls terms + parents from the OLS API; 'file' reads them from a local .obo/.owl file (*ont_file*) w/ `ont_obo.py`
+# @output:      dict containing the *ont_term*, *parents*, *ancestor* dataframes, plus the *ont_id* and the *time* it took (sec.)
+# @example:     build_ont('DISO', 'FBcv', output_dir)
+def build_ont(ont_type, ont_id, output_dir, backend = 'ols', ont_file = None):
+    t1 = time.time()
+    print('\n*' + ont_id + '*')
+
+    term_entry = manifest.lookup(output_dir, ont_id, 'terms')
+    parent_entry = manifest.lookup(output_dir, ont_id, 'parents')
+
+    # local file backend: terms + parents both come from a single pass through the file
+    loaded = None
+    if((backend == 'file') and ((term_entry is None) or (parent_entry is None))):
+        print('reading terms and parents from ' + ont_file)
+        loaded = obo.load_ontology(ont_file, ont_id)
+
+    # -- terms --
+    if(term_entry is not None):
+        # file already exists; read it in
+        print('reading in term file')
+        ont_term = pd.read_csv(output_dir + term_entry['file'], sep = '\t')
+    else:
+        # create file
+        print('creating term file')
+        if(loaded is not None):
+            ont_term = loaded['terms'].reset_index()
+            term_entry = save_stage(ont_term, ont_id, 'terms', output_dir, source_version = manifest.file_hash(ont_file), index = False)
+        else:
+            ont_term = ont.get_terms(ont_id).reset_index()
+            term_entry = save_stage(ont_term, ont_id, 'terms', output_dir, source_version = ont.ont_version(ont_id), index = False)
+    # either way, append info for merging w/ nodes.
+    ont_term['ont_id'] = pd.Categorical([ont_id] * len(ont_term))
+    ont_term['node_type'] = pd.Categorical([ont_type] * len(ont_term))
+
+    # -- parents --
+    parent_inputs = {'terms': term_entry['hash']}
+    if(manifest.is_current(parent_entry, parent_inputs)):
+        # file already exists; read it in
+        print('reading in parents file')
+        parents = pd.read_csv(output_dir + parent_entry['file'], sep='\t', index_col=0)
+    else:
+        # create file
+        print('creating parents file')
+        if(loaded is not None):
+            parents = loaded['parents']
         else:
-            return False
-
-    # create placeholder for term dictionaries
-    ont_terms = []
-
-    # create placeholder for term parents
-    parents = {}
-
-    # create placeholder for term ancestors
-    ancestors = []
-
-    for ont_type, ont_ids in ont_ids.items():
-        print('\n\n---' + ont_type + '---')
-        for ont_id in ont_ids:
-            print('\n*' + ont_id + '*')
-
-            # -- terms --
-            term_file = check_exists(files, ont_id, 'terms')
-            if(term_file):
-                # file already exists; read it in
-                print('reading in term file')
-                ont_term = pd.read_csv(output_dir + term_file, sep = '\t')
-            else:
-                # create file
-                print('creating term file')
-                ont_term = ont.get_terms(ont_id, save_terms=True, output_dir=output_dir)
-            # either way, append info for merging w/ nodes.
-            ont_term['ont_id'] = ont_id
-            ont_term['node_type'] = ont_type
-            ont_terms.append(ont_term)
-
-            # -- parents --
-            parent_file = check_exists(files, ont_id, 'parents')
-            if(parent_file):
-                # file already exists; read it in
-                print('reading in parents file')
-                parents[ont_id] = pd.read_csv(output_dir + parent_file, sep='\t', index_col=0)
-            else:
-                # create file
-                print('creating parents file')
-                parents[ont_id] = ont.find_parents(ont_terms[ont_id], ont_id, save_terms=True, output_dir=output_dir)
-
-            # -- ancestors --
-            hierarchy_file = check_exists(files, ont_id, 'ancestors')
-            if(hierarchy_file):
-                if (hierarchy_file.find('TEMP') > -1):
-                    start_idx = int(hierarchy_file.split('TEMPidx')[1].replace('.tsv', ''))
-                    # file already exists but is incomplete; read it in
-                    print('reading in partial ancestor hierarchical structure file')
-                    ancestor_partial = pd.read_csv(output_dir + hierarchy_file, sep='\t', index_col=0)
-                    print('creating the rest of the ancestor hierarchical structures, starting at index ' + str(start_idx))
-                    ancestor = ont.find_ancestors(
-                        parents[ont_id], ont_id=ont_id, save_terms=True, output_dir=output_dir, start_idx = start_idx)
-                    # combine the two halves
-                    ancestor = pd.concat([ancestor, ancestor_partial], ignore_index=True)
-                    ancestor.to_csv(output_dir + str(pd.Timestamp.today().strftime('%F')) + '_' + ont_id + '_ancestors_all.tsv', sep='\t')
-                else:
-                    # file already exists; read it in
-                    print('reading in ancestor hierarchical structure file')
-                    ancestor = pd.read_csv(output_dir + hierarchy_file, sep='\t', index_col=0)
-            else:
-                # create file
-                print('creating hierarchical structure file')
-                ancestor = ont.find_ancestors(
-                    parents[ont_id], ont_id=ont_id, save_terms=True, output_dir=output_dir)
-            # either way, append info for merging w/ nodes.
-            ancestor['ont_id'] = ont_id
-            ancestor['node_type'] = ont_type
-            ancestors.append(ancestor)
+            parents = ont.find_parents(ont_term.set_index('id'), ont_id, save_terms=False)
+        parent_entry = save_stage(parents, ont_id, 'parents', output_dir, source_version = term_entry['source_version'], inputs = parent_inputs)
+
+    # -- ancestors --
+    hierarchy_inputs = {'parents': parent_entry['hash']}
+    hierarchy_entry = manifest.lookup(output_dir, ont_id, 'ancestors')
+    if(manifest.is_current(hierarchy_entry, hierarchy_inputs)):
+        # file already exists; read it in
+        print('reading in ancestor hierarchical structure file')
+        ancestor = ont.read_ancestors(output_dir + hierarchy_entry['file'])
+        if(hierarchy_entry['file'].endswith('.tsv')):
+            # older stringified-dict file; convert to the long format for next time
+            print('converting ancestor hierarchical structure file to parquet')
+            save_ancestor_stage(ancestor, ont_id, output_dir, inputs = hierarchy_entry['inputs'])
+    else:
+        # create file; single pass over the whole ontology
+        print('creating hierarchical structure file')
+        ancestor = ont.find_ancestors_batch(parents, ont_id=ont_id, save_terms=False)
+        save_ancestor_stage(ancestor, ont_id, output_dir, inputs = hierarchy_inputs)
+    # either way, append info for merging w/ nodes.
+    ancestor['ont_id'] = ont_id
+    ancestor['node_type'] = ont_type
+
+    return {'ont_id': ont_id, 'ont_term': ont_term, 'parents': parents, 'ancestor': ancestor, 'time': time.time() - t1}
+
+# <<< refresh_ont(ont_type, ont_id, output_dir, backend = 'ols', ont_file = None) >>>
+# @name:        refresh_ont
+# @title:       update a single ontology to its latest release w/o rebuilding every ancestor map
+# @description: pulls the new terms + parents (from OLS, or from a local file w/ *backend* = 'file'), then diffs them against the latest
+#               terms/parents/ancestors in the manifest of *output_dir* and only recomputes the terms that changed or sit below a change (`ont.update_ancestors`).
+#               Saves the new terms, parents, and ancestors as a new version in the manifest, plus a `_changes.tsv` summary of what changed.
+# @output:      dict containing the new *ont_term*, *parents*, *ancestor*, and *changes* dataframes
+# @example:     refresh_ont('DISO', 'hp', output_dir)
+def refresh_ont(ont_type, ont_id, output_dir, backend = 'ols', ont_file = None):
+    manifest.backfill(output_dir)
+    term_entry = manifest.lookup(output_dir, ont_id, 'terms')
+    parent_entry = manifest.lookup(output_dir, ont_id, 'parents')
+    hierarchy_entry = manifest.lookup(output_dir, ont_id, 'ancestors')
+    if((term_entry is None) or (parent_entry is None) or (hierarchy_entry is None)):
+        raise ValueError('no previous build of ' + ont_id + ' in ' + output_dir + ' to refresh; run `create_ont_dict` instead')
+
+    old_terms = pd.read_csv(output_dir + term_entry['file'], sep = '\t')
+    old_parents = pd.read_csv(output_dir + parent_entry['file'], sep='\t', index_col=0)
+    old_ancestors = ont.read_ancestors(output_dir + hierarchy_entry['file'])
+
+    # -- new version --
+    if(backend == 'file'):
+        loaded = obo.load_ontology(ont_file, ont_id)
+        new_terms, new_parents = loaded['terms'], loaded['parents']
+        version = manifest.file_hash(ont_file)
+    else:
+        new_terms = ont.get_terms(ont_id)
+        new_parents = ont.find_parents(new_terms, ont_id, save_terms=False)
+        version = ont.ont_version(ont_id)
+    new_terms = new_terms.reset_index()
+
+    update = ont.update_ancestors(old_parents, old_ancestors, new_parents, old_terms = old_terms, new_terms = new_terms)
+    print(ont_id + ': recomputed ' + str(update['n_recomputed']) + ' of ' + str(len(update['ancestors'])) + ' terms')
+    print(update['changes'].change.value_counts())
+
+    # -- save the new version --
+    term_entry = save_stage(new_terms, ont_id, 'terms', output_dir, source_version = version, index = False)
+    parent_entry = save_stage(new_parents, ont_id, 'parents', output_dir, source_version = version, inputs = {'terms': term_entry['hash']})
+    save_ancestor_stage(update['ancestors'], ont_id, output_dir, inputs = {'parents': parent_entry['hash']})
+    update['changes'].to_csv(output_dir + str(pd.Timestamp.today().strftime('%F')) + '_' + ont_id + '_changes.tsv', sep='\t', index=False)
+
+    new_terms['ont_id'] = pd.Categorical([ont_id] * len(new_terms))
+    new_terms['node_type'] = pd.Categorical([ont_type] * len(new_terms))
+    update['ancestors']['ont_id'] = ont_id
+    update['ancestors']['node_type'] = ont_type
+    return {'ont_term': new_terms, 'parents': new_parents, 'ancestor': update['ancestors'], 'changes': update['changes']}
+
+# <<< create_ont_dict(ont_ids, output_dir, merge = False, n_workers = 1, backend = 'ols', ont_files = {}) >>>
+# *backend*:   'ols' (default) or 'file'; for 'file', *ont_files* gives the local .obo/.owl file per ont_id, e.g. {'go': 'datain/ontology/go.obo'}
+# *n_workers*: if > 1, each ontology's chain (`build_ont`) runs in its own process, w/ up to *n_workers* at a time.
+#              Results are put back together in the same order as *ont_ids*, so the output is the same as running them one by one.
+#              Either way, the time per ontology is printed at the end; an ontology that fails is reported and left out, rather than stopping the rest.
+def create_ont_dict(ont_ids, output_dir, merge=False, n_workers=1, backend='ols', ont_files={}):
+    # make sure any files from before the manifest existed are in it
+    manifest.backfill(output_dir)
+
+    # flatten out to a list of (ont_type, ont_id), in order
+    jobs = [(ont_type, ont_id) for ont_type, type_ids in ont_ids.items() for ont_id in type_ids]
+
+    results = {}
+    failed = {}
+    if(n_workers > 1):
+        with ProcessPoolExecutor(max_workers = n_workers) as executor:
+            futures = {job: executor.submit(build_ont, job[0], job[1], output_dir, backend, ont_files.get(job[1])) for job in jobs}
+            for job, future in futures.items():
+                try:
+                    results[job] = future.result()
+                except Exception as err:
+                    failed[job] = err
+    else:
+        for job in jobs:
+            try:
+                results[job] = build_ont(job[0], job[1], output_dir, backend, ont_files.get(job[1]))
+            except Exception as err:
+                failed[job] = err
+
+    print('\n\n--- timing ---')
+    built = []
+    for ont_type, ont_id in jobs:
+        if((ont_type, ont_id) in results):
+            print(ont_type + ' ' + ont_id + ': ' + str(round(results[(ont_type, ont_id)]['time'], ndigits=2)) + 'sec')
+            built.append(results[(ont_type, ont_id)])
+        else:
+            print(ont_type + ' ' + ont_id + ': FAILED (' + repr(failed[(ont_type, ont_id)]) + ')')
+
+    if(len(failed) > 0):
+        warnings.warn(str(len(failed)) + ' ontologies failed: ' + ', '.join([ont_id for ont_type, ont_id in failed]))
 
+    return combine_onts(built, output_dir, merge=merge)
 
+# <<< combine_onts(built, output_dir, merge = False) >>>
+# @name:        combine_onts
+# @title:       stack the per-ontology outputs of `build_ont` into a single dictionary
+# @description: adds the roots to the ancestors; if *merge*, merges terms + hierarchical levels, checks the merge, and saves the `_ont_dict.tsv`.
+#               Split out of `create_ont_dict` so `pipeline.py` can build each ontology as its own stage.
+# @output:      merged dataframe if *merge*; otherwise dict of *parents*, *ont_terms*, *ont_hierarchy*
+def combine_onts(built, output_dir, merge=False):
+    # term dictionaries, parents (per ontology), and ancestors
+    ont_terms = [result['ont_term'] for result in built]
+    parents = {result['ont_id']: result['parents'] for result in built}
+    ancestors = [result['ancestor'] for result in built]
 
     ont_terms = pd.concat(ont_terms, ignore_index=True)
     # append the roots before converting to DataFrame
@@ -199,7 +298,7 @@ def create_ont_dict(ont_ids, output_dir, merge=False):
 
     if(merge):
         # merge together ontology terms + hierarhical levels
-        merged = pd.merge(ont_terms, ancestors, on=["node_type", "ont_id", "id"], how="outer", indicator=True)
+        merged = merge_onts(ont_terms, ancestors)
         checked = check_merge(merged)
 
         if(checked):
@@ -219,50 +318,119 @@ def get_root_ancestors(ont_terms):
     roots['ancestors'] = np.NaN
     return roots
 
+# <<< encode_keys(frames, keys) >>>
+# @name:        encode_keys
+# @title:       one integer code per unique combination of the *keys* columns, shared across all the *frames*
+# @description: each key column is factorized once (sorted) over all the frames; the codes are combined like digits (first key most significant),
+#               so sorting by the code is the same as sorting by the keys.
+# @output:      list of int64 code arrays (one per frame), list of the (sorted) unique values of each key
+def encode_keys(frames, keys):
+    codes = [np.zeros(len(frame), dtype = np.int64) for frame in frames]
+    uniques = []
+    bounds = np.cumsum([0] + [len(frame) for frame in frames])
+
+    for key in keys:
+        key_codes, key_uniques = pd.factorize(pd.concat([frame[key] for frame in frames], ignore_index = True), sort = True)
+        uniques.append(key_uniques)
+        for i in range(len(frames)):
+            codes[i] = codes[i] * len(key_uniques) + key_codes[bounds[i]:bounds[i + 1]]
+    return codes, uniques
+
+# <<< merge_onts(ont_terms, ancestors, keys = ['node_type', 'ont_id', 'id']) >>>
+# @name:        merge_onts
+# @title:       outer merge of the ontology terms + hierarchical levels
+# @description: same output as `pd.merge(ont_terms, ancestors, on = keys, how = "outer", indicator = True)`, but the three string keys are
+#               encoded once into a single integer code (`encode_keys`) and the join is done on that (as the index), rather than hashing
+#               tuples of python strings. The key columns come back as categoricals.
+# @example:     merge_onts(onts['ont_terms'], onts['ont_hierarchy'])
+def merge_onts(ont_terms, ancestors, keys = ['node_type', 'ont_id', 'id']):
+    (term_codes, anc_codes), uniques = encode_keys([ont_terms, ancestors], keys)
+
+    left = ont_terms.drop(keys, axis = 1)
+    left.index = term_codes
+    right = ancestors.drop(keys, axis = 1)
+    right.index = anc_codes
+
+    merged = pd.merge(left, right, left_index = True, right_index = True, how = "outer", indicator = True, sort = True)
+
+    # decode the keys back out of the index
+    code = merged.index.values
+    for key, key_uniques in reversed(list(zip(keys, uniques))):
+        merged[key] = pd.Categorical.from_codes(code % len(key_uniques), categories = key_uniques)
+        code = code // len(key_uniques)
+
+    columns = list(ont_terms.columns) + [col for col in ancestors.columns if col not in keys] + ['_merge']
+    return merged[columns].reset_index(drop = True)
+
+# <<< check_merge(merged) >>>
+# summarizes how well the terms + hierarchical levels merged together. All the counts come from a single groupby over (_merge, node_type, ont_id).
 def check_merge(merged):
     no_hierarchy = []
     no_base = []
 
-    print('{0:.1f}%  successfully merged'.format(
-        (sum(merged._merge == 'both') / len(merged)) * 100))
+    counts = merged.groupby(['_merge', 'node_type', 'ont_id'], observed = True).size()
+    by_merge = counts.groupby(level = '_merge', observed = True).sum()
+    n_left = by_merge.get('left_only', 0)
+    n_right = by_merge.get('right_only', 0)
 
-    left_only = merged._merge == 'left_only'
-    right_only = merged._merge == 'right_only'
+    print('{0:.1f}%  successfully merged'.format(
+        (by_merge.get('both', 0) / len(merged)) * 100))
 
-    if(sum(left_only)):
-        print(str(sum(left_only)) + ' lacking ontology hierarchy')
-        no_hierarchy = merged[left_only]
+    if(n_left):
+        print(str(n_left) + ' lacking ontology hierarchy')
+        no_hierarchy = merged[merged._merge == 'left_only']
 
-    if(sum(right_only)):
-        print(str(sum(right_only)) + ' lacking base terms')
-        no_base=merged[right_only]
+    if(n_right):
+        print(str(n_right) + ' lacking base terms')
+        no_base = merged[merged._merge == 'right_only']
 
-    if(sum(left_only) | sum(right_only)):
-        if(sum(left_only)):
+    if(n_left | n_right):
+        if(n_left):
             print('\n*missing hierarchy terms*\n')
-            left_bytype = merged[left_only].groupby('node_type').ont_id.value_counts()
-            print(left_bytype)
-        if(sum(right_only)):
+            print(_by_type(counts, 'left_only'))
+        if(n_right):
             print('\n*missing base terms*\n')
-            right_bytype = merged[right_only].groupby('node_type').ont_id.value_counts()
-            print(right_bytype)
+            print(_by_type(counts, 'right_only'))
         return {'no hierarhy terms': no_hierarchy, 'no base terms': no_base}
     else:
         return
 
+# counts per node_type + ont_id for one `_merge` status, largest first w/i each node_type (same as `groupby('node_type').ont_id.value_counts()`)
+def _by_type(counts, status):
+    by_type = counts.xs(status, level = '_merge')
+    by_type = by_type[by_type > 0].sort_values(ascending = False, kind = 'stable')
+    return by_type.sort_index(level = 'node_type', sort_remaining = False, kind = 'stable')
 
-# call to create the dictionary
-onts = create_ont_dict(ont_ids, output_dir, merge=True)
 
-onts.head()
 # [4] Merge together nodes in network, annotations, and ontology levels -----------------------------------------------------------------
-# -- Merge nodes + annotations --
-# GO_terms = gene.go['annots']
-# nodes.head()
-# def merge_nodes_annots(nodes, GO_terms):
-# GO_terms = GO_terms[['gene_name', 'id', ]]
-#
-# pd.merge(nodes, GO_terms, left_on=["node_type", "ont_id", "id"], how="outer", indicator=True)
-#
-# merge_nodes_annots(nodes, gene.go['annots']
-# GO_terms.head()
+# <<< merge_nodes(nodes, onts, annots = None) >>>
+# @name:        merge_nodes
+# @title:       attach ontology terms + hierarchical levels to the nodes in the network, and to the gene annotations
+# @description: nodes are matched on node_type, ont_id (from `get_ontid`), and node_id; GO annotations (`annot_GENE.annotate_genes`) on their GO id.
+#               Left merges, so every node/annotation is kept, w/ one row per ancestor level.
+# @input:       *nodes*: output of `get_ontid`; *onts*: merged output of `create_ont_dict`/`combine_onts`; *annots*: `annots` dataframe from `annot_GENE`
+# @output:      dict containing *nodes* and *annots*
+# @example:     merge_nodes(nodes, onts, gene.go['annots'])
+def merge_nodes(nodes, onts, annots = None):
+    onts = onts.drop('_merge', axis = 1, errors = 'ignore')
+    onts['ont_id'] = onts.ont_id.astype(str)
+    onts['node_type'] = onts.node_type.astype(str)
+
+    merged = pd.merge(nodes, onts.rename(columns = {'id': 'node_id'}), on=["node_type", "ont_id", "node_id"], how="left", suffixes = ('', '_ont'))
+
+    if((annots is not None) and (len(annots) > 0)):
+        go_terms = onts[onts.ont_id == 'go'].drop(['node_type', 'ont_id'], axis = 1)
+        annots = pd.merge(annots, go_terms, on="id", how="left", suffixes = ('', '_ont'))
+
+    return {'nodes': merged, 'annots': annots}
+
+
+# [5] Run ---------------------------------------------------------------------------------------------------------------------------------
+# Only when called as a script; importing this file doesn't touch the network. See `pipeline.py` to run everything (in parallel, w/ cached stages).
+if __name__ == '__main__':
+    nodes = get_ontid(neo4j.get_nodes())
+
+    # call to create the dictionary
+    onts = create_ont_dict(ont_ids, output_dir, merge=True)
+
+    onts.head()
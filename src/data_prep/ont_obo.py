@@ -0,0 +1,215 @@
+# @name:        ont_obo.py
+# @title:       Offline loader for ontology terms + parents from a local .obo or .owl file
+# @description: Alternative backend to the OLS calls in `ont_struct.py` (`get_terms` + `find_parents`), which take hours for the larger ontologies.
+#               Streams through a static ontology file once and returns the same two dataframes:
+#                   *terms*:   index id; columns label, description, synonyms, node_url, is_root, self_url, parent_url, ont_id, prefix
+#                   *parents*: id, ancestor_id, is_root
+#               so everything downstream (`find_ancestors_batch`, etc.) works unchanged.
+#               Parents follow OLS' "hierarchical parents": is_a, plus the relationships in *hierarchical_rels* (by default part_of and develops_from).
+#               NOTE: self_url/parent_url are left blank, since there's no API call behind them.
+#               Supports:
+#                   - OBO flat files (.obo), e.g. http://purl.obolibrary.org/obo/go.obo
+#                   - OWL in RDF/XML (.owl), e.g. http://purl.obolibrary.org/obo/hp.owl
+#                   - either one gzipped (.gz)
+# @author:      Laura Hughes
+# @email:       lhughes@scripps.edu
+# @date:        18 October 2026
+
+# [0] Setup ---------------------------------------------------------------------------------
+import gzip
+import re
+import pandas as pd
+import xml.etree.ElementTree as ET
+
+obo_purl = 'http://purl.obolibrary.org/obo/'
+
+# relationships that OLS treats as hierarchical, in addition to is_a: {OBO name: OWL property id}
+hierarchical_rels = {'part_of': 'BFO_0000050', 'develops_from': 'RO_0002202'}
+
+# <<< _open(file_name) >>>
+# opens plain or gzipped files
+def _open(file_name, mode = 'rt'):
+    if(file_name.endswith('.gz')):
+        return gzip.open(file_name, mode)
+    return open(file_name, mode)
+
+# <<< iri2id(iri) >>>
+# 'http://purl.obolibrary.org/obo/GO_0008150' --> 'GO:0008150'
+def iri2id(iri):
+    local_id = iri.rsplit('/', 1)[-1].rsplit('#', 1)[-1]
+    return local_id.replace('_', ':', 1)
+
+# <<< id2iri(id) >>>
+# 'GO:0008150' --> 'http://purl.obolibrary.org/obo/GO_0008150'
+def id2iri(id):
+    return obo_purl + id.replace(':', '_', 1)
+
+
+# [1] OBO ------------------------------------------------------------------------------------
+# <<< _obo_stanzas(file_name) >>>
+# generator over the [Term] stanzas of an OBO file, one dict of {tag: [values]} at a time
+def _obo_stanzas(file_name):
+    stanza = None
+    with _open(file_name) as f:
+        for line in f:
+            line = line.strip()
+            if(line.startswith('[')):
+                if(stanza is not None):
+                    yield stanza
+                stanza = {} if line == '[Term]' else None
+            elif((stanza is not None) & (':' in line)):
+                tag, value = line.split(':', 1)
+                stanza.setdefault(tag, []).append(value.strip())
+    if(stanza is not None):
+        yield stanza
+
+# strips off trailing modifiers/comments: 'GO:0008150 ! biological_process' --> 'GO:0008150'
+def _obo_ref(value):
+    return value.split('!')[0].split('{')[0].strip()
+
+# pulls out the quoted text in a def/synonym line
+def _obo_quoted(value):
+    match = re.match(r'"((?:[^"\\]|\\.)*)"', value)
+    return match.group(1).replace('\\"', '"') if match else value
+
+# <<< parse_obo(file_name, filter_obs = True, rels = hierarchical_rels) >>>
+# @name:        parse_obo
+# @title:       stream through an OBO file and pull out each term and its hierarchical parents
+# @output:      list of term dicts, list of (id, parent_id) tuples
+def parse_obo(file_name, filter_obs = True, rels = hierarchical_rels):
+    terms = []
+    edges = []
+    for stanza in _obo_stanzas(file_name):
+        if('id' not in stanza):
+            continue
+        if(filter_obs & (stanza.get('is_obsolete', ['false'])[0] == 'true')):
+            continue
+
+        term_id = stanza['id'][0]
+        terms.append({'id': term_id,
+            'label': stanza.get('name', [''])[0],
+            'description': _obo_quoted(stanza['def'][0]) if 'def' in stanza else '',
+            'synonyms': _obo_quoted(stanza['synonym'][0]) if 'synonym' in stanza else ''})
+
+        for parent in stanza.get('is_a', []):
+            edges.append((term_id, _obo_ref(parent)))
+        for relationship in stanza.get('relationship', []):
+            rel = relationship.split()
+            if((len(rel) > 1) and (rel[0] in rels)):
+                edges.append((term_id, _obo_ref(rel[1])))
+    return terms, edges
+
+
+# [2] OWL (RDF/XML) ------------------------------------------------------------------------------------
+ns = {'rdf': 'http://www.w3.org/1999/02/22-rdf-syntax-ns#',
+    'rdfs': 'http://www.w3.org/2000/01/rdf-schema#',
+    'owl': 'http://www.w3.org/2002/07/owl#',
+    'oboInOwl': 'http://www.geneontology.org/formats/oboInOwl#',
+    'obo': obo_purl}
+
+def _tag(prefix, name):
+    return '{' + ns[prefix] + '}' + name
+
+# <<< parse_owl(file_name, filter_obs = True, rels = hierarchical_rels) >>>
+# @name:        parse_owl
+# @title:       stream through an RDF/XML OWL file and pull out each class and its hierarchical parents
+# @description: uses `iterparse`, clearing every top-level element (classes, properties, axioms, ...) once it's been read, and dropping it from the root,
+#               so the whole document is never held in memory.
+#               Parents come from `rdfs:subClassOf` (is_a) and from `subClassOf` restrictions on the properties in *rels* (e.g. part_of some X).
+#               Parents of owl:Thing are left out, as in OLS, so the terms right under it are roots rather than children of a `Thing` term.
+# @output:      list of term dicts, list of (id, parent_id) tuples
+def parse_owl(file_name, filter_obs = True, rels = hierarchical_rels):
+    rel_iris = set(obo_purl + rel for rel in rels.values())
+    about = _tag('rdf', 'about')
+    resource = _tag('rdf', 'resource')
+    owl_class = _tag('owl', 'Class')
+    owl_thing = ns['owl'] + 'Thing'
+
+    terms = []
+    edges = []
+    depth = 0
+    root = None
+    with _open(file_name, 'rb') as f:
+        for event, elem in ET.iterparse(f, events = ('start', 'end')):
+            if(event == 'start'):
+                if(root is None):
+                    root = elem
+                depth += 1
+                continue
+            depth -= 1
+            # only look at top-level elements (depth 1, right under rdf:RDF), once they've been read in whole
+            if(depth != 1):
+                continue
+
+            iri = elem.get(about)
+            deprecated = elem.find('owl:deprecated', ns)
+            if((elem.tag != owl_class) or (iri is None) or (filter_obs and (deprecated is not None) and (deprecated.text == 'true'))):
+                root.clear()
+                continue
+
+            term_id = iri2id(iri)
+            label = elem.find('rdfs:label', ns)
+            descrip = elem.find('obo:IAO_0000115', ns)
+            syn = elem.find('oboInOwl:hasExactSynonym', ns)
+            terms.append({'id': term_id,
+                'label': label.text if label is not None else '',
+                'description': descrip.text if descrip is not None else '',
+                'synonyms': syn.text if syn is not None else ''})
+
+            for parent in elem.findall('rdfs:subClassOf', ns):
+                if(parent.get(resource) is not None):
+                    if(parent.get(resource) != owl_thing):
+                        edges.append((term_id, iri2id(parent.get(resource))))
+                    continue
+                restriction = parent.find('owl:Restriction', ns)
+                if(restriction is None):
+                    continue
+                prop = restriction.find('owl:onProperty', ns)
+                target = restriction.find('owl:someValuesFrom', ns)
+                if((prop is not None) and (target is not None) and (prop.get(resource) in rel_iris) and (target.get(resource) not in (None, owl_thing))):
+                    edges.append((term_id, iri2id(target.get(resource))))
+            # drops this element (and anything before it) from the tree
+            root.clear()
+    return terms, edges
+
+
+# [3] Put it together ------------------------------------------------------------------------------------
+# <<< load_ontology(file_name, ont_id, save_terms = False, output_dir = '', filter_obs = True, rels = hierarchical_rels) >>>
+# @name:        load_ontology
+# @title:       terms + parents frames for an ontology, from a local file
+# @description: drop-in for `get_terms` + `find_parents`. Roots are the terms w/o any hierarchical parents.
+#               If *save_terms*, saves the `_terms.tsv` and `_parents.tsv` files the same way the OLS functions do.
+# @input:       *file_name*: path to the .obo/.owl file (optionally .gz); *ont_id*: OLS id, used for the file names
+# @output:      dict containing *terms* and *parents*
+# @example:     go = load_ontology('datain/ontology/go.obo', 'go')
+def load_ontology(file_name, ont_id, save_terms = False, output_dir = '', filter_obs = True, rels = hierarchical_rels):
+    base_name = file_name[:-3] if file_name.endswith('.gz') else file_name
+    if(base_name.endswith('.obo')):
+        terms, edges = parse_obo(file_name, filter_obs = filter_obs, rels = rels)
+    elif(base_name.endswith('.owl') | base_name.endswith('.rdf') | base_name.endswith('.xml')):
+        terms, edges = parse_owl(file_name, filter_obs = filter_obs, rels = rels)
+    else:
+        raise ValueError('unknown ontology file type for ' + file_name + '. Supply an .obo or .owl (RDF/XML) file')
+
+    terms = pd.DataFrame(terms, columns = ['id', 'label', 'description', 'synonyms'])
+    terms = terms.drop_duplicates(subset = 'id')
+    parents = pd.DataFrame(edges, columns = ['id', 'ancestor_id']).drop_duplicates()
+    # drop edges from terms that were filtered out (e.g. obsolete)
+    parents = parents[parents.id.isin(terms.id)].reset_index(drop = True)
+
+    has_parents = set(parents.id)
+    terms['node_url'] = terms.id.apply(id2iri)
+    terms['is_root'] = ~terms.id.isin(has_parents)
+    terms['self_url'] = ''
+    terms['parent_url'] = ''
+    terms['ont_id'] = pd.Categorical([ont_id] * len(terms))
+    terms['prefix'] = pd.Categorical(terms.id.str.split(':').str[0])
+    terms = terms.set_index('id')
+
+    parents['is_root'] = ~parents.ancestor_id.isin(has_parents)
+
+    if (save_terms):
+        terms.to_csv(output_dir + str(pd.Timestamp.today().strftime('%F')) + '_' + ont_id + '_terms.tsv', sep='\t')
+        parents.to_csv(output_dir + str(pd.Timestamp.today().strftime('%F')) + '_' + ont_id + '_parents.tsv', sep='\t')
+
+    return {'terms': terms, 'parents': parents}
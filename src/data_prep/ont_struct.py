@@ -21,6 +21,17 @@ import pandas as pd
 import requests
 import progressbar
 import time
+import random
+import threading
+import warnings
+import os
+import glob
+import json
+import hashlib
+from ast import literal_eval
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs, urlencode, urlunparse
+import http_cache # on-disk cache of API responses
 
 # <<< get_data(url) >>>
 # @name: get_data(url)
@@ -39,14 +50,14 @@ import time
 #     ...['obo_id']: unique id
 #     ...['synonyms']: synonyms for term
 #     ...[<other stuff>]: things that didn't seem as relevant.
+# Responses are served from / saved to the on-disk cache in `http_cache.py`; see `http_cache.configure` to turn it off or run offline.
 # @input: url from any API
 # @output: False if query failed; json-ized data if successful
 # @example: get_data('http://www.ebi.ac.uk/ols/api/ontologies/go/terms?size=500')
 def get_data(url):
-    resp = requests.get(url)
+    data = http_cache.get_json(url)
 
-    if (resp.ok):
-        data = resp.json()
+    if (data is not None):
         return data
     else:
         print('query was not sucessful')
@@ -65,6 +76,33 @@ def addit_pages(json_data):
     else:
         return False
 
+# <<< ont_version(ont_id) >>>
+# version of the ontology currently loaded in OLS (from the ontology's config); None if it can't be found
+# @example: ont_version('go')
+def ont_version(ont_id, base_url = 'http://www.ebi.ac.uk/ols/api/ontologies/'):
+    try:
+        return get_data(base_url + ont_id)['config']['version']
+    except:
+        return None
+
+# <<< page_urls(json_data) >>>
+# Builds the urls for every remaining page of an OLS query, using the total page count reported in the first response.
+# The `next` link is used as a template so any params (size, etc.) are carried through; only `page` is swapped out.
+# returns a list of urls, in page order; empty if the query fit on a single page
+def page_urls(json_data):
+    next_page = addit_pages(json_data)
+    if(not next_page):
+        return []
+
+    parsed = urlparse(next_page['next'])
+    params = parse_qs(parsed.query)
+
+    urls = []
+    for page_num in range(next_page['current'] + 1, next_page['last'] + 1):
+        params['page'] = [str(page_num)]
+        urls.append(urlunparse(parsed._replace(query = urlencode(params, doseq = True))))
+    return urls
+
 # <<< _term_gen(json_data) >>>
 # term generator to be able to loop through all terms in pulled data
 def _term_gen(data):
@@ -76,24 +114,17 @@ def _term_gen(data):
         for term in data['_embedded']['terms']:
             yield term
 
-# <<< pull_terms(json_data) >>>
+# <<< pull_term_columns(json_data) >>>
 # function to remove only the good bits from an API call to OLS
 # collects all the terms within a given ontology
-# returns a dataframe containing their ids, labels (names), descriptions, synonyms, iri (purl to ontobee), whether is a root node, and the url to call to get their hierarchicalParents
+# returns a dict of columns (lists) containing their ids, labels (names), descriptions, synonyms, iri (purl to ontobee), whether is a root node, and the url to call to get their hierarchicalParents
 # [EBI description of parent/child relationships](https://github.com/EBISPOT/OLS/blob/master/ols-web/src/main/asciidoc/generated-snippets/terms-example/links.adoc)
 # "Hierarchical parents include is-a and other related parents, such as part-of/develops-from, that imply a hierarchical relationship"
-def pull_terms(json_data, filter_obs = True):
+# Kept as plain lists so the pages can be strung together and turned into a dataframe just once (`terms_frame`).
+def pull_term_columns(json_data, filter_obs = True):
     iter_terms = _term_gen(json_data)
 
-    ids = []
-    labels = []
-    descrips = []
-    syn = []
-    iri = []
-    root = []
-    selfs = []
-    parents = []
-
+    columns = {'id': [], 'label': [], 'description': [], 'synonyms': [], 'node_url': [], 'is_root': [], 'self_url': [], 'parent_url': [], 'ont_id': []}
 
     # pull out the relevant values
     for term in iter_terms:
@@ -102,214 +133,980 @@ def pull_terms(json_data, filter_obs = True):
         #   obsolete terms
         #   "Thing"
         if((not filter_obs) | ((not term['is_obsolete']) & pd.notnull(term['obo_id']))):
-            ids.append(term['obo_id'])
-            labels.append(term['label'])
-            iri.append(term['iri'])
-            root.append(term['is_root'])
-            selfs.append(term['_links']['self']['href'])
+            columns['id'].append(term['obo_id'])
+            columns['label'].append(term['label'])
+            columns['node_url'].append(term['iri'])
+            columns['is_root'].append(term['is_root'])
+            columns['self_url'].append(term['_links']['self']['href'])
+            columns['ont_id'].append(term.get('ontology_name'))
             try:
-                descrips.append(term['description'][0])
+                columns['description'].append(term['description'][0])
             except:
-                descrips.append('')
+                columns['description'].append('')
             try:
-                syn.append(term['synonyms'][0])
+                columns['synonyms'].append(term['synonyms'][0])
             except:
-                syn.append('')
+                columns['synonyms'].append('')
             try:
-                parents.append(term['_links']['hierarchicalParents']['href'])
+                columns['parent_url'].append(term['_links']['hierarchicalParents']['href'])
             except KeyError:  # there's no parents for this one
-                parents.append('')
-                continue
-    # convert to a dataframe
-    terms = pd.DataFrame([ids, labels, descrips, syn, iri, root, selfs, parents], index = ['id', 'label', 'description', 'synonyms', 'node_url', 'is_root', 'self_url', 'parent_url']).T.set_index('id')
+                columns['parent_url'].append('')
+    return columns
 
+# <<< terms_frame(columns) >>>
+# converts the term columns (from one or more pages, see `pull_term_columns`) into a typed dataframe:
+#   *is_root*: bool, rather than object
+#   *prefix*: id prefix (e.g. 'CHEBI' for 'CHEBI:64709'), as a categorical -- ontologies pull in a lot of terms from other ontologies, so this is handy for filtering
+#   *ont_id*: the ontology the terms were pulled from (the same value on every row), as a categorical
+def terms_frame(columns):
+    terms = pd.DataFrame({key: values for key, values in columns.items() if key != 'id'}, index = pd.Index(columns['id'], name = 'id'))
+    terms['is_root'] = terms.is_root.astype(bool)
+    terms['prefix'] = pd.Categorical(terms.index.str.split(':').str[0])
+    if('ont_id' in terms.columns):
+        terms['ont_id'] = pd.Categorical(terms.ont_id)
     return terms
 
+# <<< pull_terms(json_data) >>>
+# term dataframe for a single page of OLS results
+def pull_terms(json_data, filter_obs = True):
+    return terms_frame(pull_term_columns(json_data, filter_obs))
+
+# <<< _extend_columns(columns, page) >>>
+# appends one page's term columns onto the running columns
+def _extend_columns(columns, page):
+    for key, values in page.items():
+        columns[key].extend(values)
+    return columns
+
+# <<< term_memory(terms) >>>
+# memory (bytes) used by the typed terms dataframe vs. the same data stored as object columns (how `pull_terms` used to build it)
+# diagnostic only (makes a deep copy of the frame); not called by `get_terms`
+# @example: term_memory(get_terms('fbbt', n_workers = 8))
+def term_memory(terms):
+    typed = terms.memory_usage(deep = True).sum()
+    untyped = terms.astype(object).memory_usage(deep = True).sum()
+    return {'typed': typed, 'object': untyped, 'saved': untyped - typed}
+
 # Primary API call to OLS to get the unique terms.
 # returns terms, parents
 # --> term dictionary
+# *n_workers*: number of threads used to pull the remaining pages at the same time. 1 (default) walks the `next` links one page at a time.
+#              Pages are put back together in page order, so the output is the same either way.
+# Columns from every page are collected first and converted to a (typed) dataframe once at the end.
 # @example: fbcv = get_terms('fbcv')
-def get_terms(ont_id, base_url = 'http://www.ebi.ac.uk/ols/api/ontologies/', end_url = '/terms?size=500', save_terms = False, output_dir = ''):
+#           go = get_terms('go', n_workers = 8)
+def get_terms(ont_id, base_url = 'http://www.ebi.ac.uk/ols/api/ontologies/', end_url = '/terms?size=500', save_terms = False, output_dir = '', n_workers = 1):
     url = base_url + ont_id + end_url
 
     json_data = get_data(url)
 
     # set up containers for loops
-    terms = pull_terms(json_data)
+    columns = pull_term_columns(json_data)
     next_page = addit_pages(json_data)
 
-    with progressbar.ProgressBar(max_value = next_page['last']) as bar:
-        while(next_page):
-            bar.update(next_page['current'])
-            json_data = get_data(next_page['next'])
-            next_page = addit_pages(json_data) # update next page
+    if(n_workers > 1):
+        for page in get_pages(page_urls(json_data), n_workers = n_workers):
+            _extend_columns(columns, page)
+    elif(next_page):
+        with progressbar.ProgressBar(max_value = next_page['last']) as bar:
+            while(next_page):
+                bar.update(next_page['current'])
+                json_data = get_data(next_page['next'])
+                next_page = addit_pages(json_data) # update next page
 
-            terms = pd.concat([terms,pull_terms(json_data)])
+                _extend_columns(columns, pull_term_columns(json_data))
+
+    terms = terms_frame(columns)
 
     if (save_terms):
         terms.to_csv(output_dir + str(pd.Timestamp.today().strftime('%F')) + '_' + ont_id + '_terms.tsv', sep='\t')
 
     return terms
 
+# <<< get_pages(urls, n_workers = 8) >>>
+# @name:        get_pages
+# @title:       pull a set of OLS term pages at the same time
+# @description: fetches each url in a thread pool and runs `pull_term_columns` on the result.
+#               A page that still fails after *max_retries* retries (see `get_data_retry`) raises a RuntimeError, rather than being left out of the terms.
+#               `executor.map` hands back results in the same order as `urls`, so the pages stay in page order no matter which finishes first.
+# @input:       *urls*: list of page urls, output of `page_urls`; *n_workers*: size of the thread pool
+# @output:      list of term columns (dicts of lists), one per url
+# @example:     get_pages(page_urls(get_data('http://www.ebi.ac.uk/ols/api/ontologies/fbcv/terms?size=500')), n_workers = 4)
+def get_pages(urls, n_workers = 8, max_retries = 3):
+    def pull_page(url):
+        json_data = get_data_retry(url, max_retries = max_retries)
+        if(json_data is None):
+            raise RuntimeError('could not pull terms page ' + url)
+        return pull_term_columns(json_data)
+
+    pages = []
+    with ThreadPoolExecutor(max_workers = n_workers) as executor:
+        with progressbar.ProgressBar(max_value = len(urls)) as bar:
+            for idx, page in enumerate(executor.map(pull_page, urls)):
+                pages.append(page)
+                bar.update(idx + 1)
+    return pages
+
+# <<< TokenBucket(rate, capacity) >>>
+# @name:        TokenBucket
+# @title:       thread-safe rate limiter for calls to OLS
+# @description: bucket refills at `rate` tokens per second, up to `capacity`. Each request takes a token, waiting if the bucket is empty.
+#               Lets the worker pool run flat-out without hammering the server (which is what triggered the old 2 min. timeouts).
+# @example:     bucket = TokenBucket(rate = 10); bucket.take()
+class TokenBucket:
+    def __init__(self, rate, capacity = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if(self.tokens >= 1):
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+# <<< get_data_retry(url, bucket = None, max_retries = 5, backoff = 1, max_backoff = 60, retry_budget = None) >>>
+# @name:        get_data_retry
+# @title:       `get_data`, with rate limiting and retries
+# @description: failed calls (request exception, non-ok response, or a body that isn't valid JSON) are retried with exponential backoff plus full jitter:
+#               sleep ~ U(0, backoff * 2^attempt).
+#               *retry_budget* is an optional dict ({'remaining': n, 'lock': threading.Lock()}) shared between workers that caps the total number of retries for a whole run;
+#               once it's used up, failures aren't retried any more.
+# @output:      json-ized data; None if every attempt failed
+# @example:     get_data_retry('http://www.ebi.ac.uk/ols/api/ontologies/go/terms?size=500', bucket = TokenBucket(10))
+def get_data_retry(url, bucket = None, max_retries = 5, backoff = 1, max_backoff = 60, retry_budget = None):
+    for attempt in range(max_retries + 1):
+        if(bucket is not None):
+            bucket.take()
+
+        try:
+            data = get_data(url)
+        except (requests.exceptions.RequestException, ValueError):
+            # ValueError: a 200 w/ a truncated/malformed JSON body (not cached, so the retry asks again)
+            data = None
+
+        if(data is not None):
+            return data
+
+        if(attempt == max_retries):
+            break
+
+        if(retry_budget is not None):
+            with retry_budget['lock']:
+                if(retry_budget['remaining'] <= 0):
+                    break
+                retry_budget['remaining'] -= 1
+
+        time.sleep(random.uniform(0, min(max_backoff, backoff * 2 ** attempt)))
+
+    return None
+
 # @description: pulls out all the immediate hierahrichal parents for a
 #               [EBI description of parent/child relationships](https://github.com/EBISPOT/OLS/blob/master/ols-web/src/main/asciidoc/generated-snippets/terms-example/links.adoc)
 #               "Hierarchical parents include is-a and other related parents, such as part-of/develops-from, that imply a hierarchical relationship"
+#               Parent calls run in a pool of *n_workers* threads, capped at *rate* requests/sec. by a shared `TokenBucket`.
+#               Each call gets up to *max_retries* retries w/ exponential backoff (see `get_data_retry`); *retry_budget* caps the total retries for the run.
+#               Terms whose parents still couldn't be pulled are dropped with a warning (and listed in a `_parents_failed` file if saving).
 # @input:       *terms*: dataframe of terms, output of `get_terms`
 #
 # @example:     parent_df = find_parents(fbcv, ont_id = 'fbcv')
-def find_parents(terms, ont_id, save_terms = True, output_dir = ''):
+#               parent_df = find_parents(hp, ont_id = 'hp', n_workers = 16, rate = 20)
+def find_parents(terms, ont_id, save_terms = True, output_dir = '', n_workers = 8, rate = 10, max_retries = 5, retry_budget = 1000):
     nodes = []
     anc = []
     roots = []
-    counter = 0
+    failed = []
 
-    with progressbar.ProgressBar(max_value = len(terms), initial_value=0) as bar:
-        for idx, row in terms.iterrows():
-        # try:
-        #     parent_url = term['_links']['hierarchicalParents']['href']
-        # except KeyError:  # there's no children for this one
-        #     continue
-            if((row.parent_url != "") & (pd.notnull(row.parent_url))):
-                try:
-                    response = get_data(row.parent_url)
-                except:
-                    print('\n index: ' + str(idx) + ' (counter: ' + str(counter) + ')')
-                    print('server overloaded; waiting 2 min. and caching results')
-                    temp = pd.DataFrame([nodes, anc, roots], index = ['id', 'ancestor_id', 'is_root']).T
-                    temp.to_csv(output_dir + str(pd.Timestamp.today().strftime('%F')) + '_' + ont_id + '_parents_TEMPidx' + str(counter) + '.tsv', sep='\t')
-                    time.sleep(120)
-                    response = get_data(row.parent_url)
-
-                iter_terms = _term_gen(response)
-                for parent_term in iter_terms:
-                    nodes.append(idx)
-                    anc.append(parent_term['obo_id'])
-                    roots.append(parent_term['is_root'])
-                        # yield term['obo_id'], parent_term['obo_id'], parent_term['is_root']
-            counter += 1
-            if (counter % 5 == 0):
-                bar.update(counter)
+    # only terms that have a parent to look up
+    has_parent = (terms.parent_url != "") & (pd.notnull(terms.parent_url))
+    to_pull = terms.loc[has_parent, 'parent_url']
+
+    bucket = TokenBucket(rate)
+    budget = {'remaining': retry_budget, 'lock': threading.Lock()} if retry_budget is not None else None
+
+    def pull_parents(url):
+        return get_data_retry(url, bucket = bucket, max_retries = max_retries, retry_budget = budget)
+
+    with ThreadPoolExecutor(max_workers = n_workers) as executor:
+        with progressbar.ProgressBar(max_value = len(to_pull), initial_value=0) as bar:
+            # results come back in the same order as the terms
+            for counter, (idx, response) in enumerate(zip(to_pull.index, executor.map(pull_parents, to_pull))):
+                if(response is None):
+                    failed.append(idx)
+                else:
+                    iter_terms = _term_gen(response)
+                    for parent_term in iter_terms:
+                        nodes.append(idx)
+                        anc.append(parent_term['obo_id'])
+                        roots.append(parent_term['is_root'])
+                if (counter % 5 == 0):
+                    bar.update(counter)
 
     # combine into a dataframe; set ancestor level to 0
     parents = pd.DataFrame([nodes, anc, roots], index = ['id', 'ancestor_id', 'is_root']).T
 
+    if(len(failed) > 0):
+        warnings.warn(str(len(failed)) + ' terms failed to return parents; dropped from ' + ont_id + ' parents')
+
     if (save_terms):
         parents.to_csv(output_dir + str(pd.Timestamp.today().strftime('%F')) + '_' + ont_id + '_parents.tsv', sep='\t')
+        if(len(failed) > 0):
+            pd.Series(failed, name = 'id').to_csv(output_dir + str(pd.Timestamp.today().strftime('%F')) + '_' + ont_id + '_parents_failed.tsv', sep='\t')
 
     return parents
 
-# <<< find_nextgen() >>>
-# @name:
-# @title:
-# @description:
-# @NOTE: lots of permutations of this funciton were written. One of the main sticking points was
-# whether to concat a DataFrame in each iteration of the loop, or whether to save each variable in
-# a separate list. While both work (or should, in principle), using a DataFrame means that the output
-# variable needs to be declared as a global, or else during the recursion results will be saved over/lost.
-# For simplicity, then, passing everything as lists and converting later.
-# @input:
-# @output:
-# @example:
-# outer function to pull an ancestor for a specific ID
-def find_ancestors_1node(parent_df, id, reverse = True, return_paths = False):
-    root_ids = set(parent_df.ancestor_id[parent_df.is_root == True])
-
-# << find_nextgen() >> # helper function to recurse through the parent ids and ID all the ancestors.
-# variation on https://www.python.org/doc/essays/graphs/
-    def find_nextgen(parent_df, child_id, root_ids, path = [], paths = []):
-        # update the path with the current search param
-        # path will reset after every loop
-        path = path + [child_id]
-
-        if(child_id in root_ids):
-            # have hit the root node
-            paths.append(path)
-            return path
-
-        # find the id(s) of the parent of child_id
-        parent_row = parent_df[parent_df.id == child_id]
-
-                # -- recurse --
-        for idx, row in parent_row.iterrows():
-            find_nextgen(parent_df, row.ancestor_id, root_ids, path, paths)
-        return paths
-
-    # << reset_level(paths, reverse) >> : helper function to standardize indices
-    # resets level indices so 0 is the root nodes
-    def reset_level(paths, reverse):
-        path_dict = {}
-        for idx, path in enumerate(paths):
-            # reverse the list, so the root is at 0
-            if(reverse):
-                path.reverse()
-            for ont_idx, ont_id in enumerate(path):
-                # update dictionary
-                if ont_idx in path_dict:
-                    # dictionary already has that value; append if it doesn't already exist within list
-                    if ont_id not in path_dict[ont_idx]:
-                        path_dict[ont_idx].append(ont_id)
-                else:
-                    path_dict[ont_idx] = [ont_id]
-        return path_dict
+# <<< build_parent_index(parent_df) >>>
+# @name:        build_parent_index
+# @title:       compile the parents table into an integer-coded adjacency index
+# @description: every id (child or ancestor) gets an integer code; the parents of each code are stored CSR-style:
+#               the parents of node `i` are `indices[indptr[i]:indptr[i+1]]`, in the same order as their rows in `parent_df`.
+#               Built once per ontology, so walking up the tree is an array slice rather than a scan of the whole parents table.
+#               Edges w/ a missing ancestor_id are dropped, since they're dead ends anyway.
+# @input:       *parent_df*: output of `find_parents` (id, ancestor_id, is_root)
+# @output:      dict containing:
+#               *ids*: array of ids, indexed by code
+#               *codes*: dict of id: code
+#               *indptr*, *indices*: CSR arrays of parent codes
+#               *is_root*: boolean array, True if the node is a root (stops the walk up the tree)
+# @example:     parent_idx = build_parent_index(parent_df)
+def build_parent_index(parent_df):
+    edges = parent_df.loc[pd.notnull(parent_df.ancestor_id), ['id', 'ancestor_id']]
+
+    ids = pd.unique(np.concatenate([parent_df.id.values.astype(object), edges.ancestor_id.values.astype(object)]))
+    codes = {node_id: code for code, node_id in enumerate(ids)}
+
+    child = edges.id.map(codes).values.astype(np.int64)
+    parent = edges.ancestor_id.map(codes).values.astype(np.int64)
+
+    # stable sort keeps the parents of each node in their original row order
+    order = np.argsort(child, kind = 'stable')
+    indices = parent[order]
+    indptr = np.zeros(len(ids) + 1, dtype = np.int64)
+    np.cumsum(np.bincount(child, minlength = len(ids)), out = indptr[1:])
+
+    is_root = np.zeros(len(ids), dtype = bool)
+    root_ids = pd.unique(parent_df.ancestor_id[parent_df.is_root == True])
+    is_root[[codes[root_id] for root_id in root_ids if root_id in codes]] = True
+
+    return {'ids': ids, 'codes': codes, 'indptr': indptr, 'indices': indices, 'is_root': is_root}
+
+# <<< ancestor_dag(parent_idx, id) >>>
+# @name:        ancestor_dag
+# @title:       the part of the ontology above a single term, plus the number of paths to the root(s)
+# @description: walks up from *id* (stopping at roots) w/o enumerating any paths. Stores, for each ancestor, the number of paths from it up to a root;
+#               ancestors w/ 0 paths are dead ends (e.g. their own parent was filtered out upstream) and are skipped when generating paths.
+#               Deep multi-parent terms can have exponentially many paths; this stays linear in the number of ancestors.
+# @input:       *parent_idx*: output of `build_parent_index`; *id*: term id
+# @output:      dict containing:
+#               *start*: code for *id* (None if the id isn't in the index)
+#               *order*: codes of all the ancestors (incl. *id*), parents before children
+#               *n_paths*: {code: number of paths to a root}
+#               *cycle*: True if a cycle was found above *id*; if so, everything else is empty
+# @example:     dag = ancestor_dag(build_parent_index(parent_df), 'CHEBI:64709'); dag['n_paths'][dag['start']]
+def ancestor_dag(parent_idx, id):
+    indptr = parent_idx['indptr']
+    indices = parent_idx['indices']
+    is_root = parent_idx['is_root']
+
+    if(id not in parent_idx['codes']):
+        return {'start': None, 'order': [], 'n_paths': {}, 'cycle': False}
+    start = parent_idx['codes'][id]
+
+    # iterative depth-first search; post-order gives parents before children
+    order = []
+    n_paths = {}
+    on_stack = {start}
+    stack = [(start, 0)]
+    while(stack):
+        node, pos = stack[-1]
+        n_parents = 0 if is_root[node] else indptr[node + 1] - indptr[node]
+        if(pos < n_parents):
+            stack[-1] = (node, pos + 1)
+            par = indices[indptr[node] + pos]
+            if(par in on_stack):
+                return {'start': start, 'order': [], 'n_paths': {}, 'cycle': True}
+            if(par not in n_paths):
+                on_stack.add(par)
+                stack.append((par, 0))
+        else:
+            stack.pop()
+            on_stack.discard(node)
+            if(is_root[node]):
+                n_paths[node] = 1
+            else:
+                n_paths[node] = sum(n_paths[par] for par in indices[indptr[node]:indptr[node + 1]])
+            order.append(node)
+
+    return {'start': start, 'order': order, 'n_paths': n_paths, 'cycle': False}
+
+# <<< iter_paths(parent_idx, id, reverse = True, max_paths = None, sample = None, seed = None) >>>
+# @name:        iter_paths
+# @title:       lazily generate the root-to-term paths for a single term
+# @description: yields one path (list of ids) at a time, in the same order the old recursive search built its `paths` list, so nothing is held in memory.
+#               *max_paths*: stop after this many paths
+#               *sample*: instead, draw this many paths uniformly at random (w/ replacement), using the path counts from `ancestor_dag` to weight each step
+#               *reverse*: if True, paths run root --> term; otherwise term --> root
+# @example:     next(iter_paths(parent_idx, 'CHEBI:64709'))
+#               list(iter_paths(parent_idx, 'CHEBI:64709', sample = 10, seed = 25))
+def iter_paths(parent_idx, id, reverse = True, max_paths = None, sample = None, seed = None, dag = None):
+    ids = parent_idx['ids']
+    indptr = parent_idx['indptr']
+    indices = parent_idx['indices']
+    is_root = parent_idx['is_root']
+
+    if(dag is None):
+        dag = ancestor_dag(parent_idx, id)
+    n_paths = dag['n_paths']
+    if((dag['start'] is None) or (n_paths.get(dag['start'], 0) == 0)):
+        return
+
+    def live_parents(node):
+        return [par for par in indices[indptr[node]:indptr[node + 1]] if n_paths[par] > 0]
 
-    # Calculate path
-    paths = find_nextgen(parent_df, id, root_ids)
-    ont_idx = reset_level(paths, reverse)
+    def finish(path):
+        path = [ids[node] for node in path]
+        if(reverse):
+            path.reverse()
+        return path
+
+    if(sample is not None):
+        rng = np.random.default_rng(seed)
+        for counter in range(sample):
+            node = dag['start']
+            path = [node]
+            while(not is_root[node]):
+                parents = live_parents(node)
+                weights = np.array([n_paths[par] for par in parents], dtype = float)
+                node = parents[rng.choice(len(parents), p = weights / weights.sum())]
+                path.append(node)
+            yield finish(path)
+        return
+
+    counter = 0
+    path = [dag['start']]
+    stack = [live_parents(dag['start']) if not is_root[dag['start']] else []]
+    if(is_root[dag['start']]):
+        yield finish(path)
+        return
+    while(stack):
+        if(len(stack[-1]) == 0):
+            stack.pop()
+            path.pop()
+            continue
+        node = stack[-1].pop(0)
+        path.append(node)
+        if(is_root[node]):
+            yield finish(path)
+            counter += 1
+            if((max_paths is not None) and (counter >= max_paths)):
+                return
+            path.pop()
+        else:
+            stack.append(live_parents(node))
+
+# <<< _merge_levels(node, parent_idx, n_paths, depths, levels) >>>
+# dynamic programming step for the root --> term levels: builds a node's {level: {id: first path index}} from its parents'.
+# Paths are numbered in the order the recursive search finds them, so a parent's path indices are offset by the paths through the earlier parents.
+# Shared by `find_ancestors_1node` and `find_levels`; fills in *depths* and *levels* for *node* and returns its path count.
+def _merge_levels(node, parent_idx, n_paths, depths, levels):
+    ids = parent_idx['ids']
+    indptr = parent_idx['indptr']
+    indices = parent_idx['indices']
+    node_id = ids[node]
+
+    if(parent_idx['is_root'][node]):
+        depths[node] = {0: 0}
+        levels[node] = {0: {node_id: 0}}
+        return 1
+
+    node_depths = {}
+    node_levels = {}
+    offset = 0
+    for par in indices[indptr[node]:indptr[node + 1]]:
+        if(n_paths.get(par, 0) == 0):
+            continue
+        for depth, first in depths[par].items():
+            if((depth + 1) not in node_depths):
+                node_depths[depth + 1] = offset + first
+        for level, level_ids in levels[par].items():
+            node_level = node_levels.setdefault(level, {})
+            for anc_id, first in level_ids.items():
+                if(anc_id not in node_level):
+                    node_level[anc_id] = offset + first
+        offset += n_paths[par]
+
+    for depth, first in node_depths.items():
+        node_levels.setdefault(depth, {})[node_id] = first
+
+    depths[node] = node_depths
+    levels[node] = node_levels
+    return offset
+
+# converts {level: {id: first path index}} to the {level: [ids]} output format
+def _order_levels(node_levels):
+    return {level: sorted(level_ids, key = level_ids.get) for level, level_ids in sorted(node_levels.items())}
+
+# <<< find_ancestors_1node() >>>
+# @name:        find_ancestors_1node
+# @title:       hierarchical levels of all the ancestors of a single term
+# @description: originally a recursive search that built every root-to-term path as a list and then read the levels off of them.
+#               That blows up for deep multi-parent terms (e.g. the CHEBI chains within FBcv), so the levels are now calculated directly
+#               on the ancestor sub-graph (`ancestor_dag`), and the paths themselves are only generated on request, lazily (`iter_paths`).
+#               Output is the same as the recursive version: {level: [ids]}, w/ the ids in each level in the order they were first found.
+# @input:       *parent_df*: either the parents dataframe or (faster, if calling many times) its `build_parent_index`
+#               *reverse*: if True, level 0 is the root(s); otherwise level 0 is the term itself
+#               *return_paths*: if True, also returns the number of paths and a generator over them; *max_paths*/*sample_paths* are passed on to `iter_paths`
+# @output:      {level: [ids]}; or, if *return_paths*, dict w/ *ont_idx*, *n_paths*, and *paths* (generator)
+# @example:     find_ancestors_1node(parent_df, 'CHEBI:64709')
+#               list(find_ancestors_1node(parent_df, 'CHEBI:64709', return_paths = True, max_paths = 5)['paths'])
+def find_ancestors_1node(parent_df, id, reverse = True, return_paths = False, max_paths = None, sample_paths = None):
+    if(isinstance(parent_df, pd.DataFrame)):
+        parent_idx = build_parent_index(parent_df)
+    else:
+        parent_idx = parent_df
+
+    ids = parent_idx['ids']
+    indptr = parent_idx['indptr']
+    indices = parent_idx['indices']
+    is_root = parent_idx['is_root']
+
+    dag = ancestor_dag(parent_idx, id)
+    n_paths = dag['n_paths']
+    if(dag['cycle']):
+        warnings.warn('cycle found above ' + str(id) + '; returning no ancestors')
+
+    if(n_paths.get(dag['start'], 0) == 0):
+        ont_idx = {}
+    elif(reverse):
+        # root --> term: levels depend on the length of each path, so build up from the roots
+        depths = {}
+        levels = {}
+        for node in dag['order']:
+            if(n_paths[node] > 0):
+                _merge_levels(node, parent_idx, n_paths, depths, levels)
+        ont_idx = _order_levels(levels[dag['start']])
+    else:
+        # term --> root: level is the number of steps up from the term, so push down from the term
+        first = {dag['start']: {0: 0}}
+        for node in reversed(dag['order']):
+            if((node not in first) or is_root[node]):
+                continue
+            offset = 0
+            for par in indices[indptr[node]:indptr[node + 1]]:
+                if(n_paths[par] == 0):
+                    continue
+                par_first = first.setdefault(par, {})
+                for level, path_idx in first[node].items():
+                    if(((level + 1) not in par_first) or (path_idx + offset < par_first[level + 1])):
+                        par_first[level + 1] = path_idx + offset
+                offset += n_paths[par]
+        levels = {}
+        for node, node_first in first.items():
+            for level, path_idx in node_first.items():
+                levels.setdefault(level, {})[ids[node]] = path_idx
+        ont_idx = _order_levels(levels)
 
     if (return_paths):
-        return {'paths': paths, 'ont_idx': ont_idx}
+        paths = iter_paths(parent_idx, id, reverse = reverse, max_paths = max_paths, sample = sample_paths, dag = dag)
+        return {'paths': paths, 'n_paths': n_paths.get(dag['start'], 0), 'ont_idx': ont_idx}
     else:
         return ont_idx
 
 # @NOTE:    certain high level nodes have an NA id. These were filtered out upstream.
 #           As a result, any descendants of this node will have NA ancestors; assuming these ont terms aren't particularly impt.
 #           Return value for ancestors will be NA
-def find_ancestors(parent_df, ont_id = '', save_terms = True, output_dir = '', ids = [], reverse = True, return_paths = False, save_freq = 1000, start_idx = None):
-    # container for output
-    output = pd.DataFrame()
-
+#           With *return_paths*, the number of root-to-term paths is stored (`n_paths`) rather than the paths themselves;
+#           use `iter_paths` to generate them.
+#           Results are written out in chunks of *save_freq* terms to an append-only journal (`journal_file`), so memory stays flat
+#           and an interrupted run can pick up where it left off: w/ *resume*, the ids already in the journal are skipped.
+#           A journal is only resumed by a run w/ the same parents, ids, *reverse* and *return_paths* (`journal_params`);
+#           any other journal for the ontology is deleted and the run starts over.
+#           Once every id is done, the journal is converted to the usual `_ancestors.tsv` file and removed.
+#           The full builds (`ont_dict.build_ont`) use `find_ancestors_batch` instead, which is a single pass w/ no journal;
+#           this is for long per-term runs, e.g. w/ *return_paths* or on a subset of *ids*.
+#           *return_output*: if False, returns the path to the ancestors file rather than reading it back in (needs *save_terms*).
+#           Otherwise the file is read back in w/ the *ancestors* parsed back into dicts (`parse_ancestors`).
+def find_ancestors(parent_df, ont_id = '', save_terms = True, output_dir = '', ids = [], reverse = True, return_paths = False, save_freq = 1000, resume = True, return_output = True):
     # ids is an optional testing parameter; if not declared, will look for all the ids.
     # Remove duplicate ids; some ids have multiple parents, therefore need to keep in parent_df.
     # However, including them the entire time will add unnecessary calculations of the same paths.
     if(len(ids) == 0):
         ids = pd.unique(parent_df.id)
-
-        if(start_idx is not None):
-            ids = ids[start_idx+1:]
     elif(isinstance(ids, pd.Series)):
         # convert series to Numpy ndarray
-        ids = ids.as_matrix()
+        ids = ids.values
+
+    if(save_terms):
+        params = journal_params(parent_df, ids, reverse, return_paths)
+        journal = journal_file(ont_id, output_dir, params)
+        # journals from runs w/ different parameters can't be mixed in
+        remove_journals(ont_id, output_dir, keep = journal if resume else None)
+        if(resume):
+            done = read_journal_ids(journal)
+            if(len(done) > 0):
+                print('resuming from journal: ' + str(len(done)) + ' terms already done')
+                ids = np.array([node_id for node_id in ids if node_id not in done], dtype = object)
+        write_journal_params(journal, params)
+
+    # compile the parents table once, rather than scanning it on every step
+    parent_idx = build_parent_index(parent_df)
+
+    # container for the current chunk; chunks are either appended to the journal or (if not saving) kept until the end
+    chunk = []
+    chunks = []
+
+    def flush(chunk):
+        chunk = pd.DataFrame(chunk, columns = ['id', 'ancestors', 'n_paths', 'node_level'] if return_paths else ['id', 'ancestors', 'node_level'])
+        if(save_terms):
+            append_journal(chunk, journal)
+        else:
+            chunks.append(chunk)
 
     with progressbar.ProgressBar(max_value = len(ids)) as bar:
         for idx, node_id in np.ndenumerate(ids):
-            ancestors = find_ancestors_1node(parent_df, id = node_id, reverse = reverse, return_paths = return_paths)
+            ancestors = find_ancestors_1node(parent_idx, id = node_id, reverse = reverse, return_paths = return_paths)
 
             # make sure ancestors returned something. If an ancestor has no unique ID, it was filtered out; return NA
             if(return_paths):
                 if(len(ancestors['ont_idx']) > 0):
-                    output = pd.concat([output, pd.DataFrame({'id': node_id, 'ancestors': [ancestors['ont_idx']], 'paths': [ancestors['paths']], 'node_level': max(ancestors['ont_idx'].keys())})], ignore_index=True)
+                    chunk.append((node_id, ancestors['ont_idx'], ancestors['n_paths'], max(ancestors['ont_idx'].keys())))
                 else:
-                    output = pd.concat([output, pd.DataFrame({'id': node_id, 'ancestors': [np.NaN], 'paths': [np.NaN], 'node_level': [np.NaN]})], ignore_index=True)
+                    chunk.append((node_id, np.nan, np.nan, np.nan))
             else:
                 if(len(ancestors) > 0):
-                    output = pd.concat([output, pd.DataFrame({'id': node_id, 'ancestors': [ancestors], 'node_level': max(ancestors.keys())})], ignore_index=True)
+                    chunk.append((node_id, ancestors, max(ancestors.keys())))
                 else:
-                    output = pd.concat([output, pd.DataFrame({'id': node_id, 'ancestors': [np.NaN], 'node_level': [np.NaN]})], ignore_index=True)
+                    chunk.append((node_id, np.nan, np.nan))
 
             if (idx[0] % 10 == 0):
                 bar.update(idx[0])
 
-            if ((idx[0] > 0) & (idx[0] % save_freq == 0)):
-                output.to_csv(output_dir + str(pd.Timestamp.today().strftime('%F')) + '_' + ont_id + '_ancestors' + '_TEMPidx' + str(idx[0]) + '.tsv', sep='\t')
+            if (len(chunk) >= save_freq):
+                flush(chunk)
+                chunk = []
+
+    if(len(chunk) > 0):
+        flush(chunk)
 
     if (save_terms):
-        if(start_idx is not None):
-            output.to_csv(output_dir + str(pd.Timestamp.today().strftime('%F')) + '_' + ont_id + '_ancestors.tsv', sep='\t')
+        out_file = output_dir + str(pd.Timestamp.today().strftime('%F')) + '_' + ont_id + '_ancestors.tsv'
+        finish_journal(journal, out_file)
+        if(not return_output):
+            return out_file
+        output = pd.read_csv(out_file, sep='\t', index_col=0)
+        output['ancestors'] = parse_ancestors(output.ancestors)
+        return output
+
+    if(len(chunks) == 0):
+        return pd.DataFrame()
+    return pd.concat(chunks, ignore_index=True)
+
+# <<< journal_params(parent_df, ids, reverse, return_paths) >>>
+# everything a journal's rows depend on: hashes of the parents table + the ids, and the *reverse*/*return_paths* flags
+def journal_params(parent_df, ids, reverse, return_paths):
+    parents_hash = hashlib.sha256(pd.util.hash_pandas_object(parent_df.astype(str), index = False).values.tobytes()).hexdigest()
+    ids_hash = hashlib.sha256(pd.util.hash_pandas_object(pd.Series(ids, dtype = object).astype(str), index = False).values.tobytes()).hexdigest()
+    return {'parents': parents_hash, 'ids': ids_hash, 'reverse': bool(reverse), 'return_paths': bool(return_paths)}
+
+# <<< journal_file(ont_id, output_dir, params = None) >>>
+# location of the in-progress ancestors journal for an ontology; w/ *params* (`journal_params`), named after a hash of them,
+# so runs w/ different parents/ids/flags never share a journal. The params themselves go in a .json sidecar next to it.
+# NOTE: named so it doesn't match `ont_id + '_ancestors'`, and so isn't picked up as a finished ancestors file.
+def journal_file(ont_id, output_dir = '', params = None):
+    if(params is None):
+        return output_dir + ont_id + '_journal-ancestors.tsv'
+    key = hashlib.sha256(json.dumps(params, sort_keys = True).encode('utf-8')).hexdigest()[:16]
+    return output_dir + ont_id + '_journal-ancestors-' + key + '.tsv'
+
+def write_journal_params(journal, params):
+    with open(journal + '.json', 'w') as f:
+        json.dump(params, f, sort_keys = True)
+
+# <<< remove_journals(ont_id, output_dir, keep = None) >>>
+# deletes every ancestors journal (+ sidecar) for the ontology except *keep*; a *keep* whose sidecar doesn't match its name is deleted too
+def remove_journals(ont_id, output_dir = '', keep = None):
+    for file_name in glob.glob(glob.escape(output_dir + ont_id) + '_journal-ancestors*'):
+        journal = file_name[:-len('.json')] if file_name.endswith('.json') else file_name
+        if((journal == keep) and os.path.exists(keep + '.json') and os.path.exists(keep)):
+            continue
+        os.remove(file_name)
+
+# <<< append_journal(chunk, journal) >>>
+# appends a chunk of finished terms to the journal; flushed + synced so a crash loses at most the chunk being written
+def append_journal(chunk, journal):
+    new_file = not os.path.exists(journal)
+    with open(journal, 'a') as f:
+        chunk.to_csv(f, sep='\t', index=False, header=new_file)
+        f.flush()
+        os.fsync(f.fileno())
+
+# <<< read_journal_ids(journal) >>>
+# set of ids already in the journal. Any partly written last line (from a crash mid-write) is cut off first.
+def read_journal_ids(journal):
+    if(not os.path.exists(journal)):
+        return set()
+
+    with open(journal, 'rb+') as f:
+        contents = f.read()
+        last_line = contents.rfind(b'\n')
+        if(last_line < len(contents) - 1):
+            f.truncate(last_line + 1)
+
+    if(os.path.getsize(journal) == 0):
+        os.remove(journal)
+        return set()
+    return set(pd.read_csv(journal, sep='\t', usecols=['id']).id)
+
+# <<< finish_journal(journal, out_file, chunksize = 10000) >>>
+# converts the journal into the final ancestors file (w/ a row index, like the rest of the dataout files), one chunk at a time, then removes the journal
+def finish_journal(journal, out_file, chunksize = 10000):
+    with open(out_file, 'w') as f:
+        if(os.path.exists(journal)):
+            row = 0
+            for counter, chunk in enumerate(pd.read_csv(journal, sep='\t', chunksize=chunksize)):
+                chunk.index = range(row, row + len(chunk))
+                chunk.to_csv(f, sep='\t', header=(counter == 0))
+                row += len(chunk)
+            os.remove(journal)
+    if(os.path.exists(journal + '.json')):
+        os.remove(journal + '.json')
+
+
+# <<< build_child_index(parent_idx) >>>
+# reverse of `build_parent_index`: the children of node `i` are `indices[indptr[i]:indptr[i+1]]`.
+# Roots stop the walk up the tree, so edges from a root up to its own parents are left out.
+def build_child_index(parent_idx):
+    indptr = parent_idx['indptr']
+    is_root = parent_idx['is_root']
+    n_nodes = len(parent_idx['ids'])
+
+    n_parents = np.diff(indptr)
+    keep = np.repeat(~is_root, n_parents)
+    child = np.repeat(np.arange(n_nodes), n_parents)[keep]
+    parent = parent_idx['indices'][keep]
+
+    order = np.argsort(parent, kind = 'stable')
+    child_ptr = np.zeros(n_nodes + 1, dtype = np.int64)
+    np.cumsum(np.bincount(parent, minlength = n_nodes), out = child_ptr[1:])
+
+    return {'indptr': child_ptr, 'indices': child[order]}
+
+# <<< find_descendants(parent_idx, codes, child_idx = None) >>>
+# codes of every node below (and including) *codes*, by a breadth-first search down the `build_child_index`
+def find_descendants(parent_idx, codes, child_idx = None):
+    if(child_idx is None):
+        child_idx = build_child_index(parent_idx)
+    child_ptr = child_idx['indptr']
+    children = child_idx['indices']
+
+    seen = np.zeros(len(parent_idx['ids']), dtype = bool)
+    frontier = np.unique(np.asarray(codes, dtype = np.int64))
+    seen[frontier] = True
+    while(len(frontier) > 0):
+        kids = np.concatenate([children[child_ptr[node]:child_ptr[node + 1]] for node in frontier])
+        frontier = np.unique(kids[~seen[kids]])
+        seen[frontier] = True
+    return np.flatnonzero(seen)
+
+# <<< topo_order(parent_idx) >>>
+# @name:        topo_order
+# @title:       order the nodes so every node comes after all of its parents
+# @description: Kahn's algorithm over the `build_parent_index` arrays. Roots stop the walk up the tree, so any parents of a root are ignored.
+#               Nodes that never become ready are in (or hang below) a cycle; the recursive `find_ancestors_1node` would loop forever on these.
+#               To report just the cycles themselves, the leftovers are trimmed of any node with no children also left over.
+# @output:      dict containing:
+#               *order*: array of codes, parents first
+#               *cycle_ids*: ids of the nodes on a cycle (or on a path between two cycles)
+#               *blocked*: boolean array; True if the node couldn't be ordered because of a cycle above it
+def topo_order(parent_idx):
+    indptr = parent_idx['indptr']
+    indices = parent_idx['indices']
+    is_root = parent_idx['is_root']
+    n_nodes = len(parent_idx['ids'])
+
+    # roots stop the recursion; drop their outgoing edges
+    n_parents = np.diff(indptr)
+    n_parents[is_root] = 0
+    child = np.repeat(np.arange(n_nodes), n_parents)
+    keep = np.repeat(~is_root, np.diff(indptr))
+    parent = indices[keep]
+
+    # reverse adjacency: children of each node
+    child_idx = build_child_index(parent_idx)
+    children = child_idx['indices']
+    child_ptr = child_idx['indptr']
+
+    remaining = n_parents.copy()
+    queue = list(np.flatnonzero(remaining == 0))
+    topo = []
+    while(queue):
+        node = queue.pop()
+        topo.append(node)
+        for kid in children[child_ptr[node]:child_ptr[node + 1]]:
+            remaining[kid] -= 1
+            if(remaining[kid] == 0):
+                queue.append(kid)
+
+    blocked = remaining > 0
+
+    # trim the nodes that only hang below a cycle
+    in_cycle = blocked.copy()
+    n_kids = np.bincount(parent[in_cycle[child] & in_cycle[parent]], minlength = n_nodes)
+    leaves = list(np.flatnonzero(in_cycle & (n_kids == 0)))
+    while(leaves):
+        node = leaves.pop()
+        in_cycle[node] = False
+        for par in indices[indptr[node]:indptr[node + 1]]:
+            if(in_cycle[par]):
+                n_kids[par] -= 1
+                if(n_kids[par] == 0):
+                    leaves.append(par)
+
+    return {'order': np.array(topo, dtype = np.int64), 'cycle_ids': list(parent_idx['ids'][in_cycle]), 'blocked': blocked}
+
+# <<< find_levels(parent_df) >>>
+# @name:        find_levels
+# @title:       ancestor levels for every term in an ontology, in a single pass
+# @description: batch version of calling `find_ancestors_1node` on every id. Rather than re-walking the shared upper part of the tree for every descendant,
+#               nodes are visited in topological order (parents first) and each node's result is built from its parents' (memoized) results.
+#               For each node, keeps:
+#                   *n_paths*: number of root-to-node paths
+#                   *depths*: {path length: index of the first path w/ that length}
+#                   *levels*: {level: {ancestor id: index of the first path w/ that ancestor at that level}}
+#               Paths are numbered in the same order the recursive search finds them (parents in row order), so sorting each level by
+#               first path index gives back exactly the same `{level: [ids]}` dicts as `find_ancestors_1node(..., reverse = True)`.
+#               Cycles are reported w/ a warning; any term in or below a cycle gets NA ancestors.
+# @input:       *parent_df*: parents dataframe or its `build_parent_index`
+# @output:      dict containing:
+#               *ancestors*: {id: {level: [ancestor ids]}}; {} if the node doesn't reach a root
+#               *node_level*: array of the deepest level per code (NaN if no path to a root)
+#               *cycle_ids*: see `topo_order`
+# @example:     levels = find_levels(parent_df); levels['ancestors']['GO:0005230']
+def find_levels(parent_df):
+    if(isinstance(parent_df, pd.DataFrame)):
+        parent_idx = build_parent_index(parent_df)
+    else:
+        parent_idx = parent_df
+
+    ids = parent_idx['ids']
+    topo = topo_order(parent_idx)
+    if(len(topo['cycle_ids']) > 0):
+        warnings.warn('cycle found in parents; ' + str(int(topo['blocked'].sum())) + ' terms in or below a cycle will have NA ancestors. Cycle ids: ' + ', '.join(map(str, topo['cycle_ids'])))
+
+    n_paths = {}
+    depths = {}
+    levels = {}
+    for node in topo['order']:
+        n_paths[node] = _merge_levels(node, parent_idx, n_paths, depths, levels)
+
+    ancestors = {}
+    node_level = np.full(len(ids), np.nan)
+    for node in range(len(ids)):
+        if(n_paths.get(node, 0) == 0):
+            ancestors[ids[node]] = {}
+            continue
+        ancestors[ids[node]] = _order_levels(levels[node])
+        node_level[node] = max(levels[node])
+
+    return {'ancestors': ancestors, 'node_level': node_level, 'cycle_ids': topo['cycle_ids']}
+
+# <<< find_ancestors_batch(parent_df, ...) >>>
+# Same output as `find_ancestors(..., reverse = True, return_paths = False)`, computed in one pass w/ `find_levels`.
+# Saved as a long-format Parquet file (see `save_ancestors`); set *file_format* = 'tsv' for the old stringified-dict file.
+# @example:     ancestor = find_ancestors_batch(parent_df, ont_id = 'go', output_dir = output_dir)
+def find_ancestors_batch(parent_df, ont_id = '', save_terms = True, output_dir = '', ids = [], file_format = 'parquet'):
+    if(len(ids) == 0):
+        ids = pd.unique(parent_df.id)
+
+    levels = find_levels(parent_df)['ancestors']
+
+    node_ancestors = [levels.get(node_id, {}) for node_id in ids]
+    output = pd.DataFrame({'id': ids,
+        'ancestors': [ancestors if len(ancestors) > 0 else np.nan for ancestors in node_ancestors],
+        'node_level': [max(ancestors.keys()) if len(ancestors) > 0 else np.nan for ancestors in node_ancestors]})
+
+    if (save_terms):
+        if(file_format == 'parquet'):
+            save_ancestors(output, ont_id, output_dir)
         else:
-            output.to_csv(output_dir + str(pd.Timestamp.today().strftime('%F')) + '_' + ont_id + '_ancestors_idx' + str(start_idx) + '.tsv', sep='\t')
+            output.to_csv(output_dir + str(pd.Timestamp.today().strftime('%F')) + '_' + ont_id + '_ancestors.tsv', sep='\t')
 
     return output
 
+# <<< update_ancestors(old_parents, old_ancestors, new_parents, old_terms = None, new_terms = None) >>>
+# @name:        update_ancestors
+# @title:       incremental refresh of the ancestor levels for a new version of an ontology
+# @description: rather than recalculating every term, diffs the old and new parents tables and only recomputes the terms whose levels could have changed:
+#                   - terms w/ added or removed parent edges (incl. a parent whose is_root flag flipped), and new terms
+#                   - everything below those terms, found by walking down the reverse adjacency (`find_descendants`) of the new tree
+#               Everything else is copied over from *old_ancestors*.
+#               If *old_terms*/*new_terms* are given, also reports the terms added, removed, or relabeled.
+# @input:       *old_parents*, *new_parents*: parents tables (id, ancestor_id, is_root); *old_ancestors*: wide ancestors frame for *old_parents* (`read_ancestors`)
+# @output:      dict containing:
+#               *ancestors*: updated wide ancestors frame (id, ancestors, node_level), in the same order as `find_ancestors_batch(new_parents)`
+#               *changes*: dataframe of (id, change) for every term that changed, w/ change one of
+#                           'term added', 'term removed', 'term relabeled', 'parents changed', 'ancestors recomputed'
+#               *n_recomputed*: number of terms recomputed
+# @example:     update = update_ancestors(old_parents, read_ancestors(old_file), new_parents)
+def update_ancestors(old_parents, old_ancestors, new_parents, old_terms = None, new_terms = None):
+    changes = []
+
+    # -- diff the edges --
+    def edge_set(parent_df):
+        return set(zip(parent_df.id, parent_df.ancestor_id, parent_df.is_root.astype(bool)))
+    diff_edges = edge_set(old_parents) ^ edge_set(new_parents)
+    edge_changed = set(edge[0] for edge in diff_edges)
+
+    old_ids = set(old_ancestors.id)
+    new_ids = pd.unique(new_parents.id)
+    added = [node_id for node_id in new_ids if node_id not in old_ids]
+    removed = old_ids - set(new_ids)
+
+    # -- diff the terms --
+    if((old_terms is not None) and (new_terms is not None)):
+        old_term = old_terms.set_index('id') if 'id' in old_terms.columns else old_terms
+        new_term = new_terms.set_index('id') if 'id' in new_terms.columns else new_terms
+        changes += [(node_id, 'term added') for node_id in new_term.index.difference(old_term.index)]
+        changes += [(node_id, 'term removed') for node_id in old_term.index.difference(new_term.index)]
+        shared = old_term.index.intersection(new_term.index)
+        relabeled = old_term.loc[shared, 'label'].fillna('') != new_term.loc[shared, 'label'].fillna('')
+        changes += [(node_id, 'term relabeled') for node_id in shared[relabeled.values]]
+
+    # -- find everything affected --
+    parent_idx = build_parent_index(new_parents)
+    codes = parent_idx['codes']
+    seeds = [codes[node_id] for node_id in set(added) | edge_changed if node_id in codes]
+    affected = set(parent_idx['ids'][find_descendants(parent_idx, seeds)]) if len(seeds) > 0 else set()
+
+    changes += [(node_id, 'parents changed') for node_id in sorted(edge_changed)]
+    changes += [(node_id, 'ancestors recomputed') for node_id in sorted(affected - edge_changed)]
+
+    # -- recompute just those terms, walking only their part of the tree --
+    recomputed = {}
+    for node_id in affected:
+        recomputed[node_id] = find_ancestors_1node(parent_idx, node_id)
+
+    kept = old_ancestors[~old_ancestors.id.isin(affected | removed)].set_index('id')
+    ancestors = []
+    node_level = []
+    for node_id in new_ids:
+        if(node_id in recomputed):
+            node_ancestors = recomputed[node_id]
+            ancestors.append(node_ancestors if len(node_ancestors) > 0 else np.nan)
+            node_level.append(max(node_ancestors.keys()) if len(node_ancestors) > 0 else np.nan)
+        else:
+            ancestors.append(kept.at[node_id, 'ancestors'])
+            node_level.append(kept.at[node_id, 'node_level'])
+
+    return {'ancestors': pd.DataFrame({'id': new_ids, 'ancestors': ancestors, 'node_level': node_level}),
+        'changes': pd.DataFrame(changes, columns = ['id', 'change']),
+        'n_recomputed': len(recomputed)}
+
+# <<< ancestors_to_long(ancestors) >>>
+# @name:        ancestors_to_long
+# @title:       convert the ancestor dicts into a long (id, level, ancestor_id) table
+# @description: one row per ancestor per level, in the same order as the lists in the dicts. Ids are stored as categoricals, so each id string is only stored once.
+#               Terms w/o ancestors get a single row w/ level -1 and a missing ancestor_id, so they aren't lost.
+#               Also takes the `ancestors` column as read in from the old `_ancestors.tsv` files (i.e. the `repr` of the dict).
+# @input:       *ancestors*: dataframe w/ `id` and `ancestors` columns (output of `find_ancestors` / `find_ancestors_batch`)
+# @example:     ancestors_to_long(find_ancestors_batch(parent_df, save_terms = False))
+def ancestors_to_long(ancestors):
+    node_ids = []
+    levels = []
+    anc_ids = []
+    for node_id, node_ancestors in zip(ancestors.id, ancestors.ancestors):
+        if(isinstance(node_ancestors, str)):
+            node_ancestors = literal_eval(node_ancestors)
+        if((not isinstance(node_ancestors, dict)) or (len(node_ancestors) == 0)):
+            node_ids.append(node_id)
+            levels.append(-1)
+            anc_ids.append(None)
+            continue
+        for level, level_ids in node_ancestors.items():
+            node_ids.extend([node_id] * len(level_ids))
+            levels.extend([level] * len(level_ids))
+            anc_ids.extend(level_ids)
+
+    return pd.DataFrame({'id': pd.Categorical(node_ids, categories = pd.unique(pd.Series(node_ids))),
+        'level': np.array(levels, dtype = np.int16),
+        'ancestor_id': pd.Categorical(anc_ids)})
+
+# <<< ancestors_to_wide(long_ancestors) >>>
+# inverse of `ancestors_to_long`: back to one row per id w/ the {level: [ids]} dict + node_level (NA if no ancestors)
+def ancestors_to_wide(long_ancestors):
+    node_ids = long_ancestors.id.astype(object).values
+    levels = long_ancestors.level.values
+    anc_ids = long_ancestors.ancestor_id.astype(object).values
+
+    # rows for each id are contiguous; find where each id's block starts
+    starts = np.flatnonzero(np.r_[True, node_ids[1:] != node_ids[:-1]])
+    ends = np.r_[starts[1:], len(node_ids)]
+
+    ids = []
+    ancestors = []
+    node_level = []
+    for start, end in zip(starts, ends):
+        ids.append(node_ids[start])
+        if(levels[start] < 0):
+            ancestors.append(np.nan)
+            node_level.append(np.nan)
+            continue
+        node_ancestors = {}
+        for level, anc_id in zip(levels[start:end].tolist(), anc_ids[start:end]):
+            node_ancestors.setdefault(level, []).append(anc_id)
+        ancestors.append(node_ancestors)
+        node_level.append(max(node_ancestors))
+
+    return pd.DataFrame({'id': ids, 'ancestors': ancestors, 'node_level': node_level})
+
+# <<< save_ancestors(ancestors, ont_id, output_dir, file_name = None) >>>
+# @name:        save_ancestors
+# @title:       write the ancestors as a long-format Parquet file
+# @description: categorical columns are dictionary-encoded by Parquet, so each id is only stored once per file.
+#               Much smaller and faster to read back in than the stringified dicts in the `_ancestors.tsv` files.
+# @depends:     pyarrow
+#               *file_name*: w/i *output_dir*; defaults to the dated `<date>_<ont_id>_ancestors.parquet`
+# @output:      name of the file (w/o *output_dir*)
+# @example:     save_ancestors(ancestor, 'go', output_dir)
+def save_ancestors(ancestors, ont_id, output_dir = '', file_name = None):
+    if('ancestor_id' not in ancestors.columns):
+        ancestors = ancestors_to_long(ancestors)
+    if(file_name is None):
+        file_name = str(pd.Timestamp.today().strftime('%F')) + '_' + ont_id + '_ancestors.parquet'
+    ancestors.to_parquet(output_dir + file_name, index = False)
+    return file_name
+
+# <<< read_ancestors(file_name, wide = True) >>>
+# @name:        read_ancestors
+# @title:       read in an ancestors file
+# @description: reads either the long-format Parquet file or an old `_ancestors.tsv` file.
+#               *wide*: if True, returns the usual (id, ancestors, node_level) frame; otherwise the long (id, level, ancestor_id) table.
+# @example:     read_ancestors('dataout/2018-02-13_FBcv_ancestors.tsv')
+def read_ancestors(file_name, wide = True):
+    if(file_name.endswith('.parquet')):
+        long_ancestors = pd.read_parquet(file_name)
+        return ancestors_to_wide(long_ancestors) if wide else long_ancestors
+
+    ancestors = pd.read_csv(file_name, sep='\t', index_col=0)
+    if(wide):
+        ancestors['ancestors'] = parse_ancestors(ancestors.ancestors)
+        return ancestors[['id', 'ancestors', 'node_level']]
+    return ancestors_to_long(ancestors)
+
+# <<< parse_ancestors(ancestors) >>>
+# the *ancestors* column of a .tsv file back into dicts ({level: [ids]}); missing values are left alone
+def parse_ancestors(ancestors):
+    return [literal_eval(anc) if isinstance(anc, str) else anc for anc in ancestors]
+
 
 # QA-QC: spot check a few paths within fbcv ontology
 # fbcv = get_terms('fbcv') # call to API; requires ~ 7-10 min.
@@ -0,0 +1,221 @@
+# @name:        path_cache.py
+# @title:       On-disk cache of parsed neo4j path queries (`clean_neo4j.get_paths`)
+# @description: The structured path queries in `query_ngly1.py` take 15-86 sec. each, and get rerun over and over during development.
+#               This stores the parsed *nodes*/*edges* dataframes of each query as parquet files, indexed in a small SQLite table, so
+#               rerunning a query just reads the two files back in.
+#               Each entry is keyed by:
+#                   - the Cypher query, normalized (whitespace collapsed outside of quoted strings, trailing ';' dropped), and
+#                   - a fingerprint of the graph it was run against (endpoint + node/edge counts, see `clean_neo4j.graph_fingerprint`),
+#               so once the graph changes, its old entries never match again (and are dropped the first time the new fingerprint is seen).
+#               Once the cache is bigger than *max_bytes*, least-recently-used entries are dropped.
+# @depends:     pyarrow (for parquet)
+# @author:      Laura Hughes
+# @email:       lhughes@scripps.edu
+# @date:        18 October 2026
+
+# [0] Setup ---------------------------------------------------------------------------------
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+import pandas as pd
+
+# default location; override w/ the NTWK_PATH_CACHE environment variable or `configure(path = ...)`
+default_path = os.environ.get('NTWK_PATH_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'ntwk-explr', 'path_cache'))
+
+# quoted strings/names (left alone) vs. everything else
+cypher_tokens = re.compile(r"('(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`)")
+
+# <<< normalize_cypher(query) >>>
+# @name:        normalize_cypher
+# @title:       standardize a Cypher query so trivially different versions of it share a cache entry
+# @description: collapses runs of whitespace to a single space (except inside quoted strings), and drops leading/trailing whitespace + a trailing ';'.
+#               Case is left alone, since labels, properties and strings are all case-sensitive.
+# @example:     normalize_cypher("MATCH  (n)\n   RETURN n ;") --> 'MATCH (n) RETURN n'
+def normalize_cypher(query):
+    parts = cypher_tokens.split(query)
+    # split w/ a capturing group: odd entries are the quoted strings
+    parts = [part if i % 2 else re.sub(r'\s+', ' ', part) for i, part in enumerate(parts)]
+    return ''.join(parts).strip().rstrip(';').strip()
+
+# <<< cache_key(query, fingerprint) >>>
+# sha256 of the normalized query + graph fingerprint
+def cache_key(query, fingerprint):
+    return hashlib.sha256((normalize_cypher(query) + '\n' + fingerprint).encode('utf-8')).hexdigest()
+
+
+# <<< PathCache(path, max_bytes) >>>
+# @name:        PathCache
+# @title:       parquet store of parsed path queries
+# @input:       *path*: directory for the parquet files + the SQLite index (created if it doesn't exist)
+#               *max_bytes*: upper limit on the total size of the stored files; None for no limit
+# @example:     cache = PathCache('dataout/path_cache/')
+#               cache.put(query, fingerprint, neo4j.get_paths(query))
+#               cache.get(query, fingerprint)
+class PathCache:
+    def __init__(self, path = default_path, max_bytes = 1024 ** 3):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.counts = {'hits': 0, 'misses': 0, 'stored': 0, 'evicted': 0, 'invalidated': 0}
+        os.makedirs(path, exist_ok = True)
+
+        # shared by the threads in `clean_neo4j.run_queries`; one connection behind a lock
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(path, 'index.sqlite'), check_same_thread = False)
+        # every hit updates *accessed_at*; w/ the default journal, that's an fsync (~40 ms) per lookup
+        self.conn.execute('PRAGMA journal_mode = WAL')
+        self.conn.execute('PRAGMA synchronous = NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, query TEXT, endpoint TEXT, fingerprint TEXT, n_paths INTEGER, size INTEGER, created REAL, accessed_at REAL)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)')
+        self.conn.commit()
+        self._sweep()
+
+    def _files(self, key):
+        return os.path.join(self.path, key + '_nodes.parquet'), os.path.join(self.path, key + '_edges.parquet')
+
+    def _sweep(self):
+        # drops parquet files w/o an index entry + temporary files over an hour old (so not another process's `put` in progress),
+        # left behind by a run that crashed mid-`put`
+        keys = set(row[0] for row in self.conn.execute('SELECT key FROM entries'))
+        for file_name in os.listdir(self.path):
+            full_name = os.path.join(self.path, file_name)
+            try:
+                orphan = file_name.endswith('.parquet') and (file_name.rsplit('_', 1)[0] not in keys)
+                stale_tmp = file_name.endswith('.tmp') and (time.time() - os.path.getmtime(full_name) > 3600)
+                if(orphan or stale_tmp):
+                    os.remove(full_name)
+            except OSError:
+                pass
+
+    def _remove(self, keys):
+        # call w/ the lock held
+        for key in keys:
+            for file_name in self._files(key):
+                if(os.path.exists(file_name)):
+                    os.remove(file_name)
+        self.conn.executemany('DELETE FROM entries WHERE key = ?', [(key,) for key in keys])
+
+    # <<< get(query, fingerprint) >>>
+    # dict of *nodes*, *edges* if the query has been cached for this fingerprint; otherwise None
+    def get(self, query, fingerprint):
+        key = cache_key(query, fingerprint)
+        with self.lock:
+            row = self.conn.execute('SELECT n_paths FROM entries WHERE key = ?', (key,)).fetchone()
+            if(row is None):
+                self.counts['misses'] += 1
+                return None
+            node_file, edge_file = self._files(key)
+            try:
+                data = {'nodes': pd.read_parquet(node_file), 'edges': pd.read_parquet(edge_file)}
+            except (OSError, ValueError):
+                # files missing/corrupted; treat as a miss
+                self._remove([key])
+                self.conn.commit()
+                self.counts['misses'] += 1
+                return None
+            self.conn.execute('UPDATE entries SET accessed_at = ? WHERE key = ?', (time.time(), key))
+            self.conn.commit()
+            self.counts['hits'] += 1
+        return data
+
+    # <<< put(query, fingerprint, data, endpoint = '') >>>
+    # stores the *nodes*/*edges* of a query; entries for the same *endpoint* w/ an older fingerprint are dropped
+    # the files are written to temporary names (one per thread), then moved into place w/ the index entry, under the lock,
+    # so two threads storing the same query never write to the same file, and a failed write leaves nothing behind
+    def put(self, query, fingerprint, data, endpoint = ''):
+        key = cache_key(query, fingerprint)
+        files = self._files(key)
+        tmp_files = [file_name + '.' + str(os.getpid()) + '-' + str(threading.get_ident()) + '.tmp' for file_name in files]
+        try:
+            data['nodes'].to_parquet(tmp_files[0], index = False)
+            data['edges'].to_parquet(tmp_files[1], index = False)
+            size = os.path.getsize(tmp_files[0]) + os.path.getsize(tmp_files[1])
+        except BaseException:
+            for tmp_file in tmp_files:
+                if(os.path.exists(tmp_file)):
+                    os.remove(tmp_file)
+            raise
+        n_paths = int(data['nodes'].path_num.nunique()) if len(data['nodes']) > 0 else 0
+
+        now = time.time()
+        with self.lock:
+            for tmp_file, file_name in zip(tmp_files, files):
+                os.replace(tmp_file, file_name)
+            self.invalidate(endpoint, fingerprint, locked = True)
+            self.conn.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, normalize_cypher(query), endpoint, fingerprint, n_paths, size, now, now))
+            self.conn.commit()
+            self.counts['stored'] += 1
+        if(self.max_bytes is not None):
+            self.evict()
+
+    # <<< invalidate(endpoint, fingerprint) >>>
+    # drops every entry for *endpoint* that wasn't made w/ the current *fingerprint* of its graph
+    def invalidate(self, endpoint, fingerprint, locked = False):
+        if(not locked):
+            with self.lock:
+                return self.invalidate(endpoint, fingerprint, locked = True)
+        stale = [row[0] for row in self.conn.execute('SELECT key FROM entries WHERE endpoint = ? AND fingerprint != ?', (endpoint, fingerprint))]
+        self._remove(stale)
+        self.conn.commit()
+        self.counts['invalidated'] += len(stale)
+        return len(stale)
+
+    # <<< evict() >>>
+    # drops least-recently-used entries until the cache is under *max_bytes*
+    def evict(self):
+        with self.lock:
+            total = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+            drop = []
+            if((self.max_bytes is not None) and (total > self.max_bytes)):
+                for key, size in self.conn.execute('SELECT key, size FROM entries ORDER BY accessed_at'):
+                    if(total <= self.max_bytes):
+                        break
+                    drop.append(key)
+                    total -= size
+            self._remove(drop)
+            self.conn.commit()
+            self.counts['evicted'] += len(drop)
+        return len(drop)
+
+    def clear(self):
+        with self.lock:
+            self._remove([row[0] for row in self.conn.execute('SELECT key FROM entries')])
+            self.conn.commit()
+
+    # <<< stats() >>>
+    # counters for this session, plus the number of entries and total size on disk
+    def stats(self):
+        with self.lock:
+            entries, size = self.conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+            counts = dict(self.counts)
+        lookups = counts['hits'] + counts['misses']
+        counts.update({'entries': entries, 'bytes': size, 'hit_rate': counts['hits'] / lookups if lookups else 0.0})
+        return counts
+
+
+# [1] Module-level cache, used by `clean_neo4j.get_paths` ---------------------------------------------
+_cache = None
+_enabled = True
+
+# <<< configure(enabled = True, **kwargs) >>>
+# @description: (re)sets the shared cache. kwargs are passed to `PathCache`.
+# @example:     configure(max_bytes = 5 * 1024 ** 3)
+#               configure(enabled = False) # always run the query
+def configure(enabled = True, **kwargs):
+    global _cache, _enabled
+    _enabled = enabled
+    _cache = PathCache(**kwargs) if enabled else None
+    return _cache
+
+def get_cache():
+    global _cache
+    if(_enabled & (_cache is None)):
+        _cache = PathCache()
+    return _cache
+
+def stats():
+    cache = get_cache()
+    return cache.stats() if cache is not None else {}
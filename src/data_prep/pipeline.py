@@ -0,0 +1,319 @@
+# @name:        pipeline.py
+# @title:       Runs the whole data prep pipeline as a graph of stages
+# @description: The stages from DATA_PREP_README (nodes, ontology terms/parents/ancestors, gene annotations, path queries, merge),
+#               declared w/ the stages they depend on:
+#
+#                   nodes --> gene_annots
+#                   ont-<ont_id> --> ont_dict       (one stage per ontology: ont-go, ont-hp, ...)
+#                   nodes + ont_dict + gene_annots --> merge
+#                   paths --> metapaths
+#
+#               `run` works out which stages are needed for the *targets*, then runs every stage whose inputs are ready in parallel (threads;
+#               the stages spend most of their time waiting on neo4j/OLS/mygene.info).
+#               Each stage's output is cached (pickled) in *cache_dir*, next to a key: a hash of the settings it was made with
+#               and of the outputs of the stages it depends on. On the next run a cached stage is just read back in, unless it's *force*d,
+#               one of the stages it depends on was rerun, or its key has changed since: the settings it uses changed (e.g. the queries
+#               for `paths`, the ontology ids for `ont_dict`, the graph for `nodes`), or something upstream was rebuilt in an earlier run.
+#               A stage that fails is reported, and the stages downstream of it are skipped; everything else still runs.
+#               Importing this file (or any of the stage modules) doesn't run anything.
+# @depends:     clean_neo4j.py, ont_dict.py, annot_GENE.py, query_ngly1.py
+# @author:      Laura Hughes
+# @email:       lhughes@scripps.edu
+# @date:        18 October 2026
+
+# [0] Setup ---------------------------------------------------------------------------------
+import os
+import sys
+import json
+import time
+import hashlib
+import warnings
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# -- command line prompt settings --
+output_dir = '../../dataout/' # ontology files, annotations, merged nodes
+data_dir = '../data/' # path queries, for the visualizations
+
+
+# [1] Stages ---------------------------------------------------------------------------------
+# each stage is a function of (inputs, config): *inputs* is a dict of {stage name: output} for the stages it depends on.
+# The stage modules are imported inside the functions so importing `pipeline` stays instant.
+# Each stage also has a `uses` function, picking out the parts of *config* its output depends on; the cache is keyed on them.
+
+def _nodes(inputs, config):
+    import clean_neo4j as neo4j
+    import ont_dict
+    # Pull unique nodes from Nuria's graph, w/ the OLS ont_id for each
+    return ont_dict.get_ontid(neo4j.get_nodes())
+
+def _ont(ont_type, ont_id):
+    def build(inputs, config):
+        import ont_dict
+        return ont_dict.build_ont(ont_type, ont_id, config['output_dir'], config['backend'], config['ont_files'].get(ont_id))
+    return build
+
+def _ont_dict(inputs, config):
+    import ont_dict
+    built = [inputs[ont_stage(ont_id)] for ont_type, type_ids in config['ont_ids'].items() for ont_id in type_ids]
+    return ont_dict.combine_onts(built, config['output_dir'], merge=True)
+
+def _gene_annots(inputs, config):
+    import annot_GENE as gene
+    return gene.annotate_genes(inputs['nodes'], config['output_dir'])
+
+def _paths(inputs, config):
+    import query_ngly1 as ngly1
+    return ngly1.run_queries(config['queries'], config['data_dir'])
+
+def _metapaths(inputs, config):
+    import query_ngly1 as ngly1
+    return ngly1.find_metapaths(inputs['paths'], config['data_dir'])
+
+def _merge(inputs, config):
+    import ont_dict
+    merged = ont_dict.merge_nodes(inputs['nodes'], inputs['ont_dict'], inputs['gene_annots']['annots'])
+    merged['nodes'].to_csv(config['output_dir'] + str(pd.Timestamp.today().strftime('%F')) + '_nodes_merged.tsv', sep='\t', index=False)
+    return merged
+
+def ont_stage(ont_id):
+    return 'ont-' + ont_id
+
+def _uses_nothing(config):
+    return {}
+
+def _uses_graph(config):
+    import clean_neo4j as neo4j
+    # node + edge counts of the live graph, so an export is redone once the graph changes
+    return {'graph': neo4j.graph_fingerprint()}
+
+def _uses_queries(config):
+    return {'queries': config['queries']}
+
+def _uses_graph_queries(config):
+    return dict(_uses_graph(config), queries = config['queries'])
+
+def _uses_ont(ont_type, ont_id):
+    def uses(config):
+        return {'ont_type': ont_type, 'ont_id': ont_id, 'output_dir': config['output_dir'], 'backend': config['backend'],
+            'ont_file': config['ont_files'].get(ont_id)}
+    return uses
+
+def _uses_ont_ids(config):
+    return {'ont_ids': config['ont_ids'], 'output_dir': config['output_dir']}
+
+def _uses_output_dir(config):
+    return {'output_dir': config['output_dir']}
+
+# <<< build_stages(ont_ids) >>>
+# @name:        build_stages
+# @title:       the stage graph: {stage name: {'depends': [stage names], 'run': function, 'uses': function}}
+# @input:       *ont_ids*: {node_type: [OLS ids]}, as in `ont_dict.ont_ids`; each ontology gets its own stage
+# @example:     build_stages({'GENE': ['go']})
+def build_stages(ont_ids):
+    stages = {'nodes': {'depends': [], 'run': _nodes, 'uses': _uses_graph}}
+
+    for ont_type, type_ids in ont_ids.items():
+        for ont_id in type_ids:
+            stages[ont_stage(ont_id)] = {'depends': [], 'run': _ont(ont_type, ont_id), 'uses': _uses_ont(ont_type, ont_id)}
+    stages['ont_dict'] = {'depends': [ont_stage(ont_id) for type_ids in ont_ids.values() for ont_id in type_ids], 'run': _ont_dict,
+        'uses': _uses_ont_ids}
+
+    stages['gene_annots'] = {'depends': ['nodes'], 'run': _gene_annots, 'uses': _uses_output_dir}
+    stages['paths'] = {'depends': [], 'run': _paths, 'uses': _uses_graph_queries}
+    stages['metapaths'] = {'depends': ['paths'], 'run': _metapaths, 'uses': _uses_queries}
+    stages['merge'] = {'depends': ['nodes', 'ont_dict', 'gene_annots'], 'run': _merge, 'uses': _uses_output_dir}
+    return stages
+
+
+# [2] Scheduling ---------------------------------------------------------------------------------
+# <<< stage_order(stages, targets = None) >>>
+# @name:        stage_order
+# @title:       the stages needed to make *targets*, each listed after everything it depends on
+# @description: raises a ValueError on an unknown stage or a cycle. *targets* = None means every stage.
+# @example:     stage_order(build_stages(ont_ids), ['metapaths']) --> ['paths', 'metapaths']
+def stage_order(stages, targets = None):
+    if(targets is None):
+        targets = list(stages)
+
+    order = []
+    state = {} # 1 = visiting; 2 = done
+
+    def visit(name, chain):
+        if(name not in stages):
+            raise ValueError('unknown stage ' + name + ((' (needed by ' + chain[-1] + ')') if chain else ''))
+        if(state.get(name) == 2):
+            return
+        if(state.get(name) == 1):
+            raise ValueError('cycle in stages: ' + ' --> '.join(chain + [name]))
+        state[name] = 1
+        for dep in stages[name]['depends']:
+            visit(dep, chain + [name])
+        state[name] = 2
+        order.append(name)
+
+    for name in targets:
+        visit(name, [])
+    return order
+
+def cache_file(name, cache_dir):
+    return os.path.join(cache_dir, name + '.pkl')
+
+def key_file(name, cache_dir):
+    return os.path.join(cache_dir, name + '.key')
+
+# <<< stage_key(stage, config, upstream = {}) >>>
+# hash of the settings a stage uses (its `uses` function; none for a stage w/o one) + *upstream*, the {stage name: output hash}
+# of the stages it depends on; so rebuilding any stage changes the key of everything downstream of it
+# @example:     stage_key(stages['metapaths'], config, {'paths': '81c0...'}) --> '3f9a...'
+def stage_key(stage, config, upstream = {}):
+    uses = stage.get('uses', _uses_nothing)(config)
+    return hashlib.sha256(json.dumps({'uses': uses, 'upstream': upstream}, sort_keys = True, default = str).encode('utf-8')).hexdigest()
+
+def file_hash(file_name):
+    sha = hashlib.sha256()
+    with open(file_name, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+# the {'key', 'output'} hashes saved next to a cached stage; None if it isn't cached (or was cached before the keys were)
+def read_key(name, cache_dir):
+    if(not (os.path.exists(cache_file(name, cache_dir)) and os.path.exists(key_file(name, cache_dir)))):
+        return None
+    with open(key_file(name, cache_dir)) as f:
+        try:
+            saved = json.load(f)
+        except ValueError:
+            return None
+    return saved if isinstance(saved, dict) and ('key' in saved) and ('output' in saved) else None
+
+# <<< load_stage(name, cache_dir = output_dir + 'stages/') >>>
+# reads back in a stage's cached output, w/o rerunning anything
+# @example:     paths = load_stage('paths')
+def load_stage(name, cache_dir = output_dir + 'stages/'):
+    return pd.read_pickle(cache_file(name, cache_dir))
+
+# saves *output* + its *key*; returns the hash of the pickled output (what the stages downstream are keyed on)
+def save_stage(name, output, cache_dir, key = ''):
+    # write to a temporary file first, so an interrupted run never leaves a half-written cache behind
+    # the old key is removed first, so a crash in between leaves a pickle w/o a key (--> rerun) rather than a new pickle w/ an old key
+    if(os.path.exists(key_file(name, cache_dir))):
+        os.remove(key_file(name, cache_dir))
+    tmp_file = cache_file(name, cache_dir) + '.tmp'
+    pd.to_pickle(output, tmp_file)
+    output_hash = file_hash(tmp_file)
+    os.replace(tmp_file, cache_file(name, cache_dir))
+    with open(key_file(name, cache_dir), 'w') as f:
+        json.dump({'key': key, 'output': output_hash}, f)
+    return output_hash
+
+def _run_stage(stage, inputs, config):
+    t0 = time.time()
+    output = stage['run'](inputs, config)
+    return output, time.time() - t0
+
+# <<< run(targets = None, output_dir = output_dir, data_dir = data_dir, cache_dir = None, n_workers = 4, force = [], use_cache = True, ...) >>>
+# @name:        run
+# @title:       run the stages needed for *targets*, in parallel where they don't depend on each other
+# @input:       *targets*: list of stage names (default: all of them)
+#               *cache_dir*: where the stage outputs are cached (default: `stages/` w/i *output_dir*)
+#               *n_workers*: number of stages that can run at once
+#               *force*: stages to rerun even if they're cached (everything downstream of them is rerun too)
+#               a cached stage is also rerun when the settings it uses (see `build_stages`), or the output of a stage upstream of it,
+#               differ from the ones it was cached with
+#               *use_cache*: if False, reruns every stage
+#               *ont_ids*, *queries*: ontologies to build ({node_type: [OLS ids]}) and path queries to run ({name: cypher});
+#               default to `ont_dict.ont_ids` and `query_ngly1.queries`
+#               *backend*, *ont_files*: passed on to `ont_dict.build_ont`
+# @output:      dict of {stage name: output} for the *targets*
+# @example:     out = run(['metapaths'])
+#               out = run(['merge'], force = ['ont-hp'], n_workers = 8)
+def run(targets = None, output_dir = output_dir, data_dir = data_dir, cache_dir = None, n_workers = 4, force = [], use_cache = True,
+    ont_ids = None, queries = None, backend = 'ols', ont_files = {}, stages = None):
+    if(ont_ids is None):
+        import ont_dict
+        ont_ids = ont_dict.ont_ids
+    if(queries is None):
+        import query_ngly1 as ngly1
+        queries = ngly1.queries
+    if(stages is None):
+        stages = build_stages(ont_ids)
+    if(cache_dir is None):
+        cache_dir = output_dir + 'stages/'
+    os.makedirs(cache_dir, exist_ok = True)
+
+    config = {'output_dir': output_dir, 'data_dir': data_dir, 'ont_ids': ont_ids, 'queries': queries, 'backend': backend, 'ont_files': ont_files}
+
+    order = stage_order(stages, targets)
+    keys = {}
+    output_hashes = {}
+    pending = list(order)
+    running = {}
+    outputs = {}
+    status = {}
+    timing = {}
+    errors = {}
+
+    with ThreadPoolExecutor(max_workers = n_workers) as executor:
+        while(pending or running):
+            # start everything whose inputs are ready
+            for name in list(pending):
+                depends = stages[name]['depends']
+                if(any(status.get(dep) in ('failed', 'skipped') for dep in depends)):
+                    pending.remove(name)
+                    status[name] = 'skipped'
+                elif(all(status.get(dep) in ('done', 'cached') for dep in depends)):
+                    pending.remove(name)
+                    try:
+                        keys[name] = stage_key(stages[name], config, {dep: output_hashes[dep] for dep in depends})
+                    except Exception as err:
+                        status[name] = 'failed'
+                        errors[name] = err
+                        continue
+                    reran_upstream = any(status[dep] == 'done' for dep in depends)
+                    saved = read_key(name, cache_dir)
+                    if(use_cache and (name not in force) and (not reran_upstream) and (saved is not None) and (saved['key'] == keys[name])):
+                        outputs[name] = load_stage(name, cache_dir)
+                        output_hashes[name] = saved['output']
+                        status[name] = 'cached'
+                    else:
+                        print('\n--- running ' + name + ' ---')
+                        running[executor.submit(_run_stage, stages[name], {dep: outputs[dep] for dep in depends}, config)] = name
+
+            if(not running):
+                continue
+
+            done, not_done = wait(running, return_when = FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    outputs[name], timing[name] = future.result()
+                except Exception as err:
+                    status[name] = 'failed'
+                    errors[name] = err
+                else:
+                    output_hashes[name] = save_stage(name, outputs[name], cache_dir, keys[name])
+                    status[name] = 'done'
+
+    print('\n\n--- stages ---')
+    for name in order:
+        line = name + ': ' + status[name]
+        if(name in timing):
+            line += ' (' + str(round(timing[name], ndigits=2)) + 'sec)'
+        if(name in errors):
+            line += ' (' + repr(errors[name]) + ')'
+        print(line)
+
+    if(len(errors) > 0):
+        warnings.warn(str(len(errors)) + ' stages failed: ' + ', '.join(errors))
+
+    if(targets is None):
+        targets = order
+    return {name: outputs[name] for name in targets if name in outputs}
+
+
+# [3] Run ---------------------------------------------------------------------------------
+# e.g. `python pipeline.py metapaths merge`; no arguments runs everything
+if __name__ == '__main__':
+    run(sys.argv[1:] or None)
@@ -6,11 +6,15 @@
 # @date:        13 February 2018
 
 # [0] Setup ------------------------------------------------------------------------
-import src.data_prep.clean_neo4j as neo4j  # path within Atom notebook
 import pandas as pd
-import time
 
-output_dir = 'src/data/'
+# -- Atom notebook path settings --
+# import src.data_prep.clean_neo4j as neo4j  # path within Atom notebook
+# output_dir = 'src/data/'
+
+# -- command line prompt settings --
+import clean_neo4j as neo4j # interface to query network
+output_dir = '../data/' # path from command line prompt
 
 # [1] set up the queries --------------------------------------------------------------
 queries = {
@@ -32,9 +36,7 @@ queries = {
     "MATCH (source { id: 'HP:0000522', preflabel: 'Alacrima'}), path=(source:DISO)-[*..3]-(target:PHYS) WITH source, target, path, [r IN relationships(path) | type(r)] AS types RETURN path"}
 
 # [2] run the queries --------------------------------------------------------------
-data = {}
-
-# sample times
+# sample times (one after another, before the queries ran concurrently)
 # querying NGLY1-ENGASE_structured
 # total time: 1.52sec
 #
@@ -53,24 +55,44 @@ data = {}
 # querying alacrima:pathway_3
 # total time: 85.91sec
 
-for key, query in queries.items():
-    print("\nquerying " + key)
-    t1 = time.time()
-    data[key] = neo4j.get_paths(query)
-    t2 = time.time()
-    print('total time: ' + str(round(t2 - t1, ndigits=2)) + "sec")
+# <<< run_queries(queries, output_dir = output_dir, n_workers = 6) >>>
+# runs all the *queries* ({name: cypher}) at once (`clean_neo4j.run_queries`, up to *n_workers* at a time); prints the fetch/parse/metapath times per query
+# and counts each query's metapaths in the same worker, right after its paths
+# saves the paths to `path-queries.json` (+ the timing report to `path-queries-timing.tsv`) and returns {'data': {name: {'nodes', 'edges'}}, 'metapaths': {name: counts}}
+def run_queries(queries, output_dir = output_dir, n_workers = 6):
+    batch = neo4j.run_queries(queries, n_workers = n_workers, metapaths = True)
 
-neo4j.save_paths(data, 'path-queries.json', direc = output_dir)
+    timing = batch['timing']
+    print(timing.round(2).to_string(index = False))
+    print('total time: ' + str(round(batch['wall_time'], ndigits=2)) + "sec (vs. " + str(round(timing.total.sum(), ndigits=2)) + "sec one after another)")
 
+    neo4j.save_paths(batch['data'], 'path-queries.json', direc = output_dir)
+    timing.to_csv(output_dir + 'path-queries-timing.tsv', sep='\t', index=False)
+    return {'data': batch['data'], 'metapaths': batch['metapaths']}
 
 
 # [3] Pull out metapaths for all the queries --------------------------------------------------------------
-metapaths = pd.DataFrame()
-
-for key, nodes in data.items():
-    metapath = neo4j.count_metapaths(nodes)
-    metapath['query'] = key
-    metapaths = pd.concat([metapath, metapaths], ignore_index=True)
-
-# export
-metapaths.to_json(output_dir + 'test-metapaths.json')
+# <<< find_metapaths(paths, output_dir = output_dir) >>>
+# metapath counts for every query in *paths* (output of `run_queries`), stacked together; saved to `test-metapaths.json`
+# uses the counts `run_queries` already made; only a query w/o them is counted here
+def find_metapaths(paths, output_dir = output_dir):
+    metapaths = pd.DataFrame()
+
+    for key, nodes in paths['data'].items():
+        metapath = paths['metapaths'].get(key)
+        if(metapath is None):
+            metapath = neo4j.count_metapaths(nodes)
+        metapath = metapath.copy()
+        metapath['query'] = key
+        metapaths = pd.concat([metapath, metapaths], ignore_index=True)
+
+    # export
+    metapaths.to_json(output_dir + 'test-metapaths.json')
+    return metapaths
+
+
+# [4] Run --------------------------------------------------------------
+# Only when called as a script, so importing the queries doesn't run them. See `pipeline.py` to run everything.
+if __name__ == '__main__':
+    paths = run_queries(queries)
+    metapaths = find_metapaths(paths)